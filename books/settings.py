@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,17 +34,26 @@ ALLOWED_HOSTS = []
 
 
 MIDDLEWARE = [
+    # Первым, чтобы в замеры попадали и запросы сессии и пользователя (store/profiling.py).
+    'store.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Чтение с реплик для GET (store/db/routers.py), после аутентификации.
+    'store.db.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
-    'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
 ]
 
+# debug-toolbar рендерит панель на каждый запрос и показывает SQL, только для локальной разработки.
+if DEBUG:
+    MIDDLEWARE += [
+        "debug_toolbar.middleware.DebugToolbarMiddleware",
+        'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
+    ]
+
 ROOT_URLCONF = 'books.urls'
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -51,6 +62,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     "debug_toolbar",
     'social_django',
@@ -92,10 +104,60 @@ DATABASES = {
         'USER': 'books_user',
         'PASSWORD': '12345',
         'HOST': '127.0.0.1',
-        'PORT': '5432'
+        'PORT': '5432',
+        # Соединение переиспользуется между запросами до CONN_MAX_AGE секунд вместо нового на каждый запрос,
+        # перед повторным использованием проверяется, что оно живо (CONN_HEALTH_CHECKS).
+        'CONN_MAX_AGE': int(os.environ.get('BOOKS_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
 }
 }
 
+# BOOKS_DB_POOL=1 - пул соединений в процессе (store/db/pool.py), общий для потоков WSGI и ASGI.
+# Соединение Django закрывается в конце запроса (CONN_MAX_AGE = 0) и возвращается в пул.
+# Размер пула и ожидание свободного соединения - BOOKS_DB_POOL_SIZE и BOOKS_DB_POOL_TIMEOUT.
+# Метрики соединений и пула: /db-stats/ (только персонал).
+if os.environ.get('BOOKS_DB_POOL') == '1':
+    DATABASES['default'].update({
+        'ENGINE': 'store.db.backends.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'max_size': int(os.environ.get('BOOKS_DB_POOL_SIZE', 10)),
+                'timeout': float(os.environ.get('BOOKS_DB_POOL_TIMEOUT', 10)),
+            },
+        },
+    })
+
+# BOOKS_DB=sqlite - локальная SQLite вместо PostgreSQL, например для тестов и бенчмарков без сервера БД.
+# Полнотекстовый поиск и LATERAL выборка читателей в SQLite заменяются запасными вариантами.
+if os.environ.get('BOOKS_DB') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
+# Реплики PostgreSQL только для чтения: BOOKS_DB_REPLICAS=host1,host2:5433 - алиасы replica1, replica2
+# с настройками основной БД. Тестовая БД для реплик не создается (TEST MIRROR), но тесты запускаются без
+# BOOKS_DB_REPLICAS: данные транзакции TestCase не видны отдельному соединению реплики (store/tests/test_replicas.py).
+REPLICA_DATABASES = []
+for number, address in enumerate(filter(None, os.environ.get('BOOKS_DB_REPLICAS', '').split(',')), 1):
+    host, _, port = address.partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default'].get('PORT', ''),
+                        'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+# Маршрутизация чтения (store/db/routers.py): модели этих приложений читаются с реплик в GET запросах.
+# Пользователь после изменяющего запроса REPLICA_STICKY_SECONDS секунд читает с основной БД, отметка - подписанная
+# cookie REPLICA_PIN_COOKIE, ее видят все процессы. Реплика, отстающая больше REPLICA_MAX_LAG секунд, не используется,
+# отставание проверяется не чаще REPLICA_LAG_CHECK_INTERVAL секунд.
+DATABASE_ROUTERS = ['store.db.routers.ReplicaRouter']
+REPLICA_APP_LABELS = ['store']
+REPLICA_STICKY_SECONDS = 10
+REPLICA_PIN_COOKIE = 'replica_pin'
+REPLICA_MAX_LAG = 5
+REPLICA_LAG_CHECK_INTERVAL = 1
+
 
 # Аутентификация через Git аккаунт.
 AUTHENTICATION_BACKENDS = (
@@ -145,13 +207,16 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-# Выдача данных по дефолту в формате JSON
+# Выдача данных по дефолту в формате JSON.
+# FastJSONRenderer и FastJSONParser (store/renderers.py) - orjson, если он установлен, иначе стандартные
+# JSONRenderer и JSONParser. Вернуть стандартные: rest_framework.renderers.JSONRenderer и
+# rest_framework.parsers.JSONParser.
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'store.renderers.FastJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'store.renderers.FastJSONParser',
     )
 }
 
@@ -163,4 +228,115 @@ SOCIAL_AUTH_GITHUB_SECRET = '3245e3bb38e24ad66d2de2d271e733aec321e96c'
 
 # REST_FRAMEWORK = {
 #     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
-# }
\ No newline at end of file
+# }
+
+# Сколько первых читателей книги отдавать в поле readers списка и карточки книги.
+# Полный список доступен постранично через /book/{id}/readers/.
+READERS_PREVIEW_SIZE = 10
+
+# Максимальное количество элементов в одном запросе POST /book_relation/bulk/.
+RELATIONS_BULK_MAX_ITEMS = 1000
+
+# Массовые операции с книгами (POST /book/ со списком, PATCH и DELETE /book/bulk/):
+# максимум книг в запросе и размер пачки bulk_create/bulk_update.
+BOOKS_BULK_MAX_ITEMS = 10000
+BOOKS_BULK_BATCH_SIZE = 1000
+
+
+# Бюджет SQL запросов endpoint-ов API: "<METHOD> <имя url>" -> максимум запросов и суммарного времени SQL.
+# Количество запросов проверяется тестами (store/tests/test_query_budget.py), оба предела - на каждом запросе,
+# если подключен store.query_budget.QueryBudgetMiddleware, с записью нарушений в лог 'store.query_budget'.
+# Учитываются и запросы сессии и пользователя (2 запроса для авторизованного).
+QUERY_BUDGETS = {
+    'GET book-list': {'max_queries': 4, 'max_time_ms': 200},
+    'POST book-list': {'max_queries': 4, 'max_time_ms': 500},
+    'GET book-detail': {'max_queries': 4, 'max_time_ms': 100},
+    'PUT book-detail': {'max_queries': 5, 'max_time_ms': 200},
+    'PATCH book-detail': {'max_queries': 5, 'max_time_ms': 200},
+    'DELETE book-detail': {'max_queries': 5, 'max_time_ms': 200},
+    'PATCH book-bulk': {'max_queries': 5, 'max_time_ms': 2000},
+    'DELETE book-bulk': {'max_queries': 6, 'max_time_ms': 2000},
+    'GET book-readers': {'max_queries': 4, 'max_time_ms': 100},
+    'GET book-export': {'max_queries': 3, 'max_time_ms': 5000},
+    'GET book-cache-stats': {'max_queries': 2, 'max_time_ms': 50},
+    # Сессия, пользователь и первые книги лидерборда с временем перестроения одним запросом
+    # (у пустого лидерборда время перестроения - отдельным).
+    'GET book-leaderboard': {'max_queries': 4, 'max_time_ms': 200},
+    # Соседи с книгами одним запросом, если соседей нет - еще проверка существования книги.
+    'GET book-similar': {'max_queries': 4, 'max_time_ms': 100},
+    # Все фасеты одним сгруппированным запросом.
+    'GET book-facets': {'max_queries': 3, 'max_time_ms': 200},
+    # Асинхронные list и detail (store/async_views.py) не загружают пользователя и сессию.
+    'GET async-book-list': {'max_queries': 2, 'max_time_ms': 200},
+    'GET async-book-detail': {'max_queries': 2, 'max_time_ms': 100},
+    # Изменение отношений обновляет лидерборды книг (store/leaderboards.py): до 6 запросов, если изменились
+    # и оценка, и лайк.
+    'PUT userbookrelation-detail': {'max_queries': 13, 'max_time_ms': 200},
+    # PATCH в PostgreSQL - один запрос upsert (store/logic_relations.py), в остальных БД до 5 запросов через ORM
+    # (с INSERT лайков по часам для trending, если менялся лайк).
+    'PATCH userbookrelation-detail': {'max_queries': 13, 'max_time_ms': 200},
+    # Если менялись лайки - еще INSERT лайков по часам для trending.
+    'POST userbookrelation-bulk': {'max_queries': 13, 'max_time_ms': 2000},
+    'GET userbookrelation-library': {'max_queries': 3, 'max_time_ms': 100},
+}
+
+
+# Профилирование запросов (store/profiling.py): суммы по endpoint-ам копятся в памяти процесса и добавляются
+# в таблицу EndpointProfile раз в PROFILING_FLUSH_REQUESTS запросов или PROFILING_FLUSH_SECONDS секунд.
+# Доля PROFILING_SAMPLE_RATE запросов выполняется под cProfile, профили запросов медленнее PROFILING_SLOW_MS
+# сохраняются в PROFILING_DIR, не больше PROFILING_MAX_FILES файлов.
+PROFILING_FLUSH_REQUESTS = 100
+PROFILING_FLUSH_SECONDS = 10
+# В тестах суммы сбрасываются только при чтении (get_stats): запись пачки посреди теста попадала бы
+# в подсчет запросов assertNumQueries.
+if sys.argv[1:2] == ['test']:
+    PROFILING_FLUSH_REQUESTS = PROFILING_FLUSH_SECONDS = float('inf')
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_SLOW_MS = 500
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_FILES = 100
+
+
+# Кеш. Алиас 'books' - кеш ответов API книг для анонимных пользователей (store/cache.py).
+# Бэкенд можно заменить на общий для всех процессов, например django.core.cache.backends.redis.RedisCache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'books': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'books',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+BOOKS_CACHE_ALIAS = 'books'
+
+# Лидерборды /book/leaderboards/{top-rated,most-liked,trending}/ (store/leaderboards.py): первые
+# LEADERBOARD_SIZE книг в таблице LeaderboardEntry, их обновляет запись отношений и перестраивает refresh_leaderboards.
+# top-rated - только книги с не меньше чем LEADERBOARD_MIN_VOTES оценками, trending - лайки
+# за последние LEADERBOARD_TRENDING_HOURS часов.
+LEADERBOARD_SIZE = 100
+LEADERBOARD_MIN_VOTES = 3
+LEADERBOARD_TRENDING_HOURS = 24
+
+# Похожие книги /book/{id}/similar/ (store/recommendations.py), строит python manage.py build_recommendations.
+# RECOMMENDATIONS_TOP_K соседей на книгу. Вес отношения: лайк, закладка и каждый балл оценки выше 3.
+# Пользователи больше чем с RECOMMENDATIONS_MAX_USER_BOOKS книгами не учитываются.
+# Память построения: матрица отношений целиком, пик около 50 байт на отношение (NumPy), поэтому отношений с весом
+# не больше RECOMMENDATIONS_MAX_RELATIONS (20 млн - около 1 ГБ), иначе построение не начинается. Отношения
+# читаются пачками по RECOMMENDATIONS_READ_CHUNK, блок сходства - не больше RECOMMENDATIONS_MAX_BLOCK_PAIRS пар
+# (около 12 байт на пару), соседи пишутся по RECOMMENDATIONS_BLOCK_BOOKS книг.
+RECOMMENDATIONS_TOP_K = 20
+RECOMMENDATIONS_WEIGHTS = {'like': 1.0, 'in_bookmarks': 0.5, 'rate': 0.5}
+RECOMMENDATIONS_MAX_USER_BOOKS = 1000
+RECOMMENDATIONS_READ_CHUNK = 100000
+RECOMMENDATIONS_MAX_BLOCK_PAIRS = 10000000
+RECOMMENDATIONS_BLOCK_BOOKS = 1000
+RECOMMENDATIONS_MAX_RELATIONS = 20000000
+
+# Фасеты списка книг /book/facets/ (store/facets.py): количество книг по диапазонам цен и первые авторы.
+# BOOKS_PRICE_FACET_BUCKETS - границы диапазонов по возрастанию: до 100, от 100 до 250, ..., от 1000.
+# BOOKS_AUTHOR_FACET_SIZE - сколько авторов с наибольшим количеством книг возвращать.
+BOOKS_PRICE_FACET_BUCKETS = [100, 250, 500, 1000]
+BOOKS_AUTHOR_FACET_SIZE = 10
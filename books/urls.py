@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
 from rest_framework.routers import SimpleRouter
-from store.views import BookViewSet, auth, UserBooksRelationView
+from store import async_views
+from store.views import BookViewSet, auth, UserBooksRelationView, ProfilingStatsView, ConnectionStatsView
 
 # Создаем экземпляр класса SimpleRouter.
 router = SimpleRouter()
@@ -15,6 +16,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
+    # Профилирование запросов, только для персонала.
+    path('profiling/', ProfilingStatsView.as_view(), name='profiling-stats'),
+    # Метрики соединений с БД и пула, только для персонала.
+    path('db-stats/', ConnectionStatsView.as_view(), name='db-stats'),
+    # Асинхронное чтение книг для ASGI, ответ как у /book/ и /book/{id}/.
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail, name='async-book-detail'),
     path('__debug__/', include('debug_toolbar.urls')),
 ]
 
@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    # Счетчик новых соединений с БД для метрик соединений (store/db/pool.py).
+    # Пересчет счетчиков книг при удалении пользователя вместе с его отношениями и новый updated_at книг
+    # при его переименовании (store/logic_relations.py).
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+        from store.db.pool import record_connection_created
+        from store.logic_relations import (recount_user_relations, remember_user_names, remember_user_relations,
+                                           touch_renamed_user_books)
+
+        connection_created.connect(record_connection_created, dispatch_uid='store_connection_created')
+        pre_delete.connect(remember_user_relations, sender=User, dispatch_uid='store_remember_user_relations')
+        post_delete.connect(recount_user_relations, sender=User, dispatch_uid='store_recount_user_relations')
+        pre_save.connect(remember_user_names, sender=User, dispatch_uid='store_remember_user_names')
+        post_save.connect(touch_renamed_user_books, sender=User, dispatch_uid='store_touch_renamed_user_books')
@@ -0,0 +1,90 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotFound
+from rest_framework.request import Request
+
+from .conditional import get_not_modified_response, make_validators, set_validator_headers
+from .fast_serializers import book_values, serialize_book_rows
+from .logic_readers import get_readers_preview
+from .models import Book
+from .profiling import profile_section
+from .renderers import FastJSONRenderer
+from .views import BookViewSet
+
+# Асинхронные list и detail книг для ASGI (uvicorn books.asgi:application): /async/book/ и /async/book/{id}/.
+# Ответ тот же, что у GET /book/ и /book/{id}/ (фильтры, поиск, сортировка, keyset пагинация, ETag),
+# книги читаются async ORM (aiterator, aget), поэтому пока запрос ждет БД, event loop обслуживает другие.
+# Только чтение, без кеша ответов анонимным пользователям. Сравнение с WSGI: python manage.py loadtest.
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+async def book_list(request):
+    try:
+        view = get_book_view(request, 'list')
+        queryset = view.filter_queryset(view.get_queryset())
+        extra = ['updated_at']
+        # Сортировка по rank из поиска: значение нужно для позиции keyset пагинации.
+        if 'rank' in queryset.query.annotations:
+            extra.append('rank')
+        rows = book_values(queryset, *extra)
+        paginator = view.paginator
+        if not paginator.is_requested(view.request):
+            rows = [row async for row in rows.aiterator()]
+            return await render_books(view.request, rows, lambda data: data, with_last_modified=False)
+        page_queryset = paginator.get_page_queryset(rows, view.request)
+        rows = paginator.get_page([row async for row in page_queryset.aiterator()])
+    except APIException as exc:
+        return error_response(exc)
+    return await render_books(view.request, rows, lambda data: paginator.get_paginated_response(data).data,
+                              with_last_modified=False)
+
+
+async def book_detail(request, pk):
+    try:
+        view = get_book_view(request, 'retrieve')
+        try:
+            row = await book_values(Book.objects.all(), 'updated_at').aget(pk=pk)
+        except Book.DoesNotExist:
+            raise NotFound()
+    except APIException as exc:
+        return error_response(exc)
+    return await render_books(view.request, [row], lambda data: data[0])
+
+
+# BookViewSet без вызова dispatch: только его фильтры, queryset и пагинация, запросов к БД при этом нет.
+def get_book_view(request, action):
+    if request.method not in SAFE_METHODS:
+        raise MethodNotAllowed(request.method)
+    return BookViewSet(request=Request(request), action=action, format_kwarg=None, args=(), kwargs={})
+
+
+# Ответ по строкам book_values, make_data - обертка списка книг (страница, одна книга).
+# Если ETag совпал с If-None-Match, возвращается 304 без сериализации. Списки - без Last-Modified, как в WSGI.
+# Читатели - обычный SQL через cursor, для него в Django нет async API.
+async def render_books(request, rows, make_data, with_last_modified=True):
+    etag, last_modified = make_validators(request, [(row['id'], row['updated_at']) for row in rows],
+                                          with_last_modified)
+    not_modified = get_not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    preview = await sync_to_async(get_readers_preview)([row['id'] for row in rows])
+    return json_response(make_data(serialize_book_rows(rows, preview)), etag, last_modified)
+
+
+def json_response(data, etag=None, last_modified=None, status_code=status.HTTP_200_OK):
+    with profile_section('render'):
+        response = HttpResponse(FastJSONRenderer().render(data), status=status_code,
+                                content_type=FastJSONRenderer.media_type)
+    if etag is not None:
+        set_validator_headers(response, etag, last_modified)
+    return response
+
+
+# Тело ошибки как у exception_handler DRF.
+def error_response(exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = json_response(data, status_code=exc.status_code)
+    if isinstance(exc, MethodNotAllowed):
+        response['Allow'] = ', '.join(SAFE_METHODS)
+    return response
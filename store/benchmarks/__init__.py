@@ -0,0 +1,25 @@
+from django.utils.module_loading import import_string
+
+# Реестр бенчмарков: имя -> путь к функции run(options), которая возвращает dict с результатами.
+# Запуск: python manage.py benchmark pagination
+BENCHMARKS = {
+    'api': 'store.benchmarks.api.run',
+    'pagination': 'store.benchmarks.pagination.run',
+    'likes': 'store.benchmarks.likes.run',
+    'search': 'store.benchmarks.search.run',
+    'relations': 'store.benchmarks.relations.run',
+    'books_bulk': 'store.benchmarks.books_bulk.run',
+    'export': 'store.benchmarks.export.run',
+    'import': 'store.benchmarks.importer.run',
+    'serializers': 'store.benchmarks.serializers.run',
+    'renderers': 'store.benchmarks.renderers.run',
+    'connections': 'store.benchmarks.connections.run',
+    'relation_upsert': 'store.benchmarks.relation_upsert.run',
+    'leaderboards': 'store.benchmarks.leaderboards.run',
+    'recommendations': 'store.benchmarks.recommendations.run',
+    'facets': 'store.benchmarks.facets.run',
+}
+
+
+def get_benchmark(name):
+    return import_string(BENCHMARKS[name])
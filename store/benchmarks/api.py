@@ -0,0 +1,70 @@
+import json
+import random
+from itertools import cycle
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.data import WORDS, seed_catalog
+from store.benchmarks.utils import count_queries, measure, measure_memory
+from store.models import Book
+
+
+# Основные запросы API на сгенерированном каталоге: латентность (перцентили), SQL запросов
+# на запрос и пиковая память. Запросы идут по циклу заранее выбранных параметров
+# (одинаковых при одинаковом seed), чтобы не мерить один и тот же закешированный план.
+# Клиент авторизован: анонимные list и retrieve отдаются из кеша ответов, он мерится отдельно.
+def run(options):
+    books = options.get('books', 10000)
+    repeat = options.get('repeat', 20)
+    seed = options.get('seed', 0)
+    results = {'data': seed_catalog(books=books, users=options.get('users', max(books // 10, 100)),
+                                    relations_per_book=options.get('relations_per_book', 10), seed=seed)}
+
+    rng = random.Random(seed)
+    book_ids = list(Book.objects.values_list('id', flat=True))
+    sample_ids = rng.sample(book_ids, min(len(book_ids), 50))
+    prices = [str(price) for price in Book.objects.filter(pk__in=sample_ids).values_list('price', flat=True)]
+    user = User.objects.create(username='bench_client')
+    client = APIClient()
+    client.force_login(user)
+    anonymous = APIClient()
+    book_list = reverse('book-list')
+
+    def get(url, params_list, api_client=client):
+        params = cycle(params_list)
+        return lambda: _check(api_client.get(url, next(params)))
+
+    def get_detail(api_client=client, ids=sample_ids):
+        ids = cycle(ids)
+        return lambda: _check(api_client.get(reverse('book-detail', args=(next(ids),))))
+
+    def patch_relation(make_data):
+        ids, counter = cycle(sample_ids), cycle(range(10))
+        return lambda: _check(client.patch(reverse('userbookrelation-detail', args=(next(ids),)),
+                                           data=json.dumps(make_data(next(counter))),
+                                           content_type='application/json'))
+
+    scenarios = {
+        'list_page': get(book_list, [{'page_size': 20}]),
+        'list_page_anonymous_cached': get(book_list, [{'page_size': 20}], anonymous),
+        'detail': get_detail(),
+        # Несколько книг, чтобы после прогрева замерялись попадания в кеш.
+        'detail_anonymous_cached': get_detail(anonymous, sample_ids[:5]),
+        'search': get(book_list, [{'search': word, 'page_size': 20} for word in WORDS]),
+        'filter_price': get(book_list, [{'price': price, 'page_size': 20} for price in prices]),
+        'ordering_price': get(book_list, [{'ordering': '-price', 'page_size': 20}]),
+        'ordering_author': get(book_list, [{'ordering': 'author_name', 'page_size': 20}]),
+        'relation_like': patch_relation(lambda step: {'like': step % 2 == 0}),
+        'relation_rate': patch_relation(lambda step: {'rate': step % 5 + 1}),
+    }
+    for name, request in scenarios.items():
+        results[name] = {**measure(request, repeat=repeat), 'queries': count_queries(request),
+                         'peak_mb': measure_memory(request)}
+    return results
+
+
+def _check(response):
+    assert response.status_code == 200, response.status_code
+    return response
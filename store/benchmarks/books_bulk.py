@@ -0,0 +1,56 @@
+import json
+from itertools import count
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.utils import measure
+from store.models import Book
+
+
+# Пропускная способность загрузки каталога: POST /book/ на каждую книгу против
+# одного POST /book/ со списком, а также PATCH и DELETE /book/bulk/.
+def run(options):
+    items = options.get('books', 1000)
+    repeat = options.get('repeat', 20)
+    client = APIClient()
+    client.force_login(User.objects.create(username='bench_owner'))
+    runs = count()
+
+    def make_books():
+        run = next(runs)
+        return [{'name': f'Book {run}-{i}', 'price': f'{i % 1000}.99', 'author_name': f'Author {i % 500}'}
+                for i in range(items)]
+
+    def post(data):
+        return client.post(reverse('book-list'), data=json.dumps(data), content_type='application/json')
+
+    def single_create():
+        for book in make_books():
+            post(book)
+
+    def bulk_create():
+        post(make_books())
+
+    def bulk_update():
+        ids = list(Book.objects.order_by('-id').values_list('id', flat=True)[:items])
+        run = next(runs)
+        client.patch(reverse('book-bulk'), data=json.dumps([{'id': pk, 'price': f'{run % 1000}.50'} for pk in ids]),
+                     content_type='application/json')
+
+    def bulk_delete():
+        ids = [book['id'] for book in post(make_books()).data]
+        client.delete(reverse('book-bulk'), data=json.dumps(ids), content_type='application/json')
+
+    single_repeat = max(repeat // 10, 3)
+    results = {'items': items,
+               'single_create': measure(single_create, repeat=single_repeat, warmup=1),
+               'bulk_create': measure(bulk_create, repeat=repeat),
+               'bulk_update': measure(bulk_update, repeat=repeat),
+               # Включает создание удаляемых книг.
+               'bulk_create_and_delete': measure(bulk_delete, repeat=repeat)}
+    for name in ('single_create', 'bulk_create', 'bulk_update'):
+        results[name]['items_per_s'] = round(items / results[name]['median_ms'] * 1000)
+    results['create_speedup'] = round(results['single_create']['median_ms'] / results['bulk_create']['median_ms'], 1)
+    return results
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.db import connection, connections
+
+from store.benchmarks.utils import measure, create_books
+from store.db.pool import close_pools, get_connection_stats
+from store.models import Book
+
+# Режимы соединений: новое на каждый запрос, постоянное (CONN_MAX_AGE с проверкой) и пул в процессе.
+MODES = {
+    'new_connection': {'CONN_MAX_AGE': 0},
+    'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True},
+    'pool': {'CONN_MAX_AGE': 0, 'ENGINE': 'store.db.backends.postgresql_pool'},
+}
+
+
+# Стоимость соединения с БД на запрос. Запрос эмулируется как в Django: close_if_unusable_or_obsolete
+# в начале и в конце (request_started / request_finished) и страница из 20 книг между ними.
+# single - запросы подряд в одном потоке, threads - concurrency потоков (как потоки WSGI сервера),
+# у каждого свое соединение Django, у пула - общий набор соединений процесса.
+def run(options):
+    if connection.vendor != 'postgresql':
+        return {'skipped': 'PostgreSQL only'}
+    repeat = max(options.get('repeat', 20), 50)
+    concurrency = options.get('concurrency', 8)
+    create_books(max(Book.objects.count(), 1000) - Book.objects.count())
+
+    results = {}
+    for mode, settings_dict in MODES.items():
+        alias = f'bench_{mode}'
+        connections.settings[alias] = {**connection.settings_dict, **settings_dict}
+        if mode == 'pool':
+            # Соединений пула столько же, сколько потоков, как у постоянных соединений.
+            connections.settings[alias]['OPTIONS'] = {'pool': {'max_size': concurrency}}
+        try:
+            def request():
+                wrapper = connections[alias]
+                wrapper.close_if_unusable_or_obsolete()
+                list(Book.objects.using(alias).order_by('id').values_list('id', 'name', 'price')[:20])
+                wrapper.close_if_unusable_or_obsolete()
+
+            single = measure(request, repeat=repeat, warmup=5)
+            threads_ms = _run_threads(request, concurrency, repeat)
+            results[mode] = {'single': single, 'threads': threads_ms, **get_connection_stats()[alias]}
+        finally:
+            connections[alias].close()
+            close_pools(alias)
+            del connections[alias]
+            del connections.settings[alias]
+
+    baseline = results['new_connection']['single']['median_ms']
+    for mode in ('persistent', 'pool'):
+        results[mode]['saved_ms_per_request'] = round(baseline - results[mode]['single']['median_ms'], 3)
+    return results
+
+
+# Пропускная способность при concurrency потоках, каждый выполняет repeat запросов.
+def _run_threads(request, concurrency, repeat):
+    def worker():
+        for _ in range(repeat):
+            request()
+        connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_ms = (time.perf_counter() - start) * 1000
+    return {'concurrency': concurrency, 'total_ms': round(total_ms, 3),
+            'rps': round(concurrency * repeat / total_ms * 1000, 1)}
@@ -0,0 +1,52 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from store.benchmarks.utils import analyze
+from store.importer import chunked, insert_relations
+from store.logic_relations import recount_books
+from store.models import Book
+
+WORDS = ('war', 'peace', 'crime', 'punishment', 'night', 'garden', 'river', 'winter', 'city', 'dream',
+         'house', 'letter', 'island', 'silence', 'storm', 'road', 'mirror', 'forest', 'glass', 'empire')
+FIRST_NAMES = ('Leo', 'Anna', 'Fyodor', 'Maria', 'Ivan', 'Olga', 'Nikolai', 'Elena', 'Anton', 'Vera')
+LAST_NAMES = ('Tolstoy', 'Akhmatova', 'Dostoevsky', 'Tsvetaeva', 'Bunin', 'Berggolts', 'Gogol',
+              'Ginzburg', 'Chekhov', 'Inber')
+RATES = (None, 1, 2, 3, 4, 5)
+RATE_WEIGHTS = (30, 5, 8, 17, 22, 18)
+
+
+# Детерминированный генератор каталога для бенчмарков: одинаковые seed и размеры дают одинаковые
+# данные на любой БД. Популярность книг неравномерная: у немногих книг много читателей, у большинства мало.
+# Счетчики книг пересчитываются в конце одним проходом, как после import_catalog.
+def seed_catalog(books=10000, users=1000, relations_per_book=10, seed=0, batch_size=5000):
+    rng = random.Random(seed)
+    User.objects.bulk_create(
+        (User(username=f'bench_user_{i}', first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES))
+         for i in range(users)), batch_size=batch_size)
+    user_ids = list(User.objects.filter(username__startswith='bench_user_').order_by('id').values_list('id', flat=True))
+
+    authors = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}' for i in range(max(books // 20, 1))]
+    for batch in chunked(range(books), batch_size):
+        Book.objects.bulk_create(
+            Book(name=' '.join(rng.sample(WORDS, rng.randint(1, 4))).capitalize() + f' {i}',
+                 price=Decimal(rng.randint(100, 500000)) / 100, author_name=rng.choice(authors),
+                 owner_id=rng.choice(user_ids) if user_ids and rng.random() < 0.5 else None)
+            for i in batch)
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+
+    relations = 0
+    for batch in chunked(book_ids, max(batch_size // max(relations_per_book, 1), 1)):
+        rows = []
+        for book_id in batch:
+            readers = min(int(rng.paretovariate(1.5) * relations_per_book / 3), len(user_ids))
+            for user_id in rng.sample(user_ids, readers):
+                rows.append((user_id, book_id, rng.random() < 0.4, rng.random() < 0.15,
+                             rng.choices(RATES, RATE_WEIGHTS)[0]))
+        insert_relations(rows)
+        relations += len(rows)
+
+    recount_books(Book.objects.values('pk'))
+    analyze()
+    return {'books': books, 'users': users, 'relations': relations, 'seed': seed}
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.utils import measure, measure_memory, create_books
+from store.models import Book
+
+
+# Время и пиковая память выгрузки каталога: GET /book/ целиком против потокового /book/export/.
+# Замер на двух размерах таблицы показывает, что память выгрузки не растет вместе с ней.
+def run(options):
+    books = options.get('books', 10000)
+    repeat = max(options.get('repeat', 20) // 4, 3)
+    client = APIClient()
+    # Авторизованный клиент, чтобы GET /book/ не отдавался из кеша ответов.
+    client.force_login(User.objects.create(username='bench_export'))
+
+    def full_list():
+        client.get(reverse('book-list'))
+
+    def export(export_format):
+        def run():
+            for _ in client.get(reverse('book-export'), {'export_format': export_format}).streaming_content:
+                pass
+        return run
+
+    results = {}
+    for size in (books, books * 5):
+        create_books(size - Book.objects.count())
+        results[f'books_{size}'] = {
+            name: {'time': measure(func, repeat=repeat, warmup=1), 'peak_mb': measure_memory(func)}
+            for name, func in (('list', full_list), ('ndjson', export('ndjson')), ('csv', export('csv')))
+        }
+    return results
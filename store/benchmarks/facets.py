@@ -0,0 +1,58 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.utils import analyze, count_queries, create_books, measure
+from store.cache import get_cache
+from store.facets import get_facets
+from store.fast_serializers import book_values
+from store.models import Book
+
+
+# Прежний способ: весь отфильтрованный список /book/ (быстрый путь через values) и подсчет на клиенте.
+def client_facets(queryset):
+    edges = settings.BOOKS_PRICE_FACET_BUCKETS
+    buckets, authors = Counter(), Counter()
+    for row in book_values(queryset):
+        buckets[sum(row['price'] >= edge for edge in edges)] += 1
+        authors[row['author_name']] += 1
+    top = sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:settings.BOOKS_AUTHOR_FACET_SIZE]
+    return [buckets.get(number, 0) for number in range(len(edges) + 1)], top
+
+
+# Фасеты на каталоге из books книг, весь каталог и диапазон цен:
+# - client - весь список и подсчет в Python, как считал UI;
+# - grouped - get_facets, один сгруппированный запрос.
+# api - GET /book/facets/ через APIClient без кеша (авторизованный пользователь) и из кеша ответов (анонимный).
+def run(options):
+    books = options.get('books', 20000)
+    repeat = options.get('repeat', 20)
+    create_books(books)
+    analyze()
+    get_cache().clear()
+
+    results = {'books': books}
+    for scenario, queryset in (('all', Book.objects.all()), ('price_range', Book.objects.filter(price__lte=100))):
+        grouped = get_facets(queryset)
+        result = {
+            'client': measure(lambda: client_facets(queryset), repeat=max(repeat // 4, 3)),
+            'grouped': measure(lambda: get_facets(queryset), repeat=repeat),
+        }
+        result['grouped']['queries'] = count_queries(lambda: get_facets(queryset))
+        # Подсчет на клиенте и сгруппированный запрос должны дать одни и те же числа.
+        prices, authors = client_facets(queryset)
+        result['consistent'] = (prices == [bucket['count'] for bucket in grouped['price']] and
+                                authors == [(author['author_name'], author['count']) for author in grouped['authors']])
+        results[scenario] = result
+
+    client = APIClient()
+    url = reverse('book-facets')
+    results['api_cached'] = measure(lambda: client.get(url), repeat=repeat)
+    results['api_cached']['queries'] = count_queries(lambda: client.get(url))
+    client.force_authenticate(User.objects.create(username='bench_facets'))
+    results['api'] = measure(lambda: client.get(url), repeat=repeat)
+    results['api']['queries'] = count_queries(lambda: client.get(url))
+    return results
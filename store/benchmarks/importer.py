@@ -0,0 +1,55 @@
+import csv
+import os
+import tempfile
+import time
+
+from store.benchmarks.utils import analyze, create_users
+from store.importer import BookImporter, RelationImporter, read_rows
+from store.models import Book
+
+
+# Скорость import_catalog: книги и отношения из CSV файлов, строк в секунду.
+# Каждый файл импортируется один раз, повторный прогон был бы уже обновлением.
+def run(options):
+    books = options.get('books', 20000)
+    relations_per_book = options.get('relations_per_book', 10)
+    users = ['bench_user_%d' % i for i in range(max(relations_per_book * 10, 100))]
+    create_users(len(users))
+    results = {'books': books, 'relations': books * relations_per_book}
+
+    with tempfile.TemporaryDirectory() as directory:
+        books_path = os.path.join(directory, 'books.csv')
+        _write_csv(books_path, ['name', 'price', 'author_name', 'owner'],
+                   ([f'Book {i}', f'{i % 1000}.99', f'Author {i % 5000}', users[i % len(users)]]
+                    for i in range(books)))
+        results['import_books'] = _timed(BookImporter(), books_path)
+        analyze()
+
+        book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        relations_path = os.path.join(directory, 'relations.csv')
+        _write_csv(relations_path, ['user', 'book', 'like', 'in_bookmarks', 'rate'],
+                   ([users[(index + offset) % len(users)], book_id, offset % 2, offset % 3 == 0,
+                     offset % 5 + 1 if offset % 3 else '']
+                    for index, book_id in enumerate(book_ids) for offset in range(relations_per_book)))
+        results['import_relations'] = _timed(RelationImporter(), relations_path)
+        # Повторный импорт тех же отношений - путь обновления существующих.
+        results['reimport_relations'] = _timed(RelationImporter(), relations_path)
+
+    rows_per_s = results['import_relations']['rows_per_s']
+    results['estimated_10m_relations_min'] = round(10_000_000 / rows_per_s / 60, 1)
+    return results
+
+
+def _write_csv(path, header, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _timed(importer, path):
+    start = time.perf_counter()
+    stats = importer.run(read_rows(path))
+    seconds = time.perf_counter() - start
+    stats.pop('errors')
+    return {**stats, 'seconds': round(seconds, 2), 'rows_per_s': round(stats['rows'] / seconds)}
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.utils import analyze, count_queries, create_books, create_relations, create_users, measure
+from store.cache import get_cache
+from store.fast_serializers import book_values
+from store.leaderboards import LEADERBOARDS, current_hour, get_leaderboard, refresh_leaderboard, update_leaderboards
+from store.models import Book, BookLikeActivity
+
+
+# Прежний способ: весь список /book/ (быстрый путь через values) и сортировка на клиенте.
+def client_sort(board, size):
+    rows = list(book_values(Book.objects.all(), 'rate_count'))
+    if board == 'top-rated':
+        rows = [row for row in rows
+                if row['rating'] is not None and row['rate_count'] >= settings.LEADERBOARD_MIN_VOTES]
+        rows.sort(key=lambda row: (-row['rating'], -row['rate_count'], row['id']))
+    else:
+        rows = [row for row in rows if row['annotated_likes']]
+        rows.sort(key=lambda row: (-row['annotated_likes'], row['id']))
+    return rows[:size]
+
+
+# Лидерборды на каталоге из books книг:
+# - client_sort - весь список и сортировка в Python (trending так получить нельзя, нет времени лайков);
+# - refresh - перестроение запросами по индексам (стоимость запуска refresh_leaderboards на лидерборд);
+# - update - обновление после изменения отношения к книге из середины лидерборда, как при записи отношения;
+# - read - первые книги лидерборда из таблицы, как у GET /book/leaderboards/{board}/.
+# api - GET через APIClient.
+def run(options):
+    books = options.get('books', 20000)
+    per_book = options.get('relations_per_book', 5)
+    repeat = options.get('repeat', 20)
+    size = settings.LEADERBOARD_SIZE
+    create_books(books)
+    create_relations(per_book, create_users(max(per_book * 10, 100)))
+    # Лайки по часам: каждая двадцатая книга активна в каждом часе окна и в часах до него.
+    hour = current_hour()
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[::20])
+    BookLikeActivity.objects.bulk_create(
+        [BookLikeActivity(book_id=book_id, hour=hour - timedelta(hours=offset), likes=(book_id + offset) % 7 - 1)
+         for offset in range(settings.LEADERBOARD_TRENDING_HOURS * 2) for book_id in book_ids],
+        batch_size=5000)
+    analyze()
+    get_cache().clear()
+
+    results = {'books': books, 'activity_rows': BookLikeActivity.objects.count()}
+    for board, build in LEADERBOARDS.items():
+        result = {}
+        if board != 'trending':
+            result['client_sort'] = measure(lambda: client_sort(board, size), repeat=max(repeat // 4, 3))
+            # Прежний способ и индексный запрос должны дать одни и те же книги.
+            result['consistent'] = ([row['id'] for row in client_sort(board, size)] ==
+                                    [book_id for book_id, *_ in build(size)])
+        result['refresh'] = measure(lambda: refresh_leaderboard(board), repeat=repeat)
+        result['refresh']['queries'] = count_queries(lambda: refresh_leaderboard(board))
+        leaders = build(size)
+        if leaders:
+            book_id = leaders[len(leaders) // 2][0]
+            result['update'] = measure(lambda: update_leaderboards([book_id], [board]), repeat=repeat)
+            result['update']['queries'] = count_queries(lambda: update_leaderboards([book_id], [board]))
+        result['read'] = measure(lambda: get_leaderboard(board, size), repeat=repeat)
+        result['read']['queries'] = count_queries(lambda: get_leaderboard(board, size))
+        results[board] = result
+
+    client = APIClient()
+    url = reverse('book-leaderboard', args=('top-rated',))
+    results['api'] = measure(lambda: client.get(url), repeat=repeat)
+    results['api']['queries'] = count_queries(lambda: client.get(url))
+    return results
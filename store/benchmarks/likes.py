@@ -0,0 +1,32 @@
+from django.db.models import Count, Case, When
+
+from store.benchmarks.utils import measure, count_queries, create_books, create_users, create_relations
+from store.models import Book
+from store.serializers import BooksSerializer
+
+
+# Сравнение подсчета лайков аннотацией Count(Case(When(...))) и полем likes_count.
+def run(options):
+    books = options.get('books', 20000)
+    per_book = options.get('relations_per_book', 10)
+    repeat = options.get('repeat', 20)
+    create_books(books)
+    create_relations(per_book, create_users(max(per_book * 10, 100)))
+
+    base = Book.objects.select_related('owner').order_by('price', 'id')
+    annotated = base.annotate(annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))))
+    results = {'books': books, 'relations': books * per_book}
+
+    book_id = Book.objects.order_by('id').values_list('id', flat=True)[books // 2]
+    for name, queryset in (('annotation', annotated), ('likes_count', base)):
+        results[name] = {
+            'page_20_by_price': measure(lambda: list(queryset[:20]), repeat=repeat),
+            'page_20_by_price_queries': count_queries(lambda: list(queryset[:20])),
+            'detail': measure(lambda: queryset.get(pk=book_id), repeat=repeat),
+            'full_list': measure(lambda: list(queryset.all()), repeat=max(repeat // 4, 3)),
+        }
+    # Поле и аннотация должны давать одинаковые значения.
+    results['consistent'] = all(book.annotated_likes == book.likes_count for book in annotated[:1000])
+    results['serialized_page_20_ms'] = measure(
+        lambda: BooksSerializer(base.prefetch_related('readers')[:20], many=True).data, repeat=repeat)
+    return results
@@ -0,0 +1,65 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+# Нагрузочный тест запущенного сервера: concurrency потоков, у каждого свое keep-alive соединение,
+# в течение duration секунд без пауз запрашивают url. Первые warmup секунд не учитываются.
+# Возвращает пропускную способность, перцентили латентности в миллисекундах и количество ошибок
+# (ответ не 200 или ошибка соединения).
+def run_load(url, concurrency, duration, warmup=0, timeout=30):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    start = time.perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+    latencies, errors = [], []
+
+    def worker():
+        connection = connection_class(parts.netloc, timeout=timeout)
+        own_latencies, own_errors = [], 0
+        while True:
+            request_start = time.perf_counter()
+            if request_start >= deadline:
+                break
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = connection_class(parts.netloc, timeout=timeout)
+                ok = False
+            if request_start >= measure_from:
+                if ok:
+                    own_latencies.append((time.perf_counter() - request_start) * 1000)
+                else:
+                    own_errors += 1
+        connection.close()
+        # list.extend и append атомарны под GIL.
+        latencies.extend(own_latencies)
+        errors.append(own_errors)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / duration, 1),
+        **{f'p{int(fraction * 100)}_ms': _percentile(latencies, fraction) for fraction in (0.5, 0.9, 0.99)},
+        'max_ms': round(latencies[-1], 3) if latencies else None,
+    }
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
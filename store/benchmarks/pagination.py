@@ -0,0 +1,47 @@
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from store.benchmarks.utils import measure, count_queries, create_books
+from store.models import Book
+from store.pagination import BookPagination
+from store.views import BookViewSet
+
+
+# Сравнение keyset пагинации и LIMIT/OFFSET на первой и глубокой странице.
+def run(options):
+    page_size = 20
+    deep_page = options.get('deep_page', 10000)
+    books = max(options.get('books', 0), page_size * deep_page)
+    repeat = options.get('repeat', 20)
+    create_books(books)
+
+    client = APIClient()
+    url = reverse('book-list')
+    results = {'books': books, 'page_size': page_size}
+
+    for ordering in ('id', 'price', '-author_name'):
+        params = {'ordering': ordering, 'page_size': page_size}
+        tie_breaker = '-id' if ordering.startswith('-') else 'id'
+        # OFFSET сравнивается на том же queryset, что использует view.
+        queryset = BookViewSet.queryset.order_by(ordering, tie_breaker)
+        # Курсор глубокой страницы строится по записи, стоящей прямо перед ней.
+        deep_cursor_url = _cursor_url(url, params, queryset[page_size * (deep_page - 1) - 1])
+        deep_offset = page_size * (deep_page - 1)
+
+        results[ordering] = {
+            'keyset_page_1': measure(lambda: client.get(url, params), repeat=repeat),
+            f'keyset_page_{deep_page}': measure(lambda: client.get(deep_cursor_url), repeat=repeat),
+            f'keyset_page_{deep_page}_queries': count_queries(lambda: client.get(deep_cursor_url)),
+            'offset_page_1': measure(lambda: list(queryset[:page_size]), repeat=repeat),
+            f'offset_page_{deep_page}': measure(
+                lambda: list(queryset[deep_offset:deep_offset + page_size]), repeat=repeat),
+        }
+    return results
+
+
+def _cursor_url(url, params, book):
+    paginator = BookPagination()
+    request = Request(APIRequestFactory().get(url, params))
+    paginator.get_page_queryset(Book.objects.order_by(params['ordering']), request)
+    return paginator.encode_cursor(paginator.get_position(book), reverse=False)
@@ -0,0 +1,38 @@
+import time
+from itertools import cycle
+
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.data import seed_catalog
+from store.benchmarks.utils import count_queries, measure, measure_memory
+from store.models import Book, BookSimilarity
+from store.recommendations import build_recommendations, has_numpy
+
+
+# Построение похожих книг на сгенерированном каталоге: время и пиковая память Python (tracemalloc учитывает
+# и массивы NumPy) для numpy и python, совпадение соседей, затем латентность /book/{id}/similar/.
+# python пропускается на больших каталогах (--python 0): он держит в словаре все пары книг.
+def run(options):
+    books = options.get('books', 20000)
+    repeat = options.get('repeat', 20)
+    results = {'data': seed_catalog(books=books, users=options.get('users', max(books // 5, 100)),
+                                    relations_per_book=options.get('relations_per_book', 20),
+                                    seed=options.get('seed', 0))}
+    engines = [engine for engine, enabled in (('numpy', has_numpy()), ('python', options.get('python', 1)))
+               if enabled]
+    neighbours = {}
+    for engine in engines:
+        start = time.perf_counter()
+        stats = build_recommendations(engine=engine)
+        results[engine] = {'build_s': round(time.perf_counter() - start, 3), **stats,
+                           'peak_mb': measure_memory(lambda: build_recommendations(engine=engine))}
+        neighbours[engine] = list(BookSimilarity.objects.order_by('book', 'rank').values_list('book', 'similar'))
+    if len(neighbours) == 2:
+        results['same_neighbours'] = neighbours['numpy'] == neighbours['python']
+
+    client = APIClient()
+    ids = cycle(Book.objects.order_by('-readers_count').values_list('id', flat=True)[:50])
+    request = lambda: client.get(reverse('book-similar', args=(next(ids),)))
+    results['similar'] = {**measure(request, repeat=repeat), 'queries': count_queries(request)}
+    return results
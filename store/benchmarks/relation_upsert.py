@@ -0,0 +1,80 @@
+import json
+from itertools import count
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.utils import count_queries, create_books, measure
+from store.logic_likes import find_like_mismatches
+from store.logic_rating import find_rating_mismatches
+from store.logic_readers import find_reader_mismatches
+from store.logic_relations import apply_relation, upsert_relation
+from store.models import Book, UserBookRelation
+from store.serializers import UserBookRelationSerializer
+
+
+# Прежний PATCH /book_relation/{book}/: get_or_create, затем сохранение через сериализатор.
+def legacy_patch(user, book_id, data):
+    relation, _ = UserBookRelation.objects.get_or_create(user=user, book_id=book_id)
+    serializer = UserBookRelationSerializer(relation, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    return serializer.data
+
+
+PATHS = {'legacy': legacy_patch, 'orm': apply_relation, 'upsert': upsert_relation}
+
+
+# Пропускная способность изменения одного отношения: прежний путь (get_or_create + сериализатор),
+# путь через ORM (apply_relation) и upsert одним запросом (upsert_relation) на items книгах.
+# changed - каждый прогон меняет лайк и оценку, unchanged - повтор тех же значений.
+# api - PATCH через APIClient с текущим view (в PostgreSQL - upsert).
+def run(options):
+    items = options.get('items', 200)
+    repeat = options.get('repeat', 10)
+    create_books(max(options.get('books', 0), items))
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:items])
+
+    def make_data(run):
+        return {'like': run % 2 == 0, 'rate': run % 5 + 1}
+
+    results = {'items': items}
+    for name, path in PATHS.items():
+        user = User.objects.create(username=f'bench_upsert_{name}')
+        runs = count()
+
+        def changed():
+            data = make_data(next(runs))
+            for book_id in book_ids:
+                path(user, book_id, data)
+
+        def unchanged():
+            for book_id in book_ids:
+                path(user, book_id, make_data(0))
+
+        results[name] = {}
+        for scenario, func in (('changed', changed), ('unchanged', unchanged)):
+            result = measure(func, repeat=repeat, warmup=1)
+            result['ops_per_s'] = round(items / result['median_ms'] * 1000)
+            result['queries_per_op'] = round(count_queries(func) / items, 2)
+            results[name][scenario] = result
+
+    client = APIClient()
+    client.force_authenticate(User.objects.create(username='bench_upsert_api'))
+    api_runs = count()
+
+    def api():
+        data = json.dumps(make_data(next(api_runs)))
+        for book_id in book_ids:
+            client.patch(reverse('userbookrelation-detail', args=(book_id,)), data=data,
+                         content_type='application/json')
+
+    results['api'] = measure(api, repeat=repeat, warmup=1)
+    results['api']['requests_per_s'] = round(items / results['api']['median_ms'] * 1000)
+    results['speedup'] = {scenario: round(results['legacy'][scenario]['median_ms'] /
+                                          results['upsert'][scenario]['median_ms'], 1)
+                          for scenario in ('changed', 'unchanged')}
+    results['consistent'] = not any(find_mismatches().exists() for find_mismatches in
+                                    (find_rating_mismatches, find_like_mismatches, find_reader_mismatches))
+    return results
@@ -0,0 +1,54 @@
+import json
+from itertools import count
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.benchmarks.utils import measure, count_queries, create_books
+from store.logic_likes import find_like_mismatches
+from store.logic_rating import find_rating_mismatches
+from store.logic_readers import find_reader_mismatches
+from store.models import Book
+
+
+# Пропускная способность изменения отношений: PATCH /book_relation/{book}/ на каждую книгу
+# против одного POST /book_relation/bulk/ на ту же пачку.
+def run(options):
+    items = options.get('items', 500)
+    books = max(options.get('books', 0), items)
+    repeat = options.get('repeat', 20)
+    create_books(books)
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:items])
+
+    # Каждый прогон меняет лайк и оценку, чтобы пересчет счетчиков действительно выполнялся.
+    def make_items(run):
+        return [{'book': book_id, 'like': run % 2 == 0, 'rate': run % 5 + 1} for book_id in book_ids]
+
+    single_runs, bulk_runs = count(), count()
+    single_client, bulk_client = APIClient(), APIClient()
+    single_client.force_login(User.objects.create(username='bench_single'))
+    bulk_client.force_login(User.objects.create(username='bench_bulk'))
+
+    def single():
+        for item in make_items(next(single_runs)):
+            single_client.patch(reverse('userbookrelation-detail', args=(item['book'],)),
+                                data=json.dumps(item), content_type='application/json')
+
+    def bulk():
+        bulk_client.post(reverse('userbookrelation-bulk'), data=json.dumps(make_items(next(bulk_runs))),
+                         content_type='application/json')
+
+    # Одиночный путь на пачке из items запросов медленный, прогонов меньше.
+    single_repeat = max(repeat // 10, 3)
+    results = {'items': items, 'single': measure(single, repeat=single_repeat, warmup=1),
+               'bulk': measure(bulk, repeat=repeat), 'single_queries': count_queries(single),
+               'bulk_queries': count_queries(bulk)}
+    for name in ('single', 'bulk'):
+        results[name]['items_per_s'] = round(items / results[name]['median_ms'] * 1000)
+    results['speedup'] = round(results['single']['median_ms'] / results['bulk']['median_ms'], 1)
+
+    # Оба пути должны оставлять счетчики книг согласованными с отношениями.
+    results['consistent'] = not any(find_mismatches().exists() for find_mismatches in
+                                    (find_rating_mismatches, find_like_mismatches, find_reader_mismatches))
+    return results
@@ -0,0 +1,43 @@
+from io import BytesIO
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from store.benchmarks.data import seed_catalog
+from store.benchmarks.utils import measure
+from store.fast_serializers import book_values, serialize_book_rows
+from store.models import Book
+from store.renderers import FastJSONRenderer, FastJSONParser, orjson
+
+
+# Рендеринг ответа списка книг JSONRenderer против FastJSONRenderer (store/renderers.py) на 1k и 10k книг,
+# и разбор того же JSON парсерами. Данные - ответ /book/ по сгенерированному каталогу,
+# если книг меньше нужного, строки повторяются.
+def run(options):
+    books = options.get('books', 10000)
+    repeat = options.get('repeat', 20)
+    seed_catalog(books=books, users=options.get('users', max(books // 10, 100)),
+                 relations_per_book=options.get('relations_per_book', 10), seed=options.get('seed', 0))
+    rows = serialize_book_rows(list(book_values(Book.objects.order_by('id')[:10000])))
+
+    results = {'orjson': orjson is not None}
+    for size in (1000, 10000):
+        data = (rows * (size // len(rows) + 1))[:size]
+        content = JSONRenderer().render(data)
+        if FastJSONRenderer().render(data) != content:
+            raise AssertionError('FastJSONRenderer differs from JSONRenderer')
+        results[f'books_{size}'] = {
+            'bytes': len(content),
+            'render': _compare(lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(data),
+                               repeat),
+            'parse': _compare(lambda: JSONParser().parse(BytesIO(content)),
+                              lambda: FastJSONParser().parse(BytesIO(content)), repeat),
+        }
+    return results
+
+
+def _compare(stdlib, fast, repeat):
+    result = {'json': measure(stdlib, repeat=repeat), 'fast': measure(fast, repeat=repeat)}
+    result['speedup'] = round(result['json']['median_ms'] / result['fast']['median_ms'], 2)
+    return result
+
@@ -0,0 +1,36 @@
+from django.urls import reverse
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.benchmarks.utils import measure, create_books
+from store.filters import BookSearchFilter
+from store.models import Book
+from store.views import BookViewSet
+
+
+# Латентность поиска ILIKE (SearchFilter) и полнотекстового (BookSearchFilter) от размера каталога.
+def run(options):
+    sizes = options.get('sizes', [1000, 10000, 100000])
+    if options.get('books'):
+        sizes = [size for size in sizes if size < options['books']] + [options['books']]
+    repeat = options.get('repeat', 20)
+    view = BookViewSet()
+    results = {}
+
+    for size in sizes:
+        # Каталог дополняется до нужного размера.
+        create_books(size - Book.objects.count())
+        results[size] = {}
+        for term in ('Author 4242', 'Book 77'):
+            request = Request(APIRequestFactory().get(reverse('book-list'), {'search': term}))
+            ilike = SearchFilter().filter_queryset(request, BookViewSet.queryset, view)
+            full_text = BookSearchFilter().filter_queryset(request, BookViewSet.queryset, view)
+            results[size][term] = {
+                'ilike_page_20': measure(lambda: list(ilike[:20]), repeat=repeat),
+                'full_text_page_20': measure(lambda: list(full_text[:20]), repeat=repeat),
+                'ilike_count': measure(lambda: ilike.count(), repeat=repeat),
+                'full_text_count': measure(lambda: full_text.count(), repeat=repeat),
+                'matches': full_text.count(),
+            }
+    return results
@@ -0,0 +1,58 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from store.benchmarks.data import seed_catalog
+from store.benchmarks.utils import measure
+from store.fast_serializers import book_values, serialize_book_rows
+from store.logic_readers import attach_readers_preview, get_readers_preview
+from store.models import Book
+from store.serializers import BooksSerializer
+
+
+# BooksSerializer(many=True) против быстрого пути списка (fast_serializers.py) на странице до 1000 книг.
+# serialize - только преобразование уже загруженных данных (модели с читателями против словарей values),
+# full - выборка, читатели и преобразование, как в GET /book/. Кроме времени считается процессорное
+# время на книгу (time.process_time) и во сколько раз быстрый путь его экономит.
+def run(options):
+    books = options.get('books', 10000)
+    repeat = options.get('repeat', 20)
+    seed_catalog(books=books, users=options.get('users', max(books // 10, 100)),
+                 relations_per_book=options.get('relations_per_book', 10), seed=options.get('seed', 0))
+    queryset = Book.objects.all().select_related('owner').order_by('id')[:1000]
+
+    instances = list(queryset)
+    attach_readers_preview(instances)
+    rows = list(book_values(queryset))
+    preview = get_readers_preview([row['id'] for row in rows])
+    renderer = JSONRenderer()
+    if renderer.render(BooksSerializer(instances, many=True).data) != renderer.render(
+            serialize_book_rows(rows, preview)):
+        raise AssertionError('serialize_book_rows differs from BooksSerializer')
+
+    scenarios = {
+        'serialize': {
+            'drf': lambda: BooksSerializer(instances, many=True).data,
+            'fast': lambda: serialize_book_rows(rows, preview),
+        },
+        'full': {
+            'drf': lambda: BooksSerializer(queryset.all(), many=True).data,
+            'fast': lambda: serialize_book_rows(list(book_values(queryset.all()))),
+        },
+    }
+    results = {'rows': len(rows)}
+    for name, paths in scenarios.items():
+        result = {path: {'time': measure(func, repeat=repeat, warmup=2),
+                         'cpu_us_per_row': _cpu_per_row(func, repeat, len(rows))}
+                  for path, func in paths.items()}
+        result['speedup'] = round(result['drf']['cpu_us_per_row'] / result['fast']['cpu_us_per_row'], 2)
+        results[name] = result
+    return results
+
+
+# Процессорное время процесса на одну строку в микросекундах (без ожидания БД).
+def _cpu_per_row(func, repeat, rows):
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    return round((time.process_time() - start) / repeat / rows * 1_000_000, 2)
@@ -0,0 +1,145 @@
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.test.utils import (setup_databases, teardown_databases, setup_test_environment,
+                               teardown_test_environment, override_settings, CaptureQueriesContext)
+
+from django.contrib.auth.models import User
+
+from store.models import Book, UserBookRelation
+
+
+# Бенчмарки работают на отдельной тестовой БД (test_<NAME>), рабочие данные не трогаются.
+@contextmanager
+def benchmark_database():
+    # Тестовое окружение нужно для APIClient (ALLOWED_HOSTS, testserver).
+    # debug-toolbar рендерит свою панель на каждый запрос и искажает замеры, отключаем его.
+    middleware = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar')]
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(MIDDLEWARE=middleware):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+# Выполняет func repeat раз и возвращает статистику времени в миллисекундах.
+def measure(func, repeat=20, warmup=2):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p90_ms': _percentile(timings, 0.90),
+        'p95_ms': _percentile(timings, 0.95),
+        'p99_ms': _percentile(timings, 0.99),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def _percentile(timings, fraction):
+    return round(timings[min(len(timings) - 1, int(len(timings) * fraction))], 3)
+
+
+# Пиковое выделение памяти Python во время func, в мегабайтах.
+def measure_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024 / 1024, 2)
+
+
+# Количество SQL запросов, выполненных func.
+def count_queries(func):
+    # Журнал запросов ограничен 9000 записями: заполненный журнал дал бы 0 новых запросов.
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+# Быстрое наполнение таблицы книг через bulk_create.
+def create_books(count, owner=None, batch_size=5000):
+    books = (Book(name=f'Book {i}', price=Decimal(i % 1000) + Decimal('0.99'),
+                  author_name=f'Author {i % 5000}', owner=owner)
+             for i in range(count))
+    batch = []
+    for book in books:
+        batch.append(book)
+        if len(batch) == batch_size:
+            Book.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Book.objects.bulk_create(batch)
+    analyze()
+
+
+# Пользователи для отношений, bulk_create без хеширования паролей.
+def create_users(count, batch_size=5000):
+    User.objects.bulk_create((User(username=f'bench_user_{i}') for i in range(count)),
+                             batch_size=batch_size)
+    return list(User.objects.filter(username__startswith='bench_user_').values_list('id', flat=True))
+
+
+# Отношения пользователи-книги: каждая книга получает per_book отношений от разных пользователей.
+# bulk_create обходит UserBookRelation.save, поэтому счетчики книг пересчитываются в конце.
+def create_relations(per_book, users, batch_size=5000):
+    from store.logic_likes import rebuild_likes
+    from store.logic_rating import rebuild_ratings
+
+    book_ids = Book.objects.values_list('id', flat=True)
+    batch = []
+    for book_id in book_ids.iterator():
+        for offset in range(per_book):
+            user_id = users[(book_id + offset) % len(users)]
+            batch.append(UserBookRelation(user_id=user_id, book_id=book_id, like=offset % 2 == 0,
+                                          rate=offset % 5 + 1 if offset % 3 else None))
+            if len(batch) >= batch_size:
+                UserBookRelation.objects.bulk_create(batch)
+                batch = []
+    if batch:
+        UserBookRelation.objects.bulk_create(batch)
+    rebuild_ratings()
+    rebuild_likes()
+    analyze()
+
+
+# Метрики, по которым сравниваются результаты двух запусков, и во сколько раз они могут вырасти.
+COMPARED_METRICS = ('median_ms', 'p95_ms', 'queries', 'peak_mb')
+
+
+# Сравнение результатов с сохраненными (--compare): список (путь, было, стало, отношение)
+# для всех метрик COMPARED_METRICS, которые есть в обоих результатах.
+def compare_results(baseline, current, path=''):
+    rows = []
+    for key, value in current.items():
+        if key not in baseline or key == 'meta':
+            continue
+        name = f'{path}.{key}' if path else key
+        if isinstance(value, dict) and isinstance(baseline[key], dict):
+            rows.extend(compare_results(baseline[key], value, name))
+        elif key in COMPARED_METRICS and isinstance(value, (int, float)) and baseline[key]:
+            rows.append((name, baseline[key], value, round(value / baseline[key], 2)))
+    return rows
+
+
+# Обновить статистику планировщика после массовой вставки.
+def analyze():
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
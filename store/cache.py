@@ -0,0 +1,197 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from store.db.routers import replica_has_changes_since, use_primary
+
+
+# Кеш ответов списка и карточки книги для анонимных пользователей.
+# Бэкенд - алиас BOOKS_CACHE_ALIAS из settings.CACHES (по умолчанию LocMemCache, можно Redis/Memcached).
+#
+# Инвалидация через поколения: в ключ записи входит номер поколения, при изменении книги
+# номер увеличивается и старые записи больше не читаются (удаляются по TIMEOUT бэкенда).
+# - поколение списков меняется при любом изменении любой книги;
+# - поколение книги меняется только при изменении этой книги, поэтому карточки других книг остаются в кеше.
+# Промах читается с реплики (store/db/routers.py), если ее отставание меньше времени с последней смены
+# поколений ответа, иначе с основной БД.
+LIST_GENERATION_KEY = 'books:generation:list'
+ALL_GENERATION_KEY = 'books:generation:all'
+STATS_KEYS = {'hit': 'books:stats:hits', 'miss': 'books:stats:misses'}
+
+
+def get_cache():
+    return caches[settings.BOOKS_CACHE_ALIAS]
+
+
+def _book_generation_key(book_id):
+    return f'books:generation:book:{book_id}'
+
+
+# Время последней смены поколения (time.time()): по нему решается, можно ли читать промах кеша с реплики.
+def _changed_at_key(key):
+    return f'{key}:changed_at'
+
+
+# Начальное значение поколения - текущее время в мс, чтобы после вытеснения ключа
+# поколение не совпало с уже использованным. Новое поколение считается только что измененным.
+def _get_generations(keys):
+    cache = get_cache()
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            now = time.time()
+            if cache.add(key, int(now * 1000), timeout=None):
+                cache.set(_changed_at_key(key), now, timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bump_generations(keys):
+    cache = get_cache()
+    now = time.time()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(now * 1000), timeout=None)
+    cache.set_many({_changed_at_key(key): now for key in keys}, timeout=None)
+
+
+# Последняя смена поколений keys, None - неизвестна (ключ вытеснен).
+def _get_changed_at(keys):
+    changed = get_cache().get_many([_changed_at_key(key) for key in keys])
+    if len(changed) < len(keys):
+        return None
+    return max(changed.values())
+
+
+# Параметры запроса в каноническом виде: отсортированы, пустые значения отброшены.
+def normalize_query(request):
+    params = sorted((key, value) for key, values in request.query_params.lists()
+                    for value in values if value != '')
+    return '&'.join(f'{key}={value}' for key, value in params)
+
+
+def _hash(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+# Текущее поколение списков: меняется при любом изменении книг и их отношений.
+def get_list_generation():
+    list_generation, = _get_generations([LIST_GENERATION_KEY])
+    return list_generation
+
+
+def list_cache_key(request):
+    return f'books:list:{get_list_generation()}:{_hash(normalize_query(request))}'
+
+
+# Фасеты зависят от тех же данных, что и список, но ключ отдельный: параметры запроса те же.
+def facets_cache_key(request):
+    return f'books:facets:{get_list_generation()}:{_hash(normalize_query(request))}'
+
+
+# Поколения, от которых зависят ответы списка и фасетов и карточка книги.
+LIST_GENERATION_KEYS = [LIST_GENERATION_KEY]
+
+
+def detail_generation_keys(book_id):
+    return [ALL_GENERATION_KEY, _book_generation_key(book_id)]
+
+
+def detail_cache_key(request, book_id):
+    all_generation, book_generation = _get_generations(detail_generation_keys(book_id))
+    return f'books:detail:{book_id}:{all_generation}:{book_generation}:{_hash(normalize_query(request))}'
+
+
+def _invalidate(keys):
+    _bump_generations(keys)
+    # Повтор после коммита: запрос, прочитавший данные до коммита, мог успеть
+    # записать их в кеш с новым поколением.
+    transaction.on_commit(lambda: _bump_generations(keys))
+
+
+# Сбросить кеш для измененных, созданных или удаленных книг.
+def invalidate_books(book_ids):
+    _invalidate([LIST_GENERATION_KEY, *(_book_generation_key(book_id) for book_id in book_ids)])
+
+
+# Сбросить весь кеш книг, например после массового пересчета.
+def invalidate_all_books():
+    _invalidate([LIST_GENERATION_KEY, ALL_GENERATION_KEY])
+
+
+def _record(result):
+    cache = get_cache()
+    try:
+        cache.incr(STATS_KEYS[result])
+    except ValueError:
+        cache.add(STATS_KEYS[result], 0, timeout=None)
+        cache.incr(STATS_KEYS[result])
+
+
+# Статистика попаданий, общая для всех процессов, если общий бэкенд кеша.
+def get_cache_stats():
+    stats = get_cache().get_many(STATS_KEYS.values())
+    hits = stats.get(STATS_KEYS['hit'], 0)
+    misses = stats.get(STATS_KEYS['miss'], 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else None}
+
+
+def reset_cache_stats():
+    get_cache().delete_many(STATS_KEYS.values())
+
+
+# Кеширование list и retrieve для анонимных пользователей. Хранятся данные ответа (response.data),
+# поэтому при попадании не выполняются ни запросы к БД, ни сериализация.
+class CachedReadMixin:
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(list_cache_key(request), LIST_GENERATION_KEYS, super().list,
+                                    request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        book_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(detail_cache_key(request, book_id), detail_generation_keys(book_id),
+                                    super().retrieve, request, *args, **kwargs)
+
+    # Вместе с данными сохраняются заголовки ETag и Last-Modified, поэтому условный запрос
+    # при попадании в кеш получает 304 совсем без обращений к БД.
+    cached_headers = ('ETag', 'Last-Modified')
+
+    # generation_keys - поколения, входящие в key. Они прочитаны до запроса к БД, поэтому изменение во время
+    # запроса записывает ответ в уже устаревший ключ.
+    def cached_response(self, key, generation_keys, view, request, *args, **kwargs):
+        from store.conditional import get_not_modified_from_headers
+
+        cache = get_cache()
+        entry = cache.get(key)
+        if entry is not None:
+            _record('hit')
+            data, headers = entry
+            not_modified = get_not_modified_from_headers(request, headers)
+            if not_modified is not None:
+                not_modified['X-Cache'] = 'HIT'
+                return not_modified
+            return Response(data, headers={**headers, 'X-Cache': 'HIT'})
+        _record('miss')
+        # Ответ хранится до TIMEOUT кеша: данные реплики, которая еще не применила последнее изменение
+        # этих поколений, попали бы в кеш с уже новым поколением. Тогда ответ читается с основной БД.
+        if replica_has_changes_since(_get_changed_at(generation_keys)):
+            response = view(request, *args, **kwargs)
+        else:
+            with use_primary():
+                response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response[name] for name in self.cached_headers if response.has_header(name)}
+            cache.set(key, (response.data, headers))
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,109 @@
+import hashlib
+from calendar import timegm
+
+from django.core.exceptions import ValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from store.cache import normalize_query
+
+
+# ETag и Last-Modified строятся по версиям (id, updated_at) отдаваемых книг и параметрам запроса.
+# updated_at меняется при изменении книги, ее лайков, оценок и читателей.
+# Для списков (with_last_modified=False) Last-Modified не отдается: удаление книги не меняет наибольший
+# updated_at оставшихся, и If-Modified-Since получал бы 304 со старым списком. ETag учитывает и id книг.
+def make_validators(request, versions, with_last_modified=True):
+    state = ','.join(f'{pk}:{updated_at.isoformat()}' for pk, updated_at in versions)
+    digest = hashlib.md5(f'{normalize_query(request)}|{state}'.encode('utf-8')).hexdigest()
+    last_modified = None
+    if with_last_modified:
+        last_modified = max((updated_at for _, updated_at in versions), default=None)
+    return f'"{digest}"', last_modified
+
+
+# 304 Not Modified, если If-None-Match / If-Modified-Since совпали с текущими значениями, иначе None.
+def get_not_modified_response(request, etag, last_modified):
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validator_headers(response, etag, last_modified)
+    return response
+
+
+# То же по сохраненным заголовкам ответа (для ответов из кеша).
+def get_not_modified_from_headers(request, headers):
+    if 'ETag' not in headers:
+        return None
+    response = get_conditional_response(request, etag=headers['ETag'],
+                                        last_modified=parse_http_date_safe(headers.get('Last-Modified')))
+    if response is not None:
+        set_validator_headers(response, headers['ETag'], None)
+    return response
+
+
+def set_validator_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+
+
+def get_versions(instances):
+    return [(instance.pk, instance.updated_at) for instance in instances]
+
+
+def is_conditional(request):
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+# Условный GET для list и retrieve. Для условного запроса сначала выполняется дешевый запрос
+# только id и updated_at той же страницы (без JOIN и сериализации) и при совпадении
+# отдается 304. Обычный ответ получает заголовки ETag и Last-Modified по тем же книгам,
+# что были сериализованы, без дополнительных запросов.
+class ConditionalGetMixin:
+    # Поля, достаточные для ETag и для позиции keyset пагинации.
+    conditional_fields = ('id', 'updated_at')
+
+    def get_conditional_queryset(self):
+        return self.get_queryset().select_related(None).prefetch_related(None).only(*self.conditional_fields)
+
+    def list(self, request, *args, **kwargs):
+        if is_conditional(request):
+            queryset = self.filter_queryset(self.get_conditional_queryset())
+            page = self.paginate_queryset(queryset)
+            instances = page if page is not None else list(queryset)
+            response = get_not_modified_response(
+                request, *make_validators(request, get_versions(instances), with_last_modified=False))
+            if response is not None:
+                return response
+        return self.with_validators(request, super().list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if is_conditional(request):
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            # Некорректный id (/book/abc/) - как в get_object: обычный путь ответит 404.
+            try:
+                instance = self.get_conditional_queryset().filter(
+                    **{self.lookup_field: kwargs[lookup_url_kwarg]}).first()
+            except (TypeError, ValueError, ValidationError):
+                instance = None
+            if instance is not None:
+                response = get_not_modified_response(request, *make_validators(request, get_versions([instance])))
+                if response is not None:
+                    return response
+        return self.with_validators(request, super().retrieve(request, *args, **kwargs))
+
+    # Запоминаем версии сериализуемых книг, чтобы построить по ним ETag.
+    # list без сериализатора (FastBookListMixin) выставляет conditional_versions сам.
+    def get_serializer(self, *args, **kwargs):
+        if args and self.action in ('list', 'retrieve'):
+            instances = list(args[0]) if kwargs.get('many') else [args[0]]
+            self.conditional_versions = get_versions(instances)
+            args = (instances if kwargs.get('many') else args[0], *args[1:])
+        return super().get_serializer(*args, **kwargs)
+
+    def with_validators(self, request, response):
+        versions = getattr(self, 'conditional_versions', None)
+        if response.status_code == 200 and versions is not None:
+            set_validator_headers(response, *make_validators(request, versions,
+                                                             with_last_modified=self.action != 'list'))
+        return response
@@ -0,0 +1,58 @@
+import functools
+
+import psycopg2
+import psycopg2.extras
+from django.db.backends.postgresql import base, creation
+
+from store.db.pool import close_pools, get_pool
+
+# Бэкенд PostgreSQL с пулом соединений внутри процесса (store/db/pool.py).
+# ENGINE 'store.db.backends.postgresql_pool', параметры пула - OPTIONS['pool']:
+# max_size, timeout, max_idle, max_lifetime, check_after (см. ConnectionPool).
+# Вместе с CONN_MAX_AGE = 0: в конце запроса Django закрывает соединение, и оно возвращается в пул.
+
+
+# Новое соединение psycopg2 так же, как в get_new_connection PostgreSQL бэкенда,
+# но без изменения DatabaseWrapper: соединение потом берут обертки разных потоков.
+def connect(conn_params, isolation_level):
+    connection = psycopg2.connect(**conn_params)
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # Свободные соединения пула к тестовой БД не дали бы ее удалить.
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        # Служебное соединение без БД (создание и удаление тестовой БД) в пул не попадает.
+        if self.settings_dict['NAME'] is None:
+            self.pool = None
+            return super().get_new_connection(conn_params)
+        options = self.settings_dict['OPTIONS']
+        self.pool = get_pool(self.alias, conn_params,
+                             functools.partial(connect, conn_params, options.get('isolation_level')),
+                             **(options.get('pool') or {}))
+        connection = self.pool.getconn()
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        return connection
+
+    # Соединение возвращается в пул. Закрытое внутри atomic или после ошибки БД - закрывается совсем.
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        self.pool.putconn(self.connection, discard=self.in_atomic_block or self.errors_occurred)
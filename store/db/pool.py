@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+# Пул соединений PostgreSQL внутри процесса (бэкенд store.db.backends.postgresql_pool).
+# Потокобезопасный: в WSGI с потоками и в ASGI (SQL идет в потоках sync_to_async) соединения
+# Django остаются у своих потоков, а сырые соединения psycopg2 берутся из общего пула процесса.
+# Если свободных нет и пул заполнен, запрос ждет до timeout секунд.
+# Отданное соединение переиспользуется, только если оно открыто и вне транзакции, иначе закрывается.
+#
+# Счетчик всех новых соединений процесса (сигнал connection_created, store/apps.py) - для CONN_MAX_AGE
+# без пула видно, сколько соединений создается на запросы.
+_created_connections = {}
+_created_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=10, timeout=10, max_idle=300, max_lifetime=3600, check_after=30):
+        # connect - функция без аргументов, создающая новое соединение psycopg2.
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        # Свободное дольше max_idle секунд или открытое дольше max_lifetime соединение закрывается.
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        # Свободное дольше check_after секунд соединение перед выдачей проверяется запросом SELECT 1.
+        self.check_after = check_after
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # Свободные соединения: (соединение, время создания, время возврата), последние возвращенные справа.
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self._waiting = 0
+        self._stats = {'created': 0, 'closed': 0, 'checkouts': 0, 'waits': 0, 'timeouts': 0,
+                       'wait_ms': 0.0, 'max_wait_ms': 0.0}
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            connection = None
+            with self._condition:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f'No free database connection in the pool after {self.timeout} s '
+                                          f'(max_size={self.max_size}).')
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    connection, created_at, returned_at = self._idle.pop()
+                else:
+                    # Место под новое соединение занимается сразу, подключение идет без блокировки.
+                    self._size += 1
+            if connection is None:
+                return self._create(start, waited)
+            # Проверка (возможно с запросом к БД) тоже без блокировки.
+            reusable = self._is_reusable(connection, created_at, returned_at)
+            with self._condition:
+                if reusable:
+                    self._checkout(start, waited)
+                    return connection
+                self._discard(connection)
+
+    def putconn(self, connection, discard=False):
+        created_at = self._created_at.get(id(connection), time.monotonic())
+        discard = (discard or time.monotonic() - created_at > self.max_lifetime or
+                   not self._is_clean(connection))
+        with self._condition:
+            if discard:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    def _create(self, start, waited):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created_at[id(connection)] = time.monotonic()
+            self._stats['created'] += 1
+            self._checkout(start, waited)
+        return connection
+
+    def close_all(self):
+        with self._condition:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            checkouts = stats['checkouts']
+            stats.update(max_size=self.max_size, size=self._size, idle=len(self._idle),
+                         in_use=self._size - len(self._idle), waiting=self._waiting,
+                         wait_ms=round(stats['wait_ms'], 3), max_wait_ms=round(stats['max_wait_ms'], 3),
+                         avg_wait_ms=round(stats['wait_ms'] / checkouts, 3) if checkouts else 0)
+            return stats
+
+    def _checkout(self, start, waited):
+        wait_ms = (time.monotonic() - start) * 1000
+        self._stats['checkouts'] += 1
+        self._stats['wait_ms'] += wait_ms
+        self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+        if waited:
+            self._stats['waits'] += 1
+
+    def _is_clean(self, connection):
+        if connection.closed:
+            return False
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status != extensions.TRANSACTION_STATUS_INTRANS:
+            return False
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _is_reusable(self, connection, created_at, returned_at):
+        now = time.monotonic()
+        if connection.closed or now - returned_at > self.max_idle or now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at <= self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, connection):
+        self._created_at.pop(id(connection), None)
+        self._size -= 1
+        self._stats['closed'] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+# Пулы процесса по ключу (алиас, параметры подключения). После fork (воркеры gunicorn) у процесса
+# свои пулы: соединения родителя не используются.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, connect, **options):
+    key = (alias, tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ConnectionPool(connect, **options)
+        return pool
+
+
+def get_pools(alias=None):
+    with _pools_lock:
+        return [(key[0], pool) for key, pool in _pools.items()
+                if pool.pid == os.getpid() and (alias is None or key[0] == alias)]
+
+
+# Закрыть свободные соединения пулов и убрать пулы из процесса, следующее соединение создаст новый пул.
+def close_pools(alias=None):
+    with _pools_lock:
+        keys = [key for key in _pools if alias is None or key[0] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close_all()
+
+
+def record_connection_created(sender, connection, **kwargs):
+    with _created_lock:
+        _created_connections[connection.alias] = _created_connections.get(connection.alias, 0) + 1
+
+
+# Метрики соединений процесса по алиасам: настройки, сколько соединений Django открыл
+# (opened - с пулом это выдачи из пула) и статистика пулов.
+def get_connection_stats():
+    from django.db import connections
+
+    stats = {}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        stats[alias] = {
+            'engine': settings_dict['ENGINE'],
+            'conn_max_age': settings_dict['CONN_MAX_AGE'],
+            'health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+            'opened': _created_connections.get(alias, 0),
+            'pools': [pool.get_stats() for _, pool in get_pools(alias)],
+        }
+    return stats
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger('store.db.routers')
+
+# Чтение с реплик (settings.REPLICA_DATABASES) для запросов GET, HEAD и OPTIONS.
+# Реплика выбирается один раз на запрос (middleware), поэтому все запросы одного ответа видят одни данные.
+# На основную БД идут:
+# - запись и чтение в запросах, которые меняют данные;
+# - чтение пользователя, который недавно что-то изменил (REPLICA_STICKY_SECONDS после PATCH,
+#   POST, PUT, DELETE), чтобы он сразу видел свой лайк или оценку. Пользователь при чтении - пользователь
+#   сессии (AuthenticationMiddleware) с подписанной cookie закрепления, клиенты с Basic авторизацией
+#   и без cookie закрепляются только на время запроса;
+# - чтение, когда все реплики отстают больше REPLICA_MAX_LAG секунд или недоступны;
+# - все, что выполняется вне запроса (команды, тесты без middleware) и внутри use_primary().
+# Маршрутизируются только модели приложений REPLICA_APP_LABELS, сессии и пользователи читаются с основной.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# БД для чтения текущего запроса. ContextVar, чтобы роутер работал и в потоках sync_to_async.
+_current_reads = ContextVar('store_replica_reads', default=None)
+
+# Отставание реплик в процессе: {алиас: (время проверки, секунды)}, проверяется не чаще
+# REPLICA_LAG_CHECK_INTERVAL секунд.
+_lag_checks = {}
+
+# Для PostgreSQL: 0, если все полученные изменения уже применены (или это не реплика), иначе время
+# с последней примененной транзакции. NULL (репликация еще не началась) - реплика не используется.
+PIN_SALT = 'store.db.routers.pin'
+
+LAG_SQL = '''
+    SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+'''
+
+
+def choose_read_alias(request):
+    if not settings.REPLICA_DATABASES or is_pinned(request):
+        return DEFAULT_DB_ALIAS
+    replicas = [alias for alias in settings.REPLICA_DATABASES if get_replica_lag(alias) <= settings.REPLICA_MAX_LAG]
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+# Чтение пользователя с основной БД следующие REPLICA_STICKY_SECONDS секунд. Отметка - подписанная cookie
+# REPLICA_PIN_COOKIE с id пользователя: ее видит любой процесс и сервер, общий кеш не нужен. Срок проверяется
+# по времени подписи, поэтому cookie, которую клиент хранит дольше, не действует.
+def pin_to_primary(response, user):
+    response.set_signed_cookie(settings.REPLICA_PIN_COOKIE, str(user.pk), salt=PIN_SALT,
+                               max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+
+
+def is_pinned(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return False
+    pinned = request.get_signed_cookie(settings.REPLICA_PIN_COOKIE, default=None, salt=PIN_SALT,
+                                       max_age=settings.REPLICA_STICKY_SECONDS)
+    return pinned == str(user.pk)
+
+
+def measure_replica_lag(alias):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float('inf') if lag is None else float(lag)
+
+
+# Отставание реплики в секундах, недоступная реплика - бесконечное отставание.
+def get_replica_lag(alias):
+    now = time.monotonic()
+    checked = _lag_checks.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        lag = measure_replica_lag(alias)
+    except DatabaseError:
+        logger.warning('Replica %s is unavailable, reading from %s', alias, DEFAULT_DB_ALIAS, exc_info=True)
+        lag = float('inf')
+    if lag > settings.REPLICA_MAX_LAG:
+        logger.info('Replica %s lags %.1f s, reading from %s', alias, lag, DEFAULT_DB_ALIAS)
+    _lag_checks[alias] = (now, lag)
+    return lag
+
+
+def reset_replica_lag():
+    _lag_checks.clear()
+
+
+# Реплика текущего запроса уже применила изменения, закоммиченные в момент since (time.time()): ее отставание
+# вместе с интервалом, на который оно запомнено, меньше прошедшего времени. Без реплики - True, чтение и так
+# с основной БД. since None (время изменения неизвестно) - False.
+def replica_has_changes_since(since):
+    alias = _current_reads.get()
+    if alias is None or alias == DEFAULT_DB_ALIAS:
+        return True
+    if since is None:
+        return False
+    return get_replica_lag(alias) + settings.REPLICA_LAG_CHECK_INTERVAL < time.time() - since
+
+
+# Чтение с основной БД внутри блока, например когда прочитанное сохраняется в кеш надолго.
+@contextmanager
+def use_primary():
+    token = _current_reads.set(None)
+    try:
+        yield
+    finally:
+        _current_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _current_reads.get()
+        if alias is None or model._meta.app_label not in settings.REPLICA_APP_LABELS:
+            return None
+        return alias
+
+    # Явно основная БД: иначе Django пишет в БД, из которой объект был прочитан.
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in settings.REPLICA_APP_LABELS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    # Схема реплик приходит с основной БД.
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+# Включает чтение с реплик на время запроса и после изменяющего запроса закрепляет пользователя
+# за основной БД. Стоит после AuthenticationMiddleware. Запросы потокового ответа (/book/export/)
+# выполняются после middleware и читают с основной БД.
+class ReplicaRoutingMiddleware:
+    # Как QueryBudgetMiddleware, работает и корутиной, чтобы async view не уходили в поток.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _current_reads.set(self.get_read_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_reads.reset(token)
+        self.pin(request, response)
+        return response
+
+    # Выбор реплики читает request.user из сессии, это делается в потоке, а не в event loop.
+    async def __acall__(self, request):
+        token = _current_reads.set(await sync_to_async(self.get_read_alias)(request)
+                                   if settings.REPLICA_DATABASES else self.get_read_alias(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_reads.reset(token)
+        if request.method not in SAFE_METHODS and settings.REPLICA_DATABASES:
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    # БД выбирается сразу, а не при первом запросе view: async view строят queryset в event loop,
+    # где request.user загрузить нельзя.
+    def get_read_alias(self, request):
+        if request.method not in SAFE_METHODS:
+            return None
+        return choose_read_alias(request)
+
+    # request.user здесь уже пользователь аутентификации DRF: Request DRF записывает его в запрос Django.
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or not settings.REPLICA_DATABASES:
+            return
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(response, user)
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+from .fast_serializers import BOOK_VALUES, get_converters
+
+# Выгрузка каталога построчно. Книги читаются через .iterator(chunk_size) - в PostgreSQL это
+# серверный курсор, поэтому в памяти одновременно не больше chunk_size строк, независимо от размера таблицы.
+# Значения берутся через values_list, без создания моделей и сериализатора на каждую книгу,
+# в том же виде, что и в ответе API (поля и преобразования быстрого списка, fast_serializers.py).
+#
+# Поле ответа API -> выражение для values_list.
+EXPORT_FIELDS = BOOK_VALUES
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'books.ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'books.csv'),
+}
+DEFAULT_CHUNK_SIZE = 2000
+# Один энкодер на все строки: json.dumps с параметрами создает новый JSONEncoder на каждый вызов.
+_json_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+def iter_export_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Выражения передаются через annotate, простые поля - по имени.
+    expressions = {name: value for name, value in EXPORT_FIELDS.items() if not isinstance(value, str)}
+    columns = [name if name in expressions else value for name, value in EXPORT_FIELDS.items()]
+    converters = dict(get_converters())
+    converters = [converters[name] for name in EXPORT_FIELDS]
+    rows = queryset.annotate(**expressions).values_list(*columns).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield [value if convert is None else convert(value) for convert, value in zip(converters, row)]
+
+
+# Строки отдаются пачками по chunk_size записей, а не по одной, чтобы не дробить ответ.
+def _batched(lines, chunk_size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= chunk_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+# Один JSON объект на строку.
+def iter_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    names = list(EXPORT_FIELDS)
+    lines = (_json_encoder.encode(dict(zip(names, row))) + '\n'
+             for row in iter_export_rows(queryset, chunk_size))
+    return _batched(lines, chunk_size)
+
+
+# CSV с заголовком, пустой рейтинг - пустая ячейка.
+def iter_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def write(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    yield write(EXPORT_FIELDS)
+    lines = (write(row) for row in iter_export_rows(queryset, chunk_size))
+    yield from _batched(lines, chunk_size)
+
+
+def iter_export(queryset, export_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    if export_format == 'csv':
+        return iter_csv(queryset, chunk_size)
+    return iter_ndjson(queryset, chunk_size)
@@ -0,0 +1,72 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, Count, IntegerField, Value, When
+
+# Фасеты списка книг: /book/facets/ с теми же фильтрами и поиском, что и /book/. Количество книг
+# по диапазонам цен BOOKS_PRICE_FACET_BUCKETS и BOOKS_AUTHOR_FACET_SIZE авторов с наибольшим количеством книг.
+# Все фасеты считаются одним запросом по отфильтрованным книгам, список книг не загружается:
+# - в PostgreSQL - GROUP BY GROUPING SETS ((диапазон), (автор)), первые авторы отбираются в том же запросе
+#   оконной функцией. Без фильтров и поиска книги читаются только из индекса store_book_price_id_author_idx
+#   (price, id) INCLUDE (author_name);
+# - в остальных БД - GROUP BY (диапазон, автор), суммы по диапазонам и авторам считаются в Python.
+
+
+# Номер диапазона цены: 0 - меньше первой границы, len(границ) - не меньше последней.
+def price_bucket(edges):
+    return Case(*[When(price__lt=edge, then=Value(number)) for number, edge in enumerate(edges)],
+                default=Value(len(edges)), output_field=IntegerField())
+
+
+def get_facets(queryset):
+    edges = settings.BOOKS_PRICE_FACET_BUCKETS
+    size = settings.BOOKS_AUTHOR_FACET_SIZE
+    rows = queryset.order_by().annotate(price_bucket=price_bucket(edges)).values('price_bucket', 'author_name')
+    if connections[queryset.db].vendor == 'postgresql':
+        buckets, authors = _grouping_sets(rows, size)
+    else:
+        buckets, authors = _grouped(rows, size)
+    bounds = [None, *(_price(edge) for edge in edges), None]
+    return {
+        'count': sum(buckets.values()),
+        'price': [{'min': bounds[number], 'max': bounds[number + 1], 'count': buckets.get(number, 0)}
+                  for number in range(len(edges) + 1)],
+        'authors': [{'author_name': author_name, 'count': count} for author_name, count in authors],
+    }
+
+
+def _price(value):
+    return str(Decimal(value).quantize(Decimal('0.01')))
+
+
+# Один запрос: строки диапазонов (is_author = 0) и первые size строк авторов.
+def _grouping_sets(rows, size):
+    subquery, params = rows.query.get_compiler(using=rows.db).as_sql()
+    sql = f'''
+        SELECT price_bucket, author_name, is_author, books FROM (
+            SELECT price_bucket, author_name, GROUPING(price_bucket) AS is_author, COUNT(*) AS books,
+                   ROW_NUMBER() OVER (PARTITION BY GROUPING(price_bucket)
+                                      ORDER BY COUNT(*) DESC, author_name) AS position
+            FROM ({subquery}) filtered
+            GROUP BY GROUPING SETS ((price_bucket), (author_name))
+        ) facets
+        WHERE is_author = 0 OR position <= %s
+        ORDER BY is_author, position
+    '''
+    with connections[rows.db].cursor() as cursor:
+        cursor.execute(sql, (*params, size))
+        result = cursor.fetchall()
+    buckets = {bucket: count for bucket, _, is_author, count in result if not is_author}
+    authors = [(author_name, count) for _, author_name, is_author, count in result if is_author]
+    return buckets, authors
+
+
+# Один запрос по парам (диапазон, автор), пар не больше, чем книг.
+def _grouped(rows, size):
+    buckets, authors = Counter(), Counter()
+    for row in rows.annotate(books=Count('*')):
+        buckets[row['price_bucket']] += row['books']
+        authors[row['author_name']] += row['books']
+    return dict(buckets), sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:size]
@@ -0,0 +1,115 @@
+import decimal
+from functools import lru_cache
+
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .logic_readers import get_readers_preview
+from .profiling import profile_section
+from .serializers import BooksSerializer
+
+# Быстрое чтение книг для списка и выгрузки. Строки берутся через .values() и сразу собираются
+# в словари ответа по заранее подготовленному списку полей, без моделей и полей DRF на каждую книгу.
+# Результат совпадает с BooksSerializer байт в байт (store/tests/test_serializers.py),
+# замеры: python manage.py benchmark serializers.
+#
+# Поле ответа -> поле или выражение для values(). Порядок - BooksSerializer.Meta.fields,
+# readers добавляется отдельно одним запросом на страницу.
+BOOK_VALUES = {
+    'id': 'id',
+    'name': 'name',
+    'price': 'price',
+    'author_name': 'author_name',
+    'annotated_likes': F('likes_count'),
+    'rating': 'rating',
+    # owner_name в BooksSerializer - default='' для книги без владельца.
+    'owner_name': Coalesce('owner__username', Value('')),
+    'readers_count': 'readers_count',
+}
+
+
+# Queryset словарей с полями BOOK_VALUES и extra (например updated_at для ETag или rank для пагинации).
+def book_values(queryset, *extra):
+    names = [value for value in BOOK_VALUES.values() if isinstance(value, str)]
+    expressions = {name: value for name, value in BOOK_VALUES.items() if not isinstance(value, str)}
+    return queryset.values(*names, *extra, **expressions)
+
+
+# Преобразование значения как в DecimalField.to_representation: то же округление и точность.
+def decimal_formatter(field):
+    places = field.decimal_places
+    exponent = decimal.Decimal('.1') ** places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    max_length = (field.max_digits or 0) + 1
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+
+    def to_representation(value):
+        if value is None:
+            return None
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        if coerce_to_string:
+            # Значение из столбца numeric(max_digits, decimal_places) обычно уже с нужным количеством
+            # знаков после точки, quantize его не меняет, а стоит в несколько раз дороже str.
+            text = str(value)
+            if (places and text[-places - 1:-places] == '.' and 'E' not in text and
+                    (field.max_digits is None or len(text.lstrip('-')) <= max_length)):
+                return text
+        value = value.quantize(exponent, rounding=field.rounding, context=context)
+        return '{:f}'.format(value) if coerce_to_string else value
+    return to_representation
+
+
+# Поля ответа с преобразованием значения, собираются один раз по полям BooksSerializer:
+# [(поле, функция или None)] в порядке Meta.fields. None - значение из БД отдается как есть
+# (id, строки, счетчики и список читателей).
+@lru_cache(maxsize=None)
+def get_converters():
+    fields = BooksSerializer().fields
+    converters = []
+    for name, field in fields.items():
+        if isinstance(field, serializers.DecimalField):
+            convert = field.to_representation if field.localize else decimal_formatter(field)
+        else:
+            convert = None
+        converters.append((name, convert))
+    return converters
+
+
+# Словари ответа по строкам book_values. preview - уже загруженные читатели {book_id: [...]},
+# по умолчанию запрашиваются одним запросом на все строки.
+def serialize_book_rows(rows, preview=None):
+    with profile_section('serialize'):
+        converters = get_converters()
+        if preview is None:
+            preview = get_readers_preview([row['id'] for row in rows])
+        data = []
+        for row in rows:
+            row['readers'] = preview[row['id']]
+            data.append({name: row[name] if convert is None else convert(row[name])
+                         for name, convert in converters})
+        return data
+
+
+# list книг через book_values и serialize_book_rows вместо BooksSerializer(many=True).
+# Стоит в базовых классах после ConditionalGetMixin: ETag строится по id и updated_at тех же строк.
+class FastBookListMixin:
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        extra = ['updated_at']
+        # Сортировка по rank из поиска: значение нужно для позиции keyset пагинации.
+        if 'rank' in queryset.query.annotations:
+            extra.append('rank')
+        rows = book_values(queryset, *extra)
+        page = self.paginate_queryset(rows)
+        rows = page if page is not None else list(rows)
+        self.conditional_versions = [(row['id'], row['updated_at']) for row in rows]
+        data = serialize_book_rows(rows)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,75 @@
+import re
+
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from rest_framework.filters import SearchFilter, OrderingFilter
+
+from .models import Book, UserBookRelation
+from .pagination import with_tie_breaker
+
+
+# Полнотекстовый поиск по Book.search_vector (GIN индекс) вместо ILIKE '%term%'.
+# Параметр ?search= прежний. Каждое слово ищется как префикс лексемы, все слова обязательны,
+# что близко к поведению SearchFilter. Найденным книгам аннотируется релевантность rank,
+# отсортировать по ней можно через ?ordering=-rank.
+# В БД без полнотекстового поиска (SQLite в тестах) используется обычный SearchFilter.
+class BookSearchFilter(SearchFilter):
+    # Конфигурация to_tsvector, должна совпадать с триггером из миграции 0012.
+    search_config = 'simple'
+    word_re = re.compile(r'\w+')
+
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        words = [word for term in terms for word in self.word_re.findall(term)]
+        if not words:
+            # Поиск только из знаков препинания ничего не находит, как и ILIKE.
+            return queryset.none()
+        # Слова состоят только из \w, поэтому их можно безопасно собрать в raw tsquery.
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words),
+                            config=self.search_config, search_type='raw')
+        # Приведение к double precision, чтобы значение rank точно переносилось в курсор пагинации.
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()))
+
+
+# OrderingFilter, который разрешает сортировку по rank только когда она посчитана поиском.
+class BookOrderingFilter(OrderingFilter):
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = super().remove_invalid_fields(queryset, fields, view, request)
+        return [field for field in fields
+                if field.lstrip('-') != 'rank' or 'rank' in queryset.query.annotations]
+
+    # Сортировка дополняется id, как в keyset пагинации (store/pagination.py).
+    def get_ordering(self, request, queryset, view):
+        return with_tie_breaker(super().get_ordering(request, queryset, view))
+
+
+# Фильтры списка книг: ?price= - точная цена, как раньше, ?price_min= и ?price_max= - диапазон цен,
+# границы включаются. Диапазон читается по индексу store_book_price_id_author_idx.
+class BookFilter(django_filters.FilterSet):
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+
+    class Meta:
+        model = Book
+        fields = ['price', 'price_min', 'price_max']
+
+
+# Фильтры библиотеки пользователя (/book_relation/library/): ?like=true, ?in_bookmarks=true, ?rated=true,
+# false - книги без лайка, закладки или оценки. Фильтры можно сочетать.
+class LibraryFilter(django_filters.FilterSet):
+    like = django_filters.BooleanFilter()
+    in_bookmarks = django_filters.BooleanFilter()
+    rated = django_filters.BooleanFilter(field_name='rate', lookup_expr='isnull', exclude=True)
+
+    class Meta:
+        model = UserBookRelation
+        fields = ['like', 'in_bookmarks', 'rated']
@@ -0,0 +1,332 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Q
+
+from store.cache import invalidate_all_books
+from store.leaderboards import record_like_activity, update_leaderboards
+from store.logic_relations import recount_books
+from store.models import Book, UserBookRelation
+
+# Импорт книг и отношений из больших CSV/NDJSON файлов. Файл читается построчно и обрабатывается
+# пачками по chunk_size строк: на пачку один запрос пользователей, один запрос книг или отношений
+# и bulk_create/bulk_update, каждая пачка в своей транзакции.
+# Строки разбираются вручную, без сериализаторов DRF: на миллионах строк они занимают больше времени, чем БД.
+DEFAULT_CHUNK_SIZE = 5000
+# Сколько сообщений об ошибках в строках сохранять в результате.
+MAX_ERRORS = 20
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'', '0', 'false', 'f', 'no', 'n'}
+
+
+class RowError(ValueError):
+    pass
+
+
+# Строки файла как словари. Формат определяется по расширению, если не задан.
+# Строка NDJSON, которая не разбирается, передается как RowError: Importer пропускает ее, как другие ошибочные.
+def read_rows(path, file_format=None):
+    file_format = file_format or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    with open(path, encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as error:
+                        yield RowError(f'invalid JSON: {error}')
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _text(row, name, required=True):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'{name} is required')
+    return value
+
+
+def _int(row, name, required=True):
+    value = row.get(name)
+    if value in (None, '') and not required:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{name} must be an integer')
+
+
+def _bool(row, name):
+    value = row.get(name)
+    if isinstance(value, bool):
+        return value
+    value = '' if value is None else str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'{name} must be a boolean')
+
+
+def _price(row):
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError('price must be a decimal')
+    if not price.is_finite() or price.adjusted() >= 5:
+        raise RowError('price is out of range')
+    return price
+
+
+def _rate(row):
+    rate = _int(row, 'rate', required=False)
+    if rate is not None and rate not in dict(UserBookRelation.RATE_CHOICES):
+        raise RowError('rate must be between 1 and 5')
+    return rate
+
+
+class Importer:
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, create_users=False):
+        self.chunk_size = chunk_size
+        self.create_users = create_users
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+
+    def error(self, number, message):
+        self.stats['skipped'] += 1
+        if len(self.stats['errors']) < MAX_ERRORS:
+            self.stats['errors'].append(f'row {number}: {message}')
+
+    # Пользователи пачки одним запросом: username -> id. С create_users недостающие создаются.
+    def resolve_users(self, usernames):
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        missing = set(usernames) - set(users)
+        if missing and self.create_users:
+            User.objects.bulk_create([User(username=username) for username in missing], ignore_conflicts=True)
+            users.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+        return users
+
+    def run(self, rows):
+        for chunk in chunked(enumerate(rows, start=1), self.chunk_size):
+            self.stats['rows'] += len(chunk)
+            with transaction.atomic():
+                self.import_chunk(self.valid_rows(chunk))
+        self.finish()
+        return self.stats
+
+    # Строки-словари пачки. Неразобранные строки (RowError из read_rows) и не объекты JSON пропускаются.
+    def valid_rows(self, chunk):
+        valid = []
+        for number, row in chunk:
+            if isinstance(row, RowError):
+                self.error(number, row)
+            elif not isinstance(row, dict):
+                self.error(number, 'row must be an object')
+            else:
+                valid.append((number, row))
+        return valid
+
+    # chunk - список пар (номер строки, словарь строки).
+    def import_chunk(self, chunk):
+        raise NotImplementedError
+
+    def finish(self):
+        invalidate_all_books()
+
+
+# Книги: name, price, author_name, необязательные id и owner (username).
+# Строки с id, уже существующим в БД, обновляют книгу (INSERT ... ON CONFLICT DO UPDATE),
+# поэтому повторный импорт того же файла не создает дубликаты.
+class BookImporter(Importer):
+    update_fields = ['name', 'price', 'author_name', 'owner']
+
+    def import_chunk(self, chunk):
+        parsed = []
+        for number, row in chunk:
+            try:
+                parsed.append((number, _int(row, 'id', required=False), _text(row, 'name'), _price(row),
+                               _text(row, 'author_name'), _text(row, 'owner', required=False)))
+            except RowError as error:
+                self.error(number, error)
+        owners = self.resolve_users({owner for *_, owner in parsed if owner})
+
+        with_id, without_id = {}, []
+        for number, book_id, name, price, author_name, owner in parsed:
+            if owner and owner not in owners:
+                self.error(number, f'unknown owner {owner}')
+                continue
+            book = Book(id=book_id, name=name, price=price, author_name=author_name, owner_id=owners.get(owner))
+            if book_id is None:
+                without_id.append(book)
+            else:
+                # Повтор id в пачке: остается последняя строка.
+                with_id[book_id] = book
+        if with_id:
+            existing = set(Book.objects.filter(pk__in=with_id).values_list('pk', flat=True))
+            Book.objects.bulk_create(with_id.values(), update_conflicts=True, unique_fields=['id'],
+                                     update_fields=[*self.update_fields, 'updated_at'])
+            self.stats['updated'] += len(existing)
+            self.stats['created'] += len(with_id) - len(existing)
+            # После вставки с явными id последовательность отстает, сдвигаем ее сразу,
+            # чтобы книги без id из следующих строк не получили занятые id.
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Book]):
+                    cursor.execute(sql)
+        Book.objects.bulk_create(without_id)
+        self.stats['created'] += len(without_id)
+
+
+# Отношения: user (username), book (id), необязательные like, in_bookmarks, rate.
+# Строка задает отношение целиком: существующее отношение пользователя с книгой перезаписывается
+# (не указанные поля получают значения по умолчанию), новое создается.
+# Счетчики книг не обновляются построчно, а пересчитываются в конце одним проходом по затронутым книгам.
+class RelationImporter(Importer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.affected_books = set()
+
+    def import_chunk(self, chunk):
+        parsed = {}
+        for number, row in chunk:
+            try:
+                key = (_text(row, 'user'), _int(row, 'book'))
+                # Повтор пары в пачке: остается последняя строка.
+                parsed[key] = (number, _bool(row, 'like'), _bool(row, 'in_bookmarks'), _rate(row))
+            except RowError as error:
+                self.error(number, error)
+        users = self.resolve_users({username for username, _ in parsed})
+        books = set(Book.objects.filter(pk__in={book_id for _, book_id in parsed}).values_list('pk', flat=True))
+
+        # (user_id, book_id) -> (like, in_bookmarks, rate)
+        relations = {}
+        for (username, book_id), (number, *values) in parsed.items():
+            if username not in users:
+                self.error(number, f'unknown user {username}')
+            elif book_id not in books:
+                self.error(number, f'unknown book {book_id}')
+            else:
+                relations[(users[username], book_id)] = tuple(values)
+        if not relations:
+            return
+
+        existing = find_relations(list(relations))
+        created = [(*key, *values) for key, values in relations.items() if key not in existing]
+        updated = [(existing[key][0], *values) for key, values in relations.items() if key in existing]
+        insert_relations(created)
+        update_relations(updated)
+        # Лайки по часам для лидерборда trending, как при изменении отношений через API.
+        like_deltas = {}
+        for key, (like, *_) in relations.items():
+            delta = int(like) - int(existing[key][1] if key in existing else False)
+            if delta:
+                like_deltas[key[1]] = like_deltas.get(key[1], 0) + delta
+        record_like_activity(like_deltas)
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(updated)
+        self.affected_books.update(book_id for _, book_id in relations)
+
+    def finish(self):
+        affected = sorted(self.affected_books)
+        for chunk in chunked(affected, self.chunk_size):
+            with transaction.atomic():
+                recount_books(chunk)
+                update_leaderboards(chunk)
+        self.stats['recounted_books'] = len(affected)
+        super().finish()
+
+
+def _relation_columns(*names):
+    return ', '.join(connection.ops.quote_name(UserBookRelation._meta.get_field(name).column) for name in names)
+
+
+# Существующие отношения пар [(user_id, book_id)]: {(user_id, book_id): (id, like)}. Ищутся именно пары,
+# а не user_id IN (...) AND book_id IN (...): произведение пользователей и книг пачки у активных
+# пользователей и популярных книг во много раз больше самой пачки. В PostgreSQL - JOIN с unnest по индексу
+# (user, book), в остальных БД - OR пар, по FIND_RELATIONS_BATCH пар в запросе (глубина выражения в SQLite).
+FIND_RELATIONS_BATCH = 100
+
+
+def find_relations(pairs):
+    if not pairs:
+        return {}
+    if connection.vendor != 'postgresql':
+        found = {}
+        for batch in chunked(pairs, FIND_RELATIONS_BATCH):
+            condition = Q()
+            for user_id, book_id in batch:
+                condition |= Q(user_id=user_id, book_id=book_id)
+            found.update(((user_id, book_id), (relation_id, like)) for user_id, book_id, relation_id, like in
+                         UserBookRelation.objects.filter(condition).values_list('user_id', 'book_id', 'id', 'like'))
+        return found
+    user, book, like = _relation_columns('user'), _relation_columns('book'), connection.ops.quote_name('like')
+    sql = f'''
+        SELECT relation.{user}, relation.{book}, relation.id, relation.{like}
+        FROM unnest(%s::integer[], %s::bigint[]) AS pairs(user_id, book_id)
+        JOIN {UserBookRelation._meta.db_table} relation
+            ON relation.{user} = pairs.user_id AND relation.{book} = pairs.book_id
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(column) for column in zip(*pairs)])
+        return {(user_id, book_id): (relation_id, like) for user_id, book_id, relation_id, like in cursor.fetchall()}
+
+
+# Вставка отношений [(user_id, book_id, like, in_bookmarks, rate)]. В PostgreSQL одним
+# INSERT ... SELECT FROM unnest(массивы): bulk_create тратит больше времени на создание моделей
+# и сборку SQL в Python, чем БД на вставку. В остальных БД - bulk_create.
+# Отношение, созданное другим запросом после чтения существующих, перезаписывается (ON CONFLICT (user, book)
+# DO UPDATE), как и найденные: иначе уникальный индекс отменил бы всю пачку. Пары в rows не повторяются.
+def insert_relations(rows):
+    if not rows:
+        return
+    if connection.vendor != 'postgresql':
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user_id=user_id, book_id=book_id, like=like, in_bookmarks=in_bookmarks, rate=rate)
+             for user_id, book_id, like, in_bookmarks, rate in rows],
+            update_conflicts=True, unique_fields=['user', 'book'], update_fields=['like', 'in_bookmarks', 'rate'])
+        return
+    columns = _relation_columns('user', 'book', 'like', 'in_bookmarks', 'rate')
+    like, in_bookmarks, rate = (connection.ops.quote_name(name) for name in ('like', 'in_bookmarks', 'rate'))
+    sql = f'''
+        INSERT INTO {UserBookRelation._meta.db_table} ({columns})
+        SELECT * FROM unnest(%s::integer[], %s::bigint[], %s::boolean[], %s::boolean[], %s::smallint[])
+        ON CONFLICT ({_relation_columns('user', 'book')}) DO UPDATE
+        SET {like} = EXCLUDED.{like}, {in_bookmarks} = EXCLUDED.{in_bookmarks}, {rate} = EXCLUDED.{rate}
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(column) for column in zip(*rows)])
+
+
+# Обновление отношений [(id, like, in_bookmarks, rate)]. В PostgreSQL - UPDATE ... FROM unnest,
+# bulk_update строит CASE WHEN на каждую строку, и его время растет квадратично с размером пачки.
+def update_relations(rows):
+    if not rows:
+        return
+    if connection.vendor != 'postgresql':
+        UserBookRelation.objects.bulk_update(
+            [UserBookRelation(id=relation_id, like=like, in_bookmarks=in_bookmarks, rate=rate)
+             for relation_id, like, in_bookmarks, rate in rows], ['like', 'in_bookmarks', 'rate'])
+        return
+    like, in_bookmarks, rate = (connection.ops.quote_name(name) for name in ('like', 'in_bookmarks', 'rate'))
+    sql = f'''
+        UPDATE {UserBookRelation._meta.db_table} relation
+        SET {like} = rows.{like}, {in_bookmarks} = rows.{in_bookmarks}, {rate} = rows.{rate}
+        FROM unnest(%s::bigint[], %s::boolean[], %s::boolean[], %s::smallint[])
+            AS rows(id, {like}, {in_bookmarks}, {rate})
+        WHERE relation.id = rows.id
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(column) for column in zip(*rows)])
+
+
+IMPORTERS = {'books': BookImporter, 'relations': RelationImporter}
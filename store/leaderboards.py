@@ -0,0 +1,195 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Subquery, Sum
+from django.utils import timezone
+
+from store.db.routers import use_primary
+from store.models import Book, BookLikeActivity, Leaderboard, LeaderboardEntry
+from store.serializers import LeaderboardBookSerializer
+
+# Лидерборды книг: /book/leaderboards/{board}/. Ответ не считается на каждый запрос, а читается из таблицы
+# LeaderboardEntry - первых LEADERBOARD_SIZE книг каждого лидерборда, общей для всех процессов.
+# - Запись отношений поддерживает счетчики книги (rating, rate_count, likes_count), лайки по часам
+#   (record_like_activity) и сразу за ними лидерборды затронутых книг (update_leaderboards): новые
+#   значения этих книг сливаются с сохраненными первыми книгами, остальные книги не читаются.
+# - Перестроение - запросы с LIMIT по индексам (store_book_top_rated_idx, store_book_most_liked_idx,
+#   store_like_activity_hour_idx). Его выполняет команда refresh_leaderboards (по расписанию: лайки
+#   уходят из окна trending без записи отношений) и запись отношения, после которой книга лидерборда
+#   опустилась ниже прежнего последнего места - тогда на ее место может подняться книга не из лидерборда.
+
+
+# Начало текущего часа в UTC - строка BookLikeActivity, в которую пишутся лайки.
+def current_hour():
+    return timezone.now().replace(minute=0, second=0, microsecond=0)
+
+
+# Учесть изменение лайков книг {book_id: +n или -n} в текущем часе одним INSERT ... ON CONFLICT.
+# Вызывается при изменении UserBookRelation.like через ORM, в upsert_relation то же делает его CTE.
+def record_like_activity(deltas):
+    rows = [(book_id, delta) for book_id, delta in deltas.items() if delta]
+    if not rows:
+        return
+    hour = connection.ops.adapt_datetimefield_value(current_hour())
+    table = connection.ops.quote_name(BookLikeActivity._meta.db_table)
+    values = ', '.join(['(%s, %s, %s)'] * len(rows))
+    params = [value for book_id, delta in rows for value in (book_id, hour, delta)]
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} AS activity (book_id, hour, likes) VALUES {values} '
+                       f'ON CONFLICT (book_id, hour) DO UPDATE SET likes = activity.likes + EXCLUDED.likes', params)
+
+
+# Начало окна trending: LEADERBOARD_TRENDING_HOURS часов вместе с текущим.
+def trending_cutoff():
+    return current_hour() - timedelta(hours=settings.LEADERBOARD_TRENDING_HOURS - 1)
+
+
+# Удалить лайки по часам, вышедшие из окна trending.
+def prune_like_activity():
+    return BookLikeActivity.objects.filter(hour__lt=trending_cutoff()).delete()[0]
+
+
+# Лидерборды: имя -> функция, которая возвращает [(book_id, score, tiebreak)] в порядке мест:
+# первые size книг или, с book_ids, те из этих книг, которые проходят условия лидерборда.
+def top_rated(size, book_ids=None):
+    books = Book.objects.filter(rating__isnull=False, rate_count__gte=settings.LEADERBOARD_MIN_VOTES)
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    return list(books.order_by('-rating', '-rate_count', 'id').values_list('id', 'rating', 'rate_count')[:size])
+
+
+def most_liked(size, book_ids=None):
+    books = Book.objects.filter(likes_count__gt=0)
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    return [(book_id, likes, 0) for book_id, likes in
+            books.order_by('-likes_count', 'id').values_list('id', 'likes_count')[:size]]
+
+
+# Лайки за окно минус снятые за окно. Учитываются только книги с положительной суммой.
+def trending(size, book_ids=None):
+    # Строки удаленных книг пропускаются: они заняли бы места в лидерборде.
+    books = Book.objects.all()
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    rows = BookLikeActivity.objects.filter(hour__gte=trending_cutoff(), book__in=books.values('pk')).values(
+        'book').annotate(recent_likes=Sum('likes')).filter(recent_likes__gt=0).order_by('-recent_likes', 'book')
+    return [(row['book'], row['recent_likes'], 0) for row in rows[:size]]
+
+
+LEADERBOARDS = {
+    'top-rated': top_rated,
+    'most-liked': most_liked,
+    'trending': trending,
+}
+
+
+# Лидерборды, на которые влияет изменение отношения: оценка - top-rated, лайк - most-liked и trending.
+def affected_boards(rate_changed, like_changed):
+    return [*(['top-rated'] if rate_changed else []), *(['most-liked', 'trending'] if like_changed else [])]
+
+
+# Ключ места: больше - выше.
+def _rank_key(book_id, value):
+    score, tiebreak = value
+    return score, tiebreak, -book_id
+
+
+def _top(values, size):
+    return sorted(values.items(), key=lambda item: _rank_key(*item), reverse=True)[:size]
+
+
+# Записать разницу между сохраненными строками лидербордов и новыми: {board: ({book_id: (score, tiebreak)}, новые)}.
+# Строки с теми же значениями не переписываются, лишние удаляются одним DELETE.
+def _save_entries(changes):
+    stale = Q()
+    entries = []
+    for board, (saved, rows) in changes.items():
+        removed = saved.keys() - rows.keys()
+        if removed:
+            stale |= Q(board=board, book__in=removed)
+        entries.extend(LeaderboardEntry(board=board, book_id=book_id, score=score, tiebreak=tiebreak)
+                       for book_id, (score, tiebreak) in rows.items() if saved.get(book_id) != (score, tiebreak))
+    if stale:
+        LeaderboardEntry.objects.filter(stale).delete()
+    LeaderboardEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['board', 'book'],
+                                         update_fields=['score', 'tiebreak'])
+
+
+def _saved_entries(boards):
+    saved = {board: {} for board in boards}
+    for board, book_id, score, tiebreak in LeaderboardEntry.objects.filter(board__in=boards).values_list(
+            'board', 'book', 'score', 'tiebreak'):
+        saved[board][book_id] = (score, tiebreak)
+    return saved
+
+
+# Обновить лидерборды boards после изменения счетчиков книг book_ids. Вызывается записью отношений
+# сразу после UPDATE счетчиков. Книги вне лидерборда не выше его последнего места, поэтому новые
+# значения затронутых книг, слитые с сохраненными, дают точные первые места. Если же полный лидерборд
+# после слияния ниже прежнего последнего места (книга опустилась или выбыла), он перестраивается.
+# Без блокировки: одновременные записи могут ненадолго оставить лидерборд неточным,
+# до следующего изменения тех же книг или refresh_leaderboards.
+def update_leaderboards(book_ids, boards=tuple(LEADERBOARDS)):
+    book_ids = set(book_ids)
+    if not book_ids or not boards:
+        return
+    size = settings.LEADERBOARD_SIZE
+    changes = {}
+    # С основной БД: значения отстающей реплики остались бы в лидерборде.
+    with use_primary():
+        saved = _saved_entries(boards)
+        for board in boards:
+            entries = saved[board]
+            fresh = {book_id: (score, tiebreak) for book_id, score, tiebreak in LEADERBOARDS[board](None, book_ids)}
+            if all(entries.get(book_id) == fresh.get(book_id) for book_id in book_ids):
+                continue
+            merged = {book_id: value for book_id, value in entries.items() if book_id not in book_ids}
+            merged.update(fresh)
+            rows = _top(merged, size)
+            if len(entries) >= size and (len(rows) < size or _rank_key(*rows[-1]) < min(
+                    _rank_key(*item) for item in entries.items())):
+                rows = [(book_id, (score, tiebreak)) for book_id, score, tiebreak in LEADERBOARDS[board](size)]
+            changes[board] = (entries, dict(rows))
+    _save_entries(changes)
+
+
+# Перестроить лидерборд с нуля. Возвращает количество книг в нем.
+def refresh_leaderboard(board):
+    with use_primary():
+        rows = {book_id: (score, tiebreak) for book_id, score, tiebreak in
+                LEADERBOARDS[board](settings.LEADERBOARD_SIZE)}
+        saved = _saved_entries([board])[board]
+    with transaction.atomic():
+        _save_entries({board: (saved, rows)})
+        Leaderboard.objects.update_or_create(name=board, defaults={'computed_at': timezone.now()})
+    return len(rows)
+
+
+def refresh_leaderboards():
+    return {board: refresh_leaderboard(board) for board in LEADERBOARDS}
+
+
+# Лидерборд для ответа: первые limit книг одним запросом по индексу (board, book) - строк не больше
+# LEADERBOARD_SIZE. computed_at - время последнего перестроения, между перестроениями лидерборд
+# обновляется записью отношений. Удаленные книги пропускаются.
+def get_leaderboard(board, limit):
+    serializer = LeaderboardBookSerializer()
+    computed_at = Leaderboard.objects.filter(name=board).values('computed_at')
+    entries = list(LeaderboardEntry.objects.filter(board=board).select_related('book').only(
+        'score', 'book', *(f'book__{field}' for field in LeaderboardBookSerializer.Meta.fields)).annotate(
+        computed_at=Subquery(computed_at)).order_by('-score', '-tiebreak', 'book')[:limit])
+    if entries:
+        computed_at = entries[0].computed_at
+    else:
+        computed_at = computed_at.values_list('computed_at', flat=True).first()
+    results = []
+    for rank, entry in enumerate(entries, start=1):
+        # Рейтинг в score - строкой, как поле rating, лайки - числом.
+        if board == 'top-rated':
+            score = serializer.fields['rating'].to_representation(entry.score)
+        else:
+            score = int(entry.score)
+        results.append({'rank': rank, **serializer.to_representation(entry.book), 'score': score})
+    return {'computed_at': computed_at.isoformat() if computed_at else None, 'results': results}
@@ -0,0 +1,29 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+from store.models import Book, UserBookRelation
+
+
+# Поля для UPDATE книги при изменении лайка: +1 или -1 к likes_count.
+def like_change_updates(old_like, new_like):
+    if bool(old_like) == bool(new_like):
+        return {}
+    return {'likes_count': F('likes_count') + (1 if new_like else -1)}
+
+
+# Подзапрос с реальным количеством лайков книги.
+def _likes_subquery():
+    likes = UserBookRelation.objects.filter(book=OuterRef('pk'), like=True).values('book')
+    return Coalesce(Subquery(likes.annotate(total=Count('id')).values('total')), 0)
+
+
+# Пересчет likes_count с нуля одним UPDATE. books - queryset или список id, по умолчанию все книги.
+def rebuild_likes(books=None):
+    queryset = Book.objects.all() if books is None else Book.objects.filter(pk__in=books)
+    return queryset.update(likes_count=_likes_subquery(), updated_at=Now())
+
+
+# Книги, у которых likes_count расходится с отношениями.
+def find_like_mismatches():
+    return Book.objects.annotate(real_likes_count=_likes_subquery()).exclude(
+        likes_count=F('real_likes_count'))
@@ -1,14 +1,72 @@
-from django.db.models import Avg
+from decimal import Decimal, ROUND_HALF_UP
 
-from store.models import UserBookRelation
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, Now, Round
 
+from store.models import Book, UserBookRelation
 
-# Функция по установке рейтинга.
+
+# Рейтинг из счетчиков: среднее с округлением до сотых, None если оценок нет.
+def calculate_rating(rate_sum, rate_count):
+    if not rate_count:
+        return None
+    return (Decimal(rate_sum) / rate_count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+# То же самое в виде SQL выражения, чтобы считать рейтинг внутри UPDATE.
+# Умножение на 1.0 нужно, чтобы деление не было целочисленным.
+def rating_expression(rate_sum, rate_count):
+    return ExpressionWrapper(rate_sum * Value(1.0) / NullIf(rate_count, 0),
+                             output_field=DecimalField(max_digits=3, decimal_places=2))
+
+
+# Функция по установке рейтинга. Полный пересчет счетчиков одной книги.
 def set_rating(book):
-    rating = UserBookRelation.objects.filter(book=book).aggregate(
-        rating=Avg('rate')).get('rating')
+    result = UserBookRelation.objects.filter(book=book).aggregate(
+        rate_sum=Sum('rate'), rate_count=Count('rate'))
+    book.rate_sum = result['rate_sum'] or 0
+    book.rate_count = result['rate_count']
     # Сохранить полученный результат - рейтинг.
-    book.rating = rating
-    book.save()
+    book.rating = calculate_rating(book.rate_sum, book.rate_count)
+    book.save(update_fields=['rate_sum', 'rate_count', 'rating', 'updated_at'])
+
+
+# Инкрементальное обновление при изменении оценки: поля для UPDATE книги с F выражениями,
+# без агрегации по всем отношениям книги. None означает отсутствие оценки.
+def rate_change_updates(old_rate, new_rate):
+    sum_delta = (new_rate or 0) - (old_rate or 0)
+    count_delta = (new_rate is not None) - (old_rate is not None)
+    if not sum_delta and not count_delta:
+        return {}
+    rate_sum = F('rate_sum') + sum_delta
+    rate_count = F('rate_count') + count_delta
+    return {'rate_sum': rate_sum, 'rate_count': rate_count,
+            'rating': rating_expression(rate_sum, rate_count)}
+
+
+# Подзапросы с реальными суммой и количеством оценок книги.
+def _rate_subqueries():
+    rates = UserBookRelation.objects.filter(book=OuterRef('pk'), rate__isnull=False).values('book')
+    rate_sum = Coalesce(Subquery(rates.annotate(total=Sum('rate')).values('total')), 0)
+    rate_count = Coalesce(Subquery(rates.annotate(total=Count('rate')).values('total')), 0)
+    return rate_sum, rate_count
+
+
+# Пересчет счетчиков с нуля одним UPDATE. books - queryset или список id, по умолчанию все книги.
+def rebuild_ratings(books=None):
+    queryset = Book.objects.all() if books is None else Book.objects.filter(pk__in=books)
+    rate_sum, rate_count = _rate_subqueries()
+    return queryset.update(rate_sum=rate_sum, rate_count=rate_count,
+                           rating=rating_expression(rate_sum, rate_count), updated_at=Now())
 
 
+# Книги, у которых сохраненные счетчики или рейтинг расходятся с отношениями.
+# Рейтинги сравниваются округленными до сотых, как он хранится.
+def find_rating_mismatches():
+    rate_sum, rate_count = _rate_subqueries()
+    return Book.objects.annotate(
+        real_rate_sum=rate_sum, real_rate_count=rate_count,
+        real_rating=Round(rating_expression(rate_sum, rate_count), 2), saved_rating=Round('rating', 2),
+    ).filter(~Q(rate_sum=F('real_rate_sum')) | ~Q(rate_count=F('real_rate_count')) |
+             Q(rating__isnull=True, real_rate_count__gt=0) | Q(rating__isnull=False, real_rate_count=0) |
+             Q(saved_rating__lt=F('real_rating')) | Q(saved_rating__gt=F('real_rating')))
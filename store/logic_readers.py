@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+from store.models import Book, UserBookRelation
+
+
+# Поля для UPDATE книги при создании (+1) или удалении (-1) отношения.
+def readers_change_updates(delta):
+    if not delta:
+        return {}
+    return {'readers_count': F('readers_count') + delta}
+
+
+# Первые limit читателей для каждой книги: {book_id: [{'first_name': ..., 'last_name': ...}]}.
+# Один запрос на всю страницу книг. В PostgreSQL используется LATERAL с LIMIT по индексу
+# (book_id, id), поэтому читается не больше limit отношений на книгу.
+# В остальных БД - оконная функция ROW_NUMBER.
+def get_readers_preview(book_ids, limit=None):
+    if limit is None:
+        limit = settings.READERS_PREVIEW_SIZE
+    preview = {book_id: [] for book_id in book_ids}
+    if not preview or limit <= 0:
+        return preview
+
+    # Та же БД, что у книг страницы (реплика в GET запросе).
+    connection = connections[router.db_for_read(UserBookRelation)]
+    relation_table = UserBookRelation._meta.db_table
+    user_table = User._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = f'''
+            SELECT books.book_id, users.first_name, users.last_name
+            FROM unnest(%s::bigint[]) AS books(book_id)
+            CROSS JOIN LATERAL (
+                SELECT relation.id, relation.user_id FROM {relation_table} relation
+                WHERE relation.book_id = books.book_id
+                ORDER BY relation.id LIMIT %s
+            ) readers
+            JOIN {user_table} users ON users.id = readers.user_id
+            ORDER BY books.book_id, readers.id
+        '''
+        params = [list(preview), limit]
+    else:
+        placeholders = ', '.join(['%s'] * len(preview))
+        sql = f'''
+            SELECT book_id, first_name, last_name FROM (
+                SELECT relation.book_id, relation.id AS relation_id, users.first_name, users.last_name,
+                       ROW_NUMBER() OVER (PARTITION BY relation.book_id ORDER BY relation.id) AS position
+                FROM {relation_table} relation
+                JOIN {user_table} users ON users.id = relation.user_id
+                WHERE relation.book_id IN ({placeholders})
+            ) readers
+            WHERE position <= %s
+            ORDER BY book_id, relation_id
+        '''
+        params = [*preview, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for book_id, first_name, last_name in cursor.fetchall():
+            preview[book_id].append({'first_name': first_name, 'last_name': last_name})
+    return preview
+
+
+# Проставить книгам атрибут readers_preview, для уже загруженных повторно не запрашивается.
+def attach_readers_preview(books):
+    missing = [book for book in books if not hasattr(book, 'readers_preview')]
+    if missing:
+        preview = get_readers_preview([book.id for book in missing])
+        for book in missing:
+            book.readers_preview = preview[book.id]
+    return books
+
+
+# Подзапрос с реальным количеством читателей книги.
+def _readers_subquery():
+    readers = UserBookRelation.objects.filter(book=OuterRef('pk')).values('book')
+    return Coalesce(Subquery(readers.annotate(total=Count('id')).values('total')), 0)
+
+
+# Пересчет readers_count с нуля одним UPDATE. books - queryset или список id, по умолчанию все книги.
+def rebuild_readers(books=None):
+    queryset = Book.objects.all() if books is None else Book.objects.filter(pk__in=books)
+    return queryset.update(readers_count=_readers_subquery(), updated_at=Now())
+
+
+# Книги, у которых readers_count расходится с отношениями.
+def find_reader_mismatches():
+    return Book.objects.annotate(real_readers_count=_readers_subquery()).exclude(
+        readers_count=F('real_readers_count'))
@@ -0,0 +1,289 @@
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from store.cache import invalidate_books
+from store.leaderboards import affected_boards, current_hour, record_like_activity, update_leaderboards
+from store.logic_likes import _likes_subquery
+from store.logic_rating import _rate_subqueries, rating_expression
+from store.logic_readers import _readers_subquery
+from store.models import Book, BookLikeActivity, UserBookRelation
+from store.serializers import BulkRelationItemSerializer
+
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+
+
+# Пересчет всех счетчиков книг одним UPDATE с подзапросами по индексу (book_id, id).
+# Используется после массовых операций, которые обходят UserBookRelation.save.
+def recount_books(book_ids):
+    rate_sum, rate_count = _rate_subqueries()
+    return Book.objects.filter(pk__in=book_ids).update(
+        rate_sum=rate_sum, rate_count=rate_count, rating=rating_expression(rate_sum, rate_count),
+        likes_count=_likes_subquery(), readers_count=_readers_subquery(), updated_at=Now())
+
+
+# Счетчики после удаления отношений в обход UserBookRelation.delete: rows - [(book_id, like)] удаленных отношений.
+# Книги пересчитываются с нуля, поэтому результат не зависит от того, что отношения успели изменить до удаления.
+def recount_deleted_relations(rows):
+    book_ids = {book_id for book_id, _ in rows}
+    if not book_ids:
+        return
+    recount_books(book_ids)
+    invalidate_books(book_ids)
+    like_deltas = {}
+    for book_id, like in rows:
+        if like:
+            like_deltas[book_id] = like_deltas.get(book_id, 0) - 1
+    record_like_activity(like_deltas)
+    update_leaderboards(book_ids)
+
+
+# Удаление пользователя удаляет его отношения каскадом (fast delete, без UserBookRelation.delete).
+# pre_delete запоминает книги отношений, post_delete пересчитывает их счетчики. Подключаются в StoreConfig.ready.
+# owner книг пользователя становится NULL без изменения updated_at, поэтому они отмечаются измененными отдельно:
+# иначе ETag (store/conditional.py) остался бы прежним, а owner_name в ответе - нет.
+def remember_user_relations(sender, instance, **kwargs):
+    instance._deleted_relations = list(UserBookRelation.objects.filter(user=instance).values_list('book_id', 'like'))
+    instance._owned_books = list(Book.objects.filter(owner=instance).values_list('pk', flat=True))
+
+
+def recount_user_relations(sender, instance, **kwargs):
+    recount_deleted_relations(getattr(instance, '_deleted_relations', []))
+    touch_books(getattr(instance, '_owned_books', []))
+
+
+# Поля пользователя в ответе книги: username - owner_name книг владельца, имя - в readers книг, которые он читает.
+USER_BOOK_FIELDS = ('username', 'first_name', 'last_name')
+
+
+# Переименование пользователя меняет ответы его книг, но не их updated_at. pre_save запоминает, какие из
+# USER_BOOK_FIELDS изменились (один SELECT, если они сохраняются), post_save отмечает книги измененными.
+def remember_user_names(sender, instance, update_fields=None, raw=False, **kwargs):
+    instance._renamed_fields = set()
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = [field for field in USER_BOOK_FIELDS if update_fields is None or field in update_fields]
+    if not fields:
+        return
+    saved = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    if saved is not None:
+        instance._renamed_fields = {field for field in fields if saved[field] != getattr(instance, field)}
+
+
+def touch_renamed_user_books(sender, instance, **kwargs):
+    renamed = getattr(instance, '_renamed_fields', set())
+    book_ids = set()
+    if 'username' in renamed:
+        book_ids.update(Book.objects.filter(owner=instance).values_list('pk', flat=True))
+    if renamed & {'first_name', 'last_name'}:
+        book_ids.update(UserBookRelation.objects.filter(user=instance).values_list('book_id', flat=True))
+    touch_books(book_ids)
+
+
+# Отметить книги измененными: новый updated_at (ETag и Last-Modified) и сброс кеша ответов.
+# Время из Python, а не Now(): в SQLite CURRENT_TIMESTAMP с точностью до секунды и совпал бы с прежним.
+def touch_books(book_ids):
+    if not book_ids:
+        return
+    Book.objects.filter(pk__in=book_ids).update(updated_at=timezone.now())
+    invalidate_books(book_ids)
+
+
+# select_for_update не блокирует отношения, которых еще нет: если одновременный запрос создал то же отношение,
+# bulk_create падает с IntegrityError и транзакция откатывается. Тогда пачка применяется заново, уже
+# к существующим строкам, и разница лайков и статусы считаются от сохраненных значений.
+RELATIONS_BULK_ATTEMPTS = 3
+
+
+# Применить пачку отношений пользователя к книгам: [{'book': id, 'like': ..., 'in_bookmarks': ..., 'rate': ...}].
+# Как и PATCH /book_relation/{book}/ меняются только переданные поля, отсутствующее отношение создается.
+# Вместо get_or_create и save на каждый элемент: один SELECT существующих отношений, bulk_create новых,
+# bulk_update измененных и один пересчет счетчиков затронутых книг, все в одной транзакции.
+# Возвращает результат по каждому элементу в порядке запроса.
+def apply_relations(user, items):
+    if not isinstance(items, list):
+        raise ValidationError('Expected a list of items.')
+    if len(items) > settings.RELATIONS_BULK_MAX_ITEMS:
+        raise ValidationError(f'Ensure there are no more than {settings.RELATIONS_BULK_MAX_ITEMS} items.')
+
+    results = [None] * len(items)
+    valid = []
+    # Один экземпляр сериализатора на всю пачку: построение полей ModelSerializer
+    # на каждый элемент занимало больше времени, чем сами запросы к БД.
+    validator = BulkRelationItemSerializer()
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, validator.run_validation(item)))
+        except ValidationError as error:
+            book = item.get('book') if isinstance(item, dict) else None
+            results[index] = {'book': book, 'status': 'error', 'errors': error.detail}
+
+    book_ids = {data['book'] for _, data in valid}
+    found = set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+    for attempt in range(1, RELATIONS_BULK_ATTEMPTS + 1):
+        try:
+            _apply_relations(user, valid, found, results)
+        except IntegrityError:
+            if attempt == RELATIONS_BULK_ATTEMPTS:
+                raise
+        else:
+            return results
+
+
+def _apply_relations(user, valid, found, results):
+    with transaction.atomic():
+        relations = {relation.book_id: relation for relation in
+                     UserBookRelation.objects.select_for_update().filter(user=user, book_id__in=found)}
+        created, updated, like_deltas = {}, {}, {}
+        changed_fields = set()
+        for index, data in valid:
+            book_id = data['book']
+            if book_id not in found:
+                results[index] = {'book': book_id, 'status': 'error', 'errors': {'book': ['Book not found.']}}
+                continue
+            relation = relations.get(book_id)
+            if relation is None:
+                relation = relations[book_id] = created[book_id] = UserBookRelation(user=user, book_id=book_id)
+            old_like = relation.like
+            changed = False
+            for field in RELATION_FIELDS:
+                if field in data and getattr(relation, field) != data[field]:
+                    setattr(relation, field, data[field])
+                    changed_fields.add(field)
+                    changed = True
+            if relation.like != old_like:
+                like_deltas[book_id] = like_deltas.get(book_id, 0) + (1 if relation.like else -1)
+            if book_id in created:
+                status = 'created'
+            elif changed:
+                updated[book_id] = relation
+                status = 'updated'
+            else:
+                status = 'unchanged'
+            results[index] = {'book': book_id, 'status': status}
+
+        UserBookRelation.objects.bulk_create(created.values())
+        UserBookRelation.objects.bulk_update(updated.values(), RELATION_FIELDS)
+        affected = [*created, *updated]
+        if affected:
+            recount_books(affected)
+            invalidate_books(affected)
+        record_like_activity(like_deltas)
+        update_leaderboards(affected, affected_boards('rate' in changed_fields, 'like' in changed_fields))
+
+
+# Одно отношение пользователя к книге за один запрос к БД (PATCH /book_relation/{book}/).
+# CTE в PostgreSQL: old - сохраненные значения, upsert - INSERT ... ON CONFLICT (user, book) DO UPDATE,
+# book - UPDATE счетчиков книги на разницу старых и новых значений, activity - изменение лайков в текущем часе
+# для лидерборда trending (store/leaderboards.py).
+# - Если переданные значения совпадают с сохраненными, INSERT не выполняется: ни записи, ни пересчета.
+# - DO UPDATE выполняется, только если строка не изменилась с момента чтения old (оптимистичная проверка).
+#   Иначе, как и при одновременном создании отношения, ничего не пишется и запрос повторяется,
+#   поэтому разница для счетчиков всегда считается от тех значений, которые заменены.
+# - Отношение создается, только если книга существует (SELECT из store_book).
+UPSERT_RELATION_SQL = '''
+    WITH old AS (
+        SELECT "like", in_bookmarks, rate FROM {relation} WHERE user_id = %(user)s AND book_id = %(book)s
+    ), new AS (
+        SELECT CASE WHEN %(set_like)s THEN %(like)s ELSE COALESCE((SELECT "like" FROM old), false) END AS "like",
+               CASE WHEN %(set_in_bookmarks)s THEN %(in_bookmarks)s
+                    ELSE COALESCE((SELECT in_bookmarks FROM old), false) END AS in_bookmarks,
+               CASE WHEN %(set_rate)s THEN %(rate)s::smallint ELSE (SELECT rate FROM old) END AS rate
+    ), upsert AS (
+        INSERT INTO {relation} AS relation (user_id, book_id, "like", in_bookmarks, rate)
+        SELECT %(user)s, book.id, new."like", new.in_bookmarks, new.rate FROM {book} book, new
+        WHERE book.id = %(book)s AND NOT EXISTS (
+            SELECT 1 FROM old
+            WHERE (old."like", old.in_bookmarks, old.rate) IS NOT DISTINCT FROM (new."like", new.in_bookmarks, new.rate))
+        ON CONFLICT (user_id, book_id) DO UPDATE
+        SET "like" = EXCLUDED."like", in_bookmarks = EXCLUDED.in_bookmarks, rate = EXCLUDED.rate
+        WHERE EXISTS (
+            SELECT 1 FROM old
+            WHERE (relation."like", relation.in_bookmarks, relation.rate) IS NOT DISTINCT FROM (
+                old."like", old.in_bookmarks, old.rate))
+        RETURNING relation."like", relation.in_bookmarks, relation.rate, relation.xmax = 0 AS created
+    ), delta AS (
+        SELECT upsert.created::int AS readers_delta,
+               upsert."like"::int - CASE WHEN upsert.created THEN 0 ELSE old."like"::int END AS likes_delta,
+               COALESCE(upsert.rate, 0) - CASE WHEN upsert.created THEN 0 ELSE COALESCE(old.rate, 0) END AS sum_delta,
+               (upsert.rate IS NOT NULL)::int -
+               CASE WHEN upsert.created THEN 0 ELSE (old.rate IS NOT NULL)::int END AS count_delta
+        FROM upsert LEFT JOIN old ON true
+    ), book AS (
+        UPDATE {book} book
+        SET readers_count = book.readers_count + readers_delta, likes_count = book.likes_count + likes_delta,
+            rate_sum = book.rate_sum + sum_delta, rate_count = book.rate_count + count_delta,
+            rating = (book.rate_sum + sum_delta) * 1.0 / NULLIF(book.rate_count + count_delta, 0),
+            updated_at = now()
+        FROM delta
+        WHERE book.id = %(book)s AND (readers_delta, likes_delta, sum_delta, count_delta) <> (0, 0, 0, 0)
+        RETURNING book.id
+    ), activity AS (
+        INSERT INTO {activity} AS activity (book_id, hour, likes)
+        SELECT %(book)s, %(hour)s, likes_delta FROM delta WHERE likes_delta <> 0
+        ON CONFLICT (book_id, hour) DO UPDATE SET likes = activity.likes + EXCLUDED.likes
+    )
+    SELECT EXISTS (SELECT 1 FROM {book} WHERE id = %(book)s), old."like", old.in_bookmarks, old.rate,
+           upsert."like", upsert.in_bookmarks, upsert.rate, EXISTS (SELECT 1 FROM book)
+    FROM (SELECT 1) one LEFT JOIN old ON true LEFT JOIN upsert ON true
+'''
+# Повторы upsert при одновременном изменении того же отношения, потом - путь через ORM с блокировкой.
+UPSERT_ATTEMPTS = 3
+
+
+# Применить изменение полей data (like, in_bookmarks, rate - только переданные) к отношению user и книги.
+# Возвращает значения отношения как UserBookRelationSerializer, Book.DoesNotExist - если книги нет.
+def upsert_relation(user, book_id, data):
+    if connection.vendor == 'postgresql':
+        for _ in range(UPSERT_ATTEMPTS):
+            values = _upsert_relation_sql(user, book_id, data)
+            if values is not None:
+                return values
+    return apply_relation(user, book_id, data)
+
+
+def _upsert_relation_sql(user, book_id, data):
+    params = {'user': user.pk, 'book': book_id, 'hour': current_hour()}
+    for field in RELATION_FIELDS:
+        params[f'set_{field}'] = field in data
+        params[field] = data.get(field)
+    sql = UPSERT_RELATION_SQL.format(relation=connection.ops.quote_name(UserBookRelation._meta.db_table),
+                                     book=connection.ops.quote_name(Book._meta.db_table),
+                                     activity=connection.ops.quote_name(BookLikeActivity._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        book_exists, *row = cursor.fetchone()
+    if not book_exists:
+        raise Book.DoesNotExist()
+    old, new, counters_changed = row[:3], row[3:6], row[6]
+    if new[0] is not None:
+        if counters_changed:
+            invalidate_books([book_id])
+            update_leaderboards([book_id], affected_boards(old[2] != new[2], bool(old[0]) != bool(new[0])))
+        return _relation_values(book_id, new)
+    # Ничего не записано: значения не изменились или строку изменил другой запрос - тогда повтор.
+    if old[0] is not None and all(data[field] == value for field, value in zip(RELATION_FIELDS, old)
+                                  if field in data):
+        return _relation_values(book_id, old)
+    return None
+
+
+# То же через ORM для остальных БД: get_or_create и save только при изменении значений.
+def apply_relation(user, book_id, data):
+    with transaction.atomic():
+        if not Book.objects.filter(pk=book_id).exists():
+            raise Book.DoesNotExist()
+        relation, created = UserBookRelation.objects.select_for_update().get_or_create(
+            user=user, book_id=book_id, defaults=data)
+        changed = [field for field in RELATION_FIELDS if field in data and getattr(relation, field) != data[field]]
+        if changed and not created:
+            for field in changed:
+                setattr(relation, field, data[field])
+            relation.save(update_fields=changed)
+    return _relation_values(book_id, [getattr(relation, field) for field in RELATION_FIELDS])
+
+
+def _relation_values(book_id, values):
+    return {'book': book_id, **dict(zip(RELATION_FIELDS, values))}
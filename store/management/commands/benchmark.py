@@ -0,0 +1,77 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from store.benchmarks import BENCHMARKS, get_benchmark
+from store.benchmarks.utils import benchmark_database, compare_results
+
+
+# Запуск бенчмарков на временной тестовой БД. Без имен запускается основной набор api.
+# Пример: python manage.py benchmark api --books 50000 --output results.json --compare baseline.json
+# На SQLite: BOOKS_DB=sqlite python manage.py benchmark api
+class Command(BaseCommand):
+    help = 'Run store performance benchmarks on a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help=f'Benchmarks to run: {", ".join(BENCHMARKS)} or all. Default: api.')
+        parser.add_argument('--books', type=int, help='Number of books to generate.')
+        parser.add_argument('--users', type=int, help='Number of users to generate.')
+        parser.add_argument('--relations-per-book', type=int, help='Average number of relations per book.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the data generator.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement.')
+        parser.add_argument('--output', help='Write JSON results to this file.')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with.')
+        parser.add_argument('--max-regression', type=float,
+                            help='Fail if any compared metric grew more than this many times, e.g. 1.25.')
+
+    def handle(self, *args, **options):
+        names = options['names'] or ['api']
+        if names == ['all']:
+            names = list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+
+        option_names = ('books', 'users', 'relations_per_book', 'seed', 'repeat')
+        run_options = {key: options[key] for key in option_names if options[key] is not None}
+        results = {'meta': self.get_meta(run_options)}
+        for name in names:
+            # Каждый бенчмарк получает чистую БД.
+            with benchmark_database():
+                results[name] = get_benchmark(name)(run_options)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(options['compare'], results, options['max_regression'])
+
+    # Окружение запуска, чтобы результаты разных коммитов и БД можно было сопоставить.
+    def get_meta(self, run_options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {'commit': commit, 'database': connection.vendor, 'python': platform.python_version(),
+                'django': django.get_version(), 'timestamp': int(time.time()), 'options': run_options}
+
+    def compare(self, path, results, max_regression):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        rows = compare_results(baseline, results)
+        for name, before, after, ratio in rows:
+            self.stderr.write(f'{name}: {before} -> {after} (x{ratio})')
+        regressions = [row for row in rows if max_regression and row[3] > max_regression]
+        if regressions:
+            raise CommandError(f'{len(regressions)} metrics regressed more than x{max_regression}: '
+                               f'{", ".join(row[0] for row in regressions)}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.recommendations import TooManyRelations, build_recommendations, has_numpy
+
+
+# Построение похожих книг по отношениям читателей для /book/{id}/similar/. Для запуска по расписанию.
+# По умолчанию на NumPy/SciPy, если они установлены, иначе на Python.
+class Command(BaseCommand):
+    help = 'Build item-item book similarities ("readers who liked this also liked") from user-book relations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, help='Neighbours to keep per book.')
+        parser.add_argument('--engine', choices=['numpy', 'python'],
+                            help='Computation engine, numpy when NumPy and SciPy are installed by default.')
+
+    def handle(self, *args, **options):
+        if options['engine'] == 'numpy' and not has_numpy():
+            raise CommandError('NumPy and SciPy are not installed.')
+        try:
+            stats = build_recommendations(top_k=options['top_k'], engine=options['engine'])
+        except TooManyRelations as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {stats["neighbours"]} neighbours for {stats["books"]} books ({stats["engine"]}), '
+            f'removed {stats["stale_deleted"]} stale.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.http import HttpRequest, QueryDict
+from rest_framework.request import Request
+
+from store.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, iter_export
+from store.views import BookViewSet
+
+
+# Выгрузка каталога в NDJSON или CSV, те же фильтры, что у /book/export/.
+# Пример: python manage.py export_catalog --export-format csv --price 55 --output books.csv
+class Command(BaseCommand):
+    help = 'Stream the book catalog to NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--export-format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write to, stdout by default.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows fetched from the database cursor at a time.')
+        parser.add_argument('--price', help='Same as ?price= of the list endpoint.')
+        parser.add_argument('--search', help='Same as ?search= of the list endpoint.')
+        parser.add_argument('--ordering', help='Same as ?ordering= of the list endpoint.')
+
+    def handle(self, *args, **options):
+        queryset = self.get_queryset({name: options[name] for name in ('price', 'search', 'ordering')
+                                      if options[name] is not None})
+        chunks = iter_export(queryset, options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+    # Фильтры списка применяются через filter_queryset BookViewSet, как для HTTP запроса.
+    def get_queryset(self, params):
+        http_request = HttpRequest()
+        http_request.method = 'GET'
+        http_request.GET = QueryDict(mutable=True)
+        http_request.GET.update(params)
+        view = BookViewSet(request=Request(http_request), action='export', format_kwarg=None, args=(), kwargs={})
+        return view.filter_queryset(view.get_queryset())
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from store.importer import DEFAULT_CHUNK_SIZE, IMPORTERS, read_rows
+
+
+# Импорт книг или отношений из CSV/NDJSON файла пачками.
+# Пример: python manage.py import_catalog relations.csv --kind relations --create-users
+class Command(BaseCommand):
+    help = 'Import books or user-book relations from a CSV or NDJSON file in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file. Format is detected by extension (.ndjson, .jsonl).')
+        parser.add_argument('--kind', choices=list(IMPORTERS), default='books',
+                            help='books: id, name, price, author_name, owner; '
+                                 'relations: user, book, like, in_bookmarks, rate.')
+        parser.add_argument('--file-format', choices=['csv', 'ndjson'], help='Override format detection.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per transaction.')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Create unknown owners and users instead of skipping their rows.')
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options['kind']](chunk_size=options['chunk_size'],
+                                              create_users=options['create_users'])
+        stats = importer.run(read_rows(options['path'], options['file_format']))
+        for error in stats['errors']:
+            self.stderr.write(error)
+        self.stdout.write(json.dumps({key: value for key, value in stats.items() if key != 'errors'}))
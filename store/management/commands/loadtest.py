@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from store.benchmarks.loadtest import run_load
+
+
+# Сравнение синхронного (WSGI, /book/) и асинхронного (ASGI, /async/book/) чтения книг под одинаковой
+# нагрузкой. Серверы запускаются заранее с одинаковым количеством ядер, клиент - на других ядрах:
+#   taskset -c 0-3 gunicorn books.wsgi -w 4 -b 127.0.0.1:8000
+#   taskset -c 0-3 uvicorn books.asgi:application --workers 4 --port 8001
+#   taskset -c 4-7 python manage.py loadtest --concurrency 16 64 256 --output load.json
+class Command(BaseCommand):
+    help = 'Load test the WSGI and ASGI book read endpoints at the same concurrency levels.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000/book/?page_size=20',
+                            help='URL served by the WSGI server.')
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001/async/book/?page_size=20',
+                            help='URL served by the ASGI server.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256],
+                            help='Concurrent connections, one run per value.')
+        parser.add_argument('--duration', type=float, default=10, help='Measured seconds per run.')
+        parser.add_argument('--warmup', type=float, default=2, help='Seconds before measuring starts.')
+        parser.add_argument('--timeout', type=float, default=30, help='Socket timeout in seconds.')
+        parser.add_argument('--output', help='Write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        targets = {'wsgi': options['wsgi'], 'asgi': options['asgi']}
+        results = {'targets': targets, 'duration': options['duration'], 'runs': []}
+        for concurrency in options['concurrency']:
+            run = {name: run_load(url, concurrency, options['duration'], options['warmup'], options['timeout'])
+                   for name, url in targets.items()}
+            if run['wsgi']['rps']:
+                run['asgi_rps_ratio'] = round(run['asgi']['rps'] / run['wsgi']['rps'], 2)
+            results['runs'].append(run)
+            self.stderr.write(f'concurrency {concurrency}: ' + ', '.join(
+                f'{name} {run[name]["rps"]} rps, p99 {run[name]["p99_ms"]} ms, {run[name]["errors"]} errors'
+                for name in targets))
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from store.profiling import get_stats, reset_stats
+
+
+# Суммы профилирования запросов по endpoint-ам (store/profiling.py).
+# Пример: python manage.py profiling_stats --json
+class Command(BaseCommand):
+    help = 'Show per-endpoint request profiling aggregates.'
+
+    columns = ('count', 'slow', 'avg_total_ms', 'max_ms', 'avg_queries', 'avg_db_ms', 'avg_serialize_ms',
+               'avg_render_ms')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print JSON instead of a table.')
+        parser.add_argument('--reset', action='store_true', help='Clear the aggregates after printing.')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            width = max([len('endpoint'), *(len(row['endpoint']) for row in stats)])
+            self.stdout.write(' '.join(['endpoint'.ljust(width), *(column.rjust(16) for column in self.columns)]))
+            for row in stats:
+                self.stdout.write(' '.join([row['endpoint'].ljust(width),
+                                            *(str(row[column]).rjust(16) for column in self.columns)]))
+        if options['reset']:
+            reset_stats()
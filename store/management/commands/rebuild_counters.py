@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import invalidate_all_books
+from store.logic_likes import find_like_mismatches, rebuild_likes
+from store.logic_rating import find_rating_mismatches, rebuild_ratings
+from store.logic_readers import find_reader_mismatches, rebuild_readers
+
+
+# Пересчет денормализованных счетчиков книг с нуля по таблице отношений.
+# С --check только сообщает о расхождениях, ничего не меняя.
+class Command(BaseCommand):
+    help = 'Rebuild denormalized book counters (rating, likes, readers) from user-book relations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report books whose counters are out of sync.')
+
+    # Счетчик -> (поиск расхождений, пересчет).
+    counters = {
+        'rating': (find_rating_mismatches, rebuild_ratings),
+        'likes': (find_like_mismatches, rebuild_likes),
+        'readers': (find_reader_mismatches, rebuild_readers),
+    }
+
+    def handle(self, *args, **options):
+        for name, (find_mismatches, rebuild) in self.counters.items():
+            mismatches = find_mismatches().count()
+            self.stdout.write(f'Books with out of sync {name} counters: {mismatches}')
+            if options['check']:
+                if mismatches:
+                    ids = find_mismatches().order_by('id').values_list('id', flat=True)[:100]
+                    self.stdout.write(f'Ids: {", ".join(map(str, ids))}')
+                continue
+            # Пересчитываются только расходящиеся книги, чтобы не менять updated_at остальных.
+            with transaction.atomic():
+                updated = rebuild(find_mismatches().values('pk'))
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {name} counters for {updated} books.'))
+        if not options['check']:
+            invalidate_all_books()
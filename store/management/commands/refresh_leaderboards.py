@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from store.leaderboards import prune_like_activity, refresh_leaderboards
+
+
+# Перестроение всех лидербордов и удаление лайков по часам, вышедших из окна trending.
+# Для запуска по расписанию (cron): между запусками лидерборды обновляет запись отношений,
+# а лайки, ушедшие из окна trending, учитывает только перестроение.
+class Command(BaseCommand):
+    help = 'Rebuild leaderboards and prune like activity older than the trending window.'
+
+    def handle(self, *args, **options):
+        pruned = prune_like_activity()
+        self.stdout.write(f'Pruned like activity rows: {pruned}')
+        for board, count in refresh_leaderboards().items():
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {board}: {count} books.'))
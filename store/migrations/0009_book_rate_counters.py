@@ -0,0 +1,42 @@
+# Generated by Django 4.1.6 on 2026-10-18 17:39
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+
+# Заполнить счетчики оценок для уже существующих книг и пересчитать по ним рейтинг:
+# до счетчиков рейтинг записывался только при создании книги.
+def fill_rate_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    rates = UserBookRelation.objects.filter(book=OuterRef('pk'), rate__isnull=False).values('book')
+    rate_sum = Coalesce(Subquery(rates.annotate(total=Sum('rate')).values('total')), 0)
+    rate_count = Coalesce(Subquery(rates.annotate(total=Count('rate')).values('total')), 0)
+    Book.objects.update(
+        rate_sum=rate_sum,
+        rate_count=rate_count,
+        rating=ExpressionWrapper(rate_sum * Value(1.0) / NullIf(rate_count, 0),
+                                 output_field=DecimalField(max_digits=3, decimal_places=2)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rate_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rate_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.6 on 2026-10-18 17:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Заполнить likes_count для уже существующих книг.
+def fill_likes_count(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    likes = UserBookRelation.objects.filter(book=OuterRef('pk'), like=True).values('book')
+    Book.objects.update(likes_count=Coalesce(Subquery(likes.annotate(total=Count('id')).values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_rate_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
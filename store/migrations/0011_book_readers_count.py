@@ -0,0 +1,33 @@
+# Generated by Django 4.1.6 on 2026-10-18 17:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Заполнить readers_count для уже существующих книг.
+def fill_readers_count(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    readers = UserBookRelation.objects.filter(book=OuterRef('pk')).values('book')
+    Book.objects.update(readers_count=Coalesce(Subquery(readers.annotate(total=Count('id')).values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_book_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='readers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(fields=['book', 'id'], name='store_rel_book_id_idx'),
+        ),
+        migrations.RunPython(fill_readers_count, migrations.RunPython.noop),
+    ]
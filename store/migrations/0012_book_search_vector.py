@@ -0,0 +1,62 @@
+# Generated by Django 4.1.6 on 2026-10-18 18:20
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Вектор собирается из name (вес A) и author_name (вес B) с конфигурацией 'simple':
+# без стемминга, одинаково для книг на любом языке.
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('simple', coalesce({table}.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({table}.author_name, '')), 'B')
+"""
+
+CREATE_SQL = f"""
+    CREATE FUNCTION store_book_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR_SQL.format(table='NEW')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER store_book_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF name, author_name ON store_book
+        FOR EACH ROW EXECUTE FUNCTION store_book_search_vector_update();
+
+    UPDATE store_book SET search_vector = {SEARCH_VECTOR_SQL.format(table='store_book')};
+
+    CREATE INDEX store_book_search_vector_idx ON store_book USING gin (search_vector);
+"""
+
+DROP_SQL = """
+    DROP INDEX IF EXISTS store_book_search_vector_idx;
+    DROP TRIGGER IF EXISTS store_book_search_vector_trigger ON store_book;
+    DROP FUNCTION IF EXISTS store_book_search_vector_update();
+"""
+
+
+# Триггер и GIN индекс есть только в PostgreSQL, в других БД поиск работает через ILIKE.
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_book_readers_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
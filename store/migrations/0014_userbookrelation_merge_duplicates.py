@@ -0,0 +1,48 @@
+# Generated by Django 4.1.6 on 2026-10-18 19:05
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Now
+
+
+# Перед уникальным (user, book) в 0015: повторные отношения пользователя к книге (их мог создать
+# одновременный get_or_create) сливаются в первое. Лайк и закладка остаются, если были в любом из них,
+# оценка - последняя поставленная. Счетчики затронутых книг пересчитываются.
+def merge_duplicate_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    duplicates = list(UserBookRelation.objects.values('user', 'book').annotate(total=Count('id')).filter(
+        total__gt=1).order_by())
+    for key in duplicates:
+        relations = list(UserBookRelation.objects.filter(user=key['user'], book=key['book']).order_by('id'))
+        kept = relations[0]
+        kept.like = any(relation.like for relation in relations)
+        kept.in_bookmarks = any(relation.in_bookmarks for relation in relations)
+        rates = [relation.rate for relation in relations if relation.rate is not None]
+        kept.rate = rates[-1] if rates else None
+        kept.save(update_fields=['like', 'in_bookmarks', 'rate'])
+        UserBookRelation.objects.filter(pk__in=[relation.pk for relation in relations[1:]]).delete()
+
+    for book_id in {key['book'] for key in duplicates}:
+        counters = UserBookRelation.objects.filter(book_id=book_id).aggregate(
+            rate_sum=Sum('rate'), rate_count=Count('rate'), likes_count=Count('id', filter=Q(like=True)),
+            readers_count=Count('id'))
+        rate_sum, rate_count = counters['rate_sum'] or 0, counters['rate_count']
+        rating = ((Decimal(rate_sum) / rate_count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+                  if rate_count else None)
+        Book.objects.filter(pk=book_id).update(
+            rate_sum=rate_sum, rate_count=rate_count, rating=rating, likes_count=counters['likes_count'],
+            readers_count=counters['readers_count'], updated_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_relations, migrations.RunPython.noop),
+    ]
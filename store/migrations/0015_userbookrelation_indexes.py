@@ -0,0 +1,105 @@
+# Generated by Django 4.1.6 on 2026-10-18 19:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+UNIQUE_USER_BOOK = models.UniqueConstraint(fields=['user', 'book'], name='store_rel_user_book_uniq')
+INDEXES = [
+    models.Index(fields=['book'], condition=models.Q(like=True), name='store_rel_book_liked_idx'),
+    models.Index(fields=['book', 'rate'], name='store_rel_book_rate_idx'),
+]
+# Индексы внешних ключей, которые заменяют новые индексы.
+FOREIGN_KEYS = ['user', 'book']
+
+
+# Миграция без транзакции (atomic = False): в PostgreSQL индексы строятся CREATE INDEX CONCURRENTLY
+# и не блокируют запись в таблицу на время построения. Уникальное ограничение добавляется по уже
+# построенному уникальному индексу - ALTER TABLE только меняет каталог. Индекс, оставшийся невалидным
+# после прерванной миграции, удаляется перед построением, поэтому миграцию можно повторить.
+# В SQLite уникальное ограничение - уникальный индекс (add_constraint пересоздал бы таблицу).
+def create_indexes(apps, schema_editor):
+    model = apps.get_model('store', 'UserBookRelation')
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    table = schema_editor.quote_name(model._meta.db_table)
+    name = schema_editor.quote_name(UNIQUE_USER_BOOK.name)
+    columns = ', '.join(schema_editor.quote_name(model._meta.get_field(field).column)
+                        for field in UNIQUE_USER_BOOK.fields)
+    if postgresql:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    schema_editor.execute(f'CREATE UNIQUE INDEX {concurrently}{name} ON {table} ({columns})')
+    if postgresql:
+        schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}')
+    for index in INDEXES:
+        if postgresql:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(index.name)}')
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+    _drop_foreign_key_indexes(model, schema_editor, concurrently)
+
+
+def drop_indexes(apps, schema_editor):
+    model = apps.get_model('store', 'UserBookRelation')
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    table = model._meta.db_table
+    for field in FOREIGN_KEYS:
+        column = model._meta.get_field(field).column
+        schema_editor.execute(f'CREATE INDEX {concurrently}{schema_editor.quote_name(f"{table}_{column}_idx")} '
+                              f'ON {schema_editor.quote_name(table)} ({schema_editor.quote_name(column)})')
+    for index in INDEXES:
+        schema_editor.execute(f'DROP INDEX {concurrently}{schema_editor.quote_name(index.name)}')
+    if postgresql:
+        schema_editor.remove_constraint(model, UNIQUE_USER_BOOK)
+    else:
+        schema_editor.execute(f'DROP INDEX {schema_editor.quote_name(UNIQUE_USER_BOOK.name)}')
+
+
+# Имена индексов Django генерирует с хешем, поэтому они берутся из БД.
+def _drop_foreign_key_indexes(model, schema_editor, concurrently):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    columns = {model._meta.get_field(field).column for field in FOREIGN_KEYS}
+    # Частичный store_rel_book_liked_idx тоже по одному столбцу book_id.
+    keep = {index.name for index in INDEXES}
+    for name, info in constraints.items():
+        if (info['index'] and not info['unique'] and not info['primary_key'] and name not in keep and
+                len(info['columns']) == 1 and info['columns'][0] in columns):
+            schema_editor.execute(f'DROP INDEX {concurrently}{schema_editor.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0014_userbookrelation_merge_duplicates'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='userbookrelation',
+                    name='book',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                            to='store.book'),
+                ),
+                migrations.AlterField(
+                    model_name='userbookrelation',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                            to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AddIndex(model_name='userbookrelation', index=INDEXES[0]),
+                migrations.AddIndex(model_name='userbookrelation', index=INDEXES[1]),
+                migrations.AddConstraint(model_name='userbookrelation', constraint=UNIQUE_USER_BOOK),
+            ],
+        ),
+    ]
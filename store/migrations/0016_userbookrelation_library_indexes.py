@@ -0,0 +1,47 @@
+# Generated by Django 4.1.6 on 2026-10-18 21:20
+
+from django.db import migrations, models
+
+INDEXES = [
+    models.Index(fields=['user', 'id'], condition=models.Q(like=True), name='store_rel_user_liked_idx'),
+    models.Index(fields=['user', 'id'], condition=models.Q(in_bookmarks=True), name='store_rel_user_bookmarked_idx'),
+]
+
+
+# Как и 0015: без транзакции, в PostgreSQL индексы строятся CONCURRENTLY, не блокируя запись.
+# Невалидный индекс от прерванной миграции удаляется перед построением.
+def create_indexes(apps, schema_editor):
+    model = apps.get_model('store', 'UserBookRelation')
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    for index in INDEXES:
+        if postgresql:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(index.name)}')
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    for index in INDEXES:
+        schema_editor.execute(f'DROP INDEX {concurrently}{schema_editor.quote_name(index.name)}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0015_userbookrelation_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='userbookrelation', index=INDEXES[0]),
+                migrations.AddIndex(model_name='userbookrelation', index=INDEXES[1]),
+            ],
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.1.6 on 2026-10-18 22:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BOOK_INDEXES = [
+    models.Index(fields=['-rating', '-rate_count', 'id'], condition=models.Q(rating__isnull=False),
+                 name='store_book_top_rated_idx'),
+    models.Index(fields=['-likes_count', 'id'], condition=models.Q(likes_count__gt=0),
+                 name='store_book_most_liked_idx'),
+]
+
+
+# Индексы store_book, как в 0015 и 0016: без транзакции, в PostgreSQL CONCURRENTLY.
+# Таблица BookLikeActivity новая, ее индексы создаются вместе с ней.
+def create_indexes(apps, schema_editor):
+    model = apps.get_model('store', 'Book')
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    for index in BOOK_INDEXES:
+        if postgresql:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(index.name)}')
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    for index in BOOK_INDEXES:
+        schema_editor.execute(f'DROP INDEX {concurrently}{schema_editor.quote_name(index.name)}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0016_userbookrelation_library_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookLikeActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('likes', models.IntegerField(default=0)),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False,
+                                           on_delete=django.db.models.deletion.DO_NOTHING, to='store.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], include=('book', 'likes'),
+                                         name='store_like_activity_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'hour'),
+                                                        name='store_like_activity_book_hour_uniq')],
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='book', index=BOOK_INDEXES[0]),
+                migrations.AddIndex(model_name='book', index=BOOK_INDEXES[1]),
+            ],
+        ),
+    ]
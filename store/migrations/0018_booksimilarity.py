@@ -0,0 +1,28 @@
+# Generated by Django 4.1.6 on 2026-10-18 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.book')),
+                ('similar', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='booksimilarity',
+            constraint=models.UniqueConstraint(fields=('book', 'rank'), name='store_similarity_book_rank_uniq'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+OLD_INDEX = models.Index(fields=['price', 'id'], name='store_book_price_id_idx')
+NEW_INDEX = models.Index(fields=['price', 'id'], include=['author_name'], name='store_book_price_id_author_idx')
+
+
+# Замена индекса store_book, как в 0015-0017: без транзакции, в PostgreSQL CONCURRENTLY.
+# Новый индекс создается до удаления старого, чтобы keyset пагинация по цене не оставалась без индекса.
+def replace_index(model, schema_editor, old, new):
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    if postgresql:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(new.name)}')
+        schema_editor.add_index(model, new, concurrently=True)
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(old.name)}')
+    else:
+        schema_editor.add_index(model, new)
+        schema_editor.remove_index(model, old)
+
+
+def create_index(apps, schema_editor):
+    replace_index(apps.get_model('store', 'Book'), schema_editor, OLD_INDEX, NEW_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    replace_index(apps.get_model('store', 'Book'), schema_editor, NEW_INDEX, OLD_INDEX)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0018_booksimilarity'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_index, drop_index),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(model_name='book', name=OLD_INDEX.name),
+                migrations.AddIndex(model_name='book', index=NEW_INDEX),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.6 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_book_price_facets_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=255, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('slow', models.BigIntegerField(default=0)),
+                ('queries', models.BigIntegerField(default=0)),
+                ('total_us', models.BigIntegerField(default=0)),
+                ('db_us', models.BigIntegerField(default=0)),
+                ('serialize_us', models.BigIntegerField(default=0)),
+                ('render_us', models.BigIntegerField(default=0)),
+                ('max_us', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
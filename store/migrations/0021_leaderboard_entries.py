@@ -0,0 +1,69 @@
+# Generated by Django 4.1.6 on 2026-10-18 20:21
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+import django.db.models.deletion
+
+BOARDS = ('top-rated', 'most-liked', 'trending')
+
+
+# Построить лидерборды по существующим данным, как refresh_leaderboards: дальше их поддерживает
+# запись отношений, которая рассчитывает на то, что в неполном лидерборде все подходящие книги.
+def build_leaderboards(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    BookLikeActivity = apps.get_model('store', 'BookLikeActivity')
+    Leaderboard = apps.get_model('store', 'Leaderboard')
+    LeaderboardEntry = apps.get_model('store', 'LeaderboardEntry')
+    size = settings.LEADERBOARD_SIZE
+    now = timezone.now()
+    cutoff = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=settings.LEADERBOARD_TRENDING_HOURS - 1)
+    rows = {
+        'top-rated': Book.objects.filter(rating__isnull=False, rate_count__gte=settings.LEADERBOARD_MIN_VOTES).order_by(
+            '-rating', '-rate_count', 'id').values_list('id', 'rating', 'rate_count')[:size],
+        'most-liked': [(book_id, likes, 0) for book_id, likes in Book.objects.filter(likes_count__gt=0).order_by(
+            '-likes_count', 'id').values_list('id', 'likes_count')[:size]],
+        'trending': [(row['book'], row['recent_likes'], 0) for row in BookLikeActivity.objects.filter(
+            hour__gte=cutoff, book__in=Book.objects.values('pk')).values('book').annotate(
+            recent_likes=Sum('likes')).filter(recent_likes__gt=0).order_by('-recent_likes', 'book')[:size]],
+    }
+    LeaderboardEntry.objects.bulk_create(
+        [LeaderboardEntry(board=board, book_id=book_id, score=score, tiebreak=tiebreak)
+         for board in BOARDS for book_id, score, tiebreak in rows[board]], batch_size=1000)
+    Leaderboard.objects.bulk_create([Leaderboard(name=board, computed_at=now) for board in BOARDS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_endpointprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=20)),
+                ('score', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('tiebreak', models.IntegerField(default=0)),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('board', 'book'), name='store_leaderboard_entry_board_book_uniq'),
+        ),
+        migrations.RunPython(build_leaderboards, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import DEFERRED
+from django.db.models.functions import Now
 
 
 class Book(models.Model):
@@ -18,11 +21,77 @@ class Book(models.Model):
                                      related_name='books')
     # rating поле для хранения рейтинга книги.
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True)
+    # Счетчики для инкрементального пересчета рейтинга: сумма оценок и их количество.
+    # rating = rate_sum / rate_count, обновляются атомарно при изменении оценки.
+    rate_sum = models.PositiveIntegerField(default=0)
+    rate_count = models.PositiveIntegerField(default=0)
+    # Количество лайков, поддерживается при изменении UserBookRelation.like.
+    # Заменяет аннотацию Count(Case(When(...))), которой нужен JOIN и GROUP BY по всем отношениям.
+    likes_count = models.PositiveIntegerField(default=0)
+    # Количество читателей (любых отношений с книгой). В ответе API отдается вместе
+    # с ограниченным списком первых читателей вместо всего списка.
+    readers_count = models.PositiveIntegerField(default=0)
+    # Полнотекстовый вектор по name и author_name для поиска. В PostgreSQL заполняется триггером
+    # при вставке и изменении книги (миграция 0012), в других БД не используется.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Время последнего изменения книги или ее лайков, оценок и читателей.
+    # По нему строятся ETag и Last-Modified ответов API.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Индексы под keyset пагинацию: сортировка по полю из ordering_fields + id.
+        indexes = [
+            # author_name в INCLUDE: фасеты (store/facets.py) читаются только из индекса.
+            models.Index(fields=['price', 'id'], include=['author_name'], name='store_book_price_id_author_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+            # Лидерборды (store/leaderboards.py): первые N книг читаются по индексу без сортировки каталога.
+            models.Index(fields=['-rating', '-rate_count', 'id'], condition=models.Q(rating__isnull=False),
+                         name='store_book_top_rated_idx'),
+            models.Index(fields=['-likes_count', 'id'], condition=models.Q(likes_count__gt=0),
+                         name='store_book_most_liked_idx'),
+        ]
 
     # Переопределение магического метода - строкового представления экземпляра класса.
     def __str__(self):
         return f'Id {self.id}: {self.name}'
 
+    # Денормализованные счетчики отношений: их меняют только UPDATE на разницу значений и пересчеты.
+    COUNTER_FIELDS = ('rating', 'rate_sum', 'rate_count', 'likes_count', 'readers_count')
+
+    # При сохранении и удалении книги сбрасывается кеш ответов API по ней.
+    # Сохранение загруженной книги без update_fields (PUT и PATCH /book/{id}/) не записывает счетчики:
+    # значения, прочитанные до запроса, затерли бы лайки и оценки, сохраненные за это время.
+    def save(self, *args, **kwargs):
+        from store.cache import invalidate_books
+
+        if not args and not self._state.adding and not kwargs.get('force_insert') and \
+                kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+        invalidate_books([self.pk])
+
+    def delete(self, *args, **kwargs):
+        from store.cache import invalidate_books
+
+        book_id = self.pk
+        result = super().delete(*args, **kwargs)
+        invalidate_books([book_id])
+        return result
+
+
+# Массовое удаление отношений (queryset.delete(), в том числе "delete selected" в админке) не вызывает
+# UserBookRelation.delete: счетчики затронутых книг пересчитываются после удаления.
+class UserBookRelationQuerySet(models.QuerySet):
+    def delete(self):
+        from store.logic_relations import recount_deleted_relations
+
+        with transaction.atomic(using=self.db):
+            rows = list(self.values_list('book_id', 'like'))
+            result = super().delete()
+            recount_deleted_relations(rows)
+        return result
+
 
 # Модель хранения отношений между пользователями и книгами.
 class UserBookRelation(models.Model):
@@ -35,31 +104,202 @@ class UserBookRelation(models.Model):
     )
 
     # Поля: user, book для организации отношений в формате многие ко многим.
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    # Отдельные индексы внешних ключей не нужны: user - первое поле уникального (user, book),
+    # book - первое поле индекса (book, id).
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
     like = models.BooleanField(default=False)
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
 
+    objects = UserBookRelationQuerySet.as_manager()
+
+    class Meta:
+        # Одно отношение пользователя к книге: get_or_create в UserBooksRelationView ищет по этому индексу,
+        # а при одновременном создании второй INSERT получает IntegrityError и читает созданное отношение.
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_rel_user_book_uniq'),
+        ]
+        indexes = [
+            # Первые читатели книги в порядке появления отношений.
+            models.Index(fields=['book', 'id'], name='store_rel_book_id_idx'),
+            # Лайки книги (пересчет likes_count): в индексе только отношения с like.
+            models.Index(fields=['book'], condition=models.Q(like=True), name='store_rel_book_liked_idx'),
+            # Сумма и количество оценок книги (set_rating, пересчет рейтинга) только по индексу, без таблицы.
+            models.Index(fields=['book', 'rate'], name='store_rel_book_rate_idx'),
+            # Лайки и закладки пользователя для /book_relation/library/, новые первыми: страница читается
+            # по индексу без сортировки, стоимость не зависит ни от каталога, ни от остальных отношений.
+            models.Index(fields=['user', 'id'], condition=models.Q(like=True), name='store_rel_user_liked_idx'),
+            models.Index(fields=['user', 'id'], condition=models.Q(in_bookmarks=True),
+                         name='store_rel_user_bookmarked_idx'),
+        ]
+
+    # Значения, сохраненные в БД. Нужны, чтобы при save знать, что изменилось.
+    # DEFERRED - поле не загружалось (only/defer), сохраненное значение неизвестно.
+    _saved_rate = None
+    _saved_like = False
+
     def __str__(self):
         return f'{self.user.username}: {self.book.name}, {self.rate}'
 
+    # Запоминаем значения rate и like при загрузке экземпляра из БД.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_rate = instance.__dict__.get('rate', DEFERRED)
+        instance._saved_like = instance.__dict__.get('like', DEFERRED)
+        return instance
+
     # Метод, вызывающийся каждый раз при сохранении модели - ее создании и обновлении.
     # Переопределенный родительский метод из base.
-    # Создан для обновления рейтинга.
+    # Создан для обновления счетчиков книги: они меняются на разницу старых и новых значений.
     def save(self, *args, **kwargs):
+        # True если экземпляр создается, новое отношение - новый читатель книги.
+        creating = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.saved_values_unknown():
+                self.recount_book()
+            else:
+                self.update_book_counters(self._saved_rate, self.rate, self._saved_like, self.like,
+                                          readers_delta=1 if creating else 0)
+        self.remember_saved_values()
+
+    # При удалении отношения его оценка, лайк и читатель убираются из счетчиков книги.
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.saved_values_unknown():
+                self.recount_book()
+            else:
+                self.update_book_counters(self._saved_rate, None, self._saved_like, False, readers_delta=-1)
+        self._saved_rate, self._saved_like = None, False
+        return result
+
+    def saved_values_unknown(self):
+        return self._saved_rate is DEFERRED or self._saved_like is DEFERRED
+
+    # Через __dict__: обращение к отложенному полю загрузило бы его отдельным запросом.
+    def remember_saved_values(self):
+        self._saved_rate = self.__dict__.get('rate', DEFERRED)
+        self._saved_like = self.__dict__.get('like', DEFERRED)
+
+    # Без сохраненных значений разницу не посчитать: счетчики книги пересчитываются с нуля.
+    # Лайк по часам для trending тогда не записывается.
+    def recount_book(self):
+        from store.cache import invalidate_books
+        from store.leaderboards import update_leaderboards
+        from store.logic_relations import recount_books
+
+        recount_books([self.book_id])
+        invalidate_books([self.book_id])
+        update_leaderboards([self.book_id])
+
+    # Один UPDATE книги с F выражениями, если оценка, лайк или число читателей изменились.
+    def update_book_counters(self, old_rate, new_rate, old_like, new_like, readers_delta=0):
         # Локальный импорт, чтобы избавиться от cross import. ImportError.
-        from store.logic_rating import set_rating
+        from store.logic_likes import like_change_updates
+        from store.logic_rating import rate_change_updates
+        from store.logic_readers import readers_change_updates
+
+        updates = {**rate_change_updates(old_rate, new_rate), **like_change_updates(old_like, new_like),
+                   **readers_change_updates(readers_delta)}
+        if updates:
+            from store.cache import invalidate_books
+
+            Book.objects.filter(pk=self.book_id).update(updated_at=Now(), **updates)
+            invalidate_books([self.book_id])
+        from store.leaderboards import affected_boards, record_like_activity, update_leaderboards
+
+        # Лайки по часам для лидерборда trending.
+        like_changed = bool(old_like) != bool(new_like)
+        if like_changed:
+            record_like_activity({self.book_id: 1 if new_like else -1})
+        update_leaderboards([self.book_id], affected_boards(old_rate != new_rate, like_changed))
+
+
+# Изменение количества лайков книги за час (лайки минус снятые лайки) для лидерборда trending.
+# Пополняется при каждом изменении UserBookRelation.like, строки старше окна удаляет refresh_leaderboards.
+class BookLikeActivity(models.Model):
+    # Без ограничения внешнего ключа и каскадного удаления: удаление книг не выполняет лишний DELETE,
+    # а строки удаленных книг пропускаются при построении trending и удаляются вместе со старыми.
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False)
+    # Начало часа в UTC.
+    hour = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+
+    class Meta:
+        # Одна строка на книгу и час: запись - INSERT ... ON CONFLICT DO UPDATE likes = likes + delta.
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'hour'], name='store_like_activity_book_hour_uniq'),
+        ]
+        # Сумма по книгам за окно читается только из индекса.
+        indexes = [
+            models.Index(fields=['hour'], include=['book', 'likes'], name='store_like_activity_hour_idx'),
+        ]
+
+
+# Лидерборд (store/leaderboards.py): время последнего полного перестроения. Строки всех лидербордов
+# создает миграция 0021, после нее лидерборды всегда построены и поддерживаются записью отношений.
+class Leaderboard(models.Model):
+    name = models.CharField(max_length=20, unique=True)
+    computed_at = models.DateTimeField()
+
+
+# Первые LEADERBOARD_SIZE книг лидерборда. Место не хранится: порядок - score, tiebreak по убыванию, затем книга,
+# поэтому изменение одной книги меняет одну строку, а не места всех книг ниже нее.
+class LeaderboardEntry(models.Model):
+    board = models.CharField(max_length=20)
+    # Без ограничения внешнего ключа, как у BookLikeActivity: удаленные книги пропускаются при чтении
+    # и удаляются следующим перестроением.
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False,
+                             related_name='+')
+    # Рейтинг для top-rated, количество лайков для most-liked и trending.
+    score = models.DecimalField(max_digits=12, decimal_places=2)
+    # Второй ключ порядка при равном score: количество оценок для top-rated, иначе 0.
+    tiebreak = models.IntegerField(default=0)
+
+    class Meta:
+        # Строки лидерборда (не больше LEADERBOARD_SIZE) читаются по этому индексу, upsert - ON CONFLICT по нему.
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'book'], name='store_leaderboard_entry_board_book_uniq'),
+        ]
 
-        # True если экземпляр создается и у него нет РК, False - если уже был ранее создан и есть РК.
-        creating = not self.pk
-        old_rating = self.rate
-        super().save(*args, **kwargs)
-        new_rating = self.rate
-        # Проверка необходимости обновления рейтинга.
-        if old_rating != new_rating or creating:
-            set_rating(self.book)
 
+# Похожие книги ("читатели, которым понравилась эта книга, также отметили"): первые
+# RECOMMENDATIONS_TOP_K соседей книги по сходству читателей. Строит python manage.py build_recommendations
+# (store/recommendations.py), отдает /book/{id}/similar/.
+class BookSimilarity(models.Model):
+    # Без ограничений внешних ключей, как у BookLikeActivity: соседи удаленной книги пропускаются
+    # при чтении и удаляются следующим построением.
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False,
+                             related_name='+')
+    similar = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False,
+                                related_name='+')
+    # Место соседа, с 1.
+    rank = models.PositiveSmallIntegerField()
+    # Косинусное сходство векторов читателей книг.
+    score = models.FloatField()
 
+    class Meta:
+        # Соседи книги по порядку - один просмотр индекса на K строк.
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='store_similarity_book_rank_uniq'),
+        ]
 
 
+# Суммы профилирования запросов по endpoint-у (store/profiling.py). Процессы копят суммы в памяти
+# и добавляют их сюда пачками: INSERT ... ON CONFLICT DO UPDATE count = count + delta.
+class EndpointProfile(models.Model):
+    # "GET book-list": метод и имя url.
+    endpoint = models.CharField(max_length=255, unique=True)
+    count = models.BigIntegerField(default=0)
+    slow = models.BigIntegerField(default=0)
+    # Количество запросов к БД.
+    queries = models.BigIntegerField(default=0)
+    # Время участков в микросекундах.
+    total_us = models.BigIntegerField(default=0)
+    db_us = models.BigIntegerField(default=0)
+    serialize_us = models.BigIntegerField(default=0)
+    render_us = models.BigIntegerField(default=0)
+    max_us = models.BigIntegerField(default=0)
@@ -0,0 +1,205 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+# Сортировка ?ordering= дополняется tie_breaker в направлении первого поля, как в KeysetPagination.get_ordering,
+# поэтому порядок книг с равными значениями один и тот же с пагинацией и без нее (BookOrderingFilter).
+def with_tie_breaker(ordering, tie_breaker='id'):
+    if ordering and not any(field.lstrip('-') in (tie_breaker, 'pk') for field in ordering):
+        ordering = [*ordering, ('-' if ordering[0].startswith('-') else '') + tie_breaker]
+    return ordering
+
+
+# Keyset (cursor) пагинация. В отличие от LIMIT/OFFSET следующая страница ищется
+# условием "строго после последней записи" по полям сортировки, поэтому стоимость
+# запроса не зависит от глубины страницы. Для неуникальных полей (price, author_name)
+# к сортировке добавляется id, чтобы позиция в выборке была однозначной.
+class KeysetPagination(BasePagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # Поле, добавляемое в конец сортировки для однозначности позиции.
+    tie_breaker = 'id'
+    # True - пагинация включается только если клиент передал cursor или page_size.
+    optional = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.optional and not self.is_requested(request):
+            return None
+        page_queryset = self.get_page_queryset(queryset, request)
+        return self.get_page(list(page_queryset))
+
+    def is_requested(self, request):
+        return (self.cursor_query_param in request.query_params or
+                self.page_size_query_param in request.query_params)
+
+    # Строит ленивый queryset одной страницы (page_size + 1 запись, чтобы узнать есть ли еще).
+    # Вынесено отдельно от get_page, чтобы queryset можно было выполнить и асинхронно.
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = bool(self.cursor and self.cursor['reverse'])
+        if self.cursor:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(self.cursor['position'], reverse))
+            except (DjangoValidationError, TypeError, ValueError):
+                # Курсор от другой сортировки или подделанный.
+                raise NotFound(self.invalid_cursor_message)
+        order_by = [('-' if desc != reverse else '') + name for name, desc in self.ordering]
+        return queryset.order_by(*order_by)[:self.page_size + 1]
+
+    # Из выбранных строк формирует страницу и позиции для ссылок next/previous.
+    def get_page(self, rows):
+        reverse = bool(self.cursor and self.cursor['reverse'])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        cursor_position = self.cursor['position'] if self.cursor else None
+        self.first_position = self.get_position(rows[0]) if rows else cursor_position
+        self.last_position = self.get_position(rows[-1]) if rows else cursor_position
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_position is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    # Сортировка берется из queryset: ее уже выставили order_by во view или OrderingFilter.
+    # Возвращает список пар (поле, по убыванию), последним всегда идет tie_breaker.
+    def get_ordering(self, queryset):
+        ordering = []
+        for field in queryset.query.order_by:
+            if not isinstance(field, str):
+                continue
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = self.tie_breaker
+            ordering.append((name, field.startswith('-')))
+            if name == self.tie_breaker:
+                break
+        if not ordering or ordering[-1][0] != self.tie_breaker:
+            desc = ordering[0][1] if ordering else False
+            ordering.append((self.tie_breaker, desc))
+        return ordering
+
+    # Условие "после позиции" для сортировки по нескольким полям:
+    # f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...
+    # Дополнительное f1 >= v1 дает индексу границу начала сканирования.
+    def get_keyset_filter(self, position, reverse):
+        keyset = Q()
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, position):
+            lookup = 'lt' if desc != reverse else 'gt'
+            clause = equal & Q(**{f'{name}__{lookup}': value})
+            keyset = clause if not keyset else keyset | clause
+            equal &= Q(**{name: value})
+        first_name, first_desc = self.ordering[0]
+        bound = Q(**{f'{first_name}__{"lte" if first_desc != reverse else "gte"}': position[0]})
+        return bound & keyset
+
+    def get_position(self, row):
+        position = []
+        for name, _ in self.ordering:
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            if isinstance(value, Decimal):
+                value = str(value)
+            elif isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    # Поля сортировки курсора: ['price', 'id'] или ['-price', '-id'].
+    def get_ordering_key(self):
+        return [('-' if desc else '') + name for name, desc in self.ordering]
+
+    # В курсоре сохраняется и сортировка, для которой он выдан: позиция от другой сортировки
+    # с тем же количеством полей фильтровала бы по чужим столбцам.
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'o': self.get_ordering_key(), 'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = b64encode(data.encode('utf-8'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_').decode('utf-8'))
+            ordering, position, reverse = data['o'], data['p'], bool(data['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if (ordering != self.get_ordering_key() or not isinstance(position, list) or
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return {'position': position, 'reverse': reverse}
+
+
+# Пагинация списка книг. Включается, если клиент передал cursor или page_size,
+# без них /book/ по-прежнему отдает весь список.
+class BookPagination(KeysetPagination):
+    optional = True
+
+
+# Пагинация полного списка читателей книги, включена всегда.
+class ReadersPagination(KeysetPagination):
+    page_size = 50
+    max_page_size = 500
+
+
+# Пагинация библиотеки пользователя, включена всегда. Порядок задает view: новые отношения первыми.
+class LibraryPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
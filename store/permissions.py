@@ -8,11 +8,12 @@ class IsOwnerOrStaffOrReadOnly(BasePermission):
     # Если SAFE_METHODS пусть читает, даже если не авторизован.
     # Если метод небезопасный, то пользователь должен быть аутентифицирован и
     # владельцем объекта - книги, либо не владелец, но из персонала.
+    # Сравнивается owner_id, чтобы проверка не загружала владельца отдельным запросом.
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or
             request.user and
-            request.user.is_authenticated and (obj.owner == request.user or request.user.is_staff)
+            request.user.is_authenticated and (obj.owner_id == request.user.id or request.user.is_staff)
         )
 
 
@@ -0,0 +1,258 @@
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from store.models import EndpointProfile
+from store.query_budget import collect_queries
+
+logger = logging.getLogger('store.profiling')
+
+# Метрики запроса, которые суммируются по endpoint-ам (в микросекундах).
+METRICS = ('total', 'db', 'serialize', 'render')
+# Столбцы EndpointProfile кроме endpoint; max_us последним, он не суммируется.
+COLUMNS = ('count', 'slow', 'queries', *(f'{metric}_us' for metric in METRICS), 'max_us')
+
+# Суммы процесса, еще не добавленные в EndpointProfile: endpoint -> {столбец: значение}.
+_lock = threading.Lock()
+_pending = {}
+_pending_requests = 0
+_last_flush = time.monotonic()
+
+# Профиль текущего запроса. ContextVar, а не атрибут request, чтобы сериализатор
+# мог отметить свое время, не зная о запросе.
+_current_profile = ContextVar('store_request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.sections = {}
+        self._depth = {}
+
+    # Время участка. Вложенные вызовы того же участка (сериализатор списка -> сериализатор книги)
+    # не считаются повторно, учитывается только внешний.
+    @contextmanager
+    def section(self, name):
+        depth = self._depth.get(name, 0)
+        self._depth[name] = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] = depth
+            if not depth:
+                self.sections[name] = self.sections.get(name, 0) + time.perf_counter() - start
+
+
+@contextmanager
+def profile_section(name):
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+    else:
+        with profile.section(name):
+            yield
+
+
+# Для сериализаторов: время to_representation попадает в участок serialize профиля запроса.
+class ProfiledSerializerMixin:
+    def to_representation(self, instance):
+        with profile_section('serialize'):
+            return super().to_representation(instance)
+
+
+def _empty_totals():
+    return dict.fromkeys(COLUMNS, 0)
+
+
+# Суммы по endpoint-у копятся в памяти процесса (без обращений к кешу или БД на каждый запрос)
+# и добавляются в таблицу EndpointProfile пачкой: раз в PROFILING_FLUSH_REQUESTS запросов или
+# PROFILING_FLUSH_SECONDS секунд. Возвращает True, если пора вызвать flush_stats.
+def record(endpoint, timings, queries, slow):
+    global _pending_requests
+    total_us = int(timings['total'] * 1_000_000)
+    with _lock:
+        totals = _pending.get(endpoint)
+        if totals is None:
+            totals = _pending[endpoint] = _empty_totals()
+        totals['count'] += 1
+        totals['queries'] += queries
+        totals['slow'] += int(slow)
+        for metric in METRICS:
+            totals[f'{metric}_us'] += int(timings.get(metric, 0) * 1_000_000)
+        totals['max_us'] = max(totals['max_us'], total_us)
+        _pending_requests += 1
+        return (_pending_requests >= settings.PROFILING_FLUSH_REQUESTS
+                or time.monotonic() - _last_flush >= settings.PROFILING_FLUSH_SECONDS)
+
+
+def _take_pending():
+    global _pending, _pending_requests, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        _pending_requests = 0
+        _last_flush = time.monotonic()
+    return pending
+
+
+# Добавить накопленные суммы процесса в EndpointProfile одним INSERT ... ON CONFLICT DO UPDATE.
+# Ошибка БД не должна ломать ответ: суммы этой пачки теряются, ошибка пишется в лог.
+def flush_stats():
+    pending = _take_pending()
+    if not pending:
+        return
+    table = connection.ops.quote_name(EndpointProfile._meta.db_table)
+    columns = [connection.ops.quote_name(column) for column in ('endpoint', *COLUMNS)]
+    greatest = 'GREATEST' if connection.vendor == 'postgresql' else 'MAX'
+    updates = [f'{column} = profile.{column} + EXCLUDED.{column}' for column in columns[1:-1]]
+    max_us = columns[-1]
+    updates.append(f'{max_us} = {greatest}(profile.{max_us}, EXCLUDED.{max_us})')
+    values = ', '.join([f'({", ".join(["%s"] * len(columns))})'] * len(pending))
+    params = [value for endpoint, totals in pending.items()
+              for value in (endpoint, *(totals[column] for column in COLUMNS))]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {table} AS profile ({", ".join(columns)}) VALUES {values} '
+                           f'ON CONFLICT ({columns[0]}) DO UPDATE SET {", ".join(updates)}', params)
+    except DatabaseError:
+        logger.exception('Failed to flush request profiling stats for %d endpoints', len(pending))
+
+
+# Средние значения по endpoint-ам в миллисекундах, сначала самые затратные по суммарному времени.
+# Общие для всех процессов; суммы других процессов видны после их очередного сброса.
+def get_stats():
+    flush_stats()
+    stats = []
+    for profile in EndpointProfile.objects.filter(count__gt=0).order_by('-total_us', 'endpoint'):
+        count = profile.count
+        row = {'endpoint': profile.endpoint, 'count': count, 'slow': profile.slow,
+               'avg_queries': round(profile.queries / count, 2),
+               'total_s': round(profile.total_us / 1_000_000, 3),
+               'max_ms': round(profile.max_us / 1000, 2)}
+        for metric in METRICS:
+            row[f'avg_{metric}_ms'] = round(getattr(profile, f'{metric}_us') / count / 1000, 2)
+        stats.append(row)
+    return stats
+
+
+def reset_stats():
+    _take_pending()
+    EndpointProfile.objects.all().delete()
+
+
+# Сохранить профиль медленного запроса в PROFILING_DIR. Старые файлы сверх PROFILING_MAX_FILES удаляются.
+def dump_profile(profiler, endpoint, total):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = re.sub(r'[^\w.-]+', '_', endpoint)
+    path = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{int(total * 1000)}ms.prof')
+    profiler.dump_stats(path)
+    files = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:max(len(files) - settings.PROFILING_MAX_FILES, 0)]:
+        os.remove(entry.path)
+    return path
+
+
+# Легкий профилировщик запросов для production. Для каждого запроса к endpoint-у с именем url:
+# общее время, количество и время SQL, время сериализации и рендеринга суммируются по endpoint-у
+# в памяти процесса и пачками сбрасываются в EndpointProfile (python manage.py profiling_stats,
+# /profiling/ для персонала). Доля PROFILING_SAMPLE_RATE запросов выполняется под cProfile, и если
+# запрос оказался медленнее PROFILING_SLOW_MS, профиль сохраняется в PROFILING_DIR
+# (смотреть: python -m pstats <файл> или snakeviz).
+# Рендеринг DRF ответа идет после view: начало отмечается в process_template_response,
+# конец - в post render callback ответа.
+class RequestProfilingMiddleware:
+    # Под ASGI с async view middleware работает как корутина, иначе Django выполнял бы
+    # весь async view в отдельном потоке через async_to_sync.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        profiler = None
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Уже работает другой профилировщик.
+                profiler = None
+        start = time.perf_counter()
+        try:
+            with collect_queries() as collector:
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current_profile.reset(token)
+        if self.record(request, profile, collector, time.perf_counter() - start, profiler):
+            flush_stats()
+        return response
+
+    # cProfile здесь не включается: в потоке event loop он профилировал бы и все параллельные запросы.
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        # SQL async view выполняется в потоке sync_to_async (один на запрос), execute_wrapper
+        # нужно поставить на соединение этого потока.
+        queries = collect_queries()
+        collector = await sync_to_async(queries.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.__exit__)(None, None, None)
+            _current_profile.reset(token)
+        if self.record(request, profile, collector, time.perf_counter() - start, None):
+            await sync_to_async(flush_stats)()
+        return response
+
+    # Возвращает True, если пора сбросить суммы процесса в БД (flush_stats).
+    def record(self, request, profile, collector, total, profiler):
+        match = request.resolver_match
+        if match is None or not match.view_name:
+            return False
+        endpoint = f'{request.method} {match.view_name}'
+        timings = {**profile.sections, 'total': total, 'db': collector.total_time_ms / 1000}
+        slow = total * 1000 >= settings.PROFILING_SLOW_MS
+        flush = record(endpoint, timings, len(collector.queries), slow)
+        if slow:
+            path = dump_profile(profiler, endpoint, total) if profiler is not None else None
+            logger.warning('Slow request %s %s: %.1f ms, %d queries (%.1f ms), serialize %.1f ms, '
+                           'render %.1f ms%s', endpoint, request.path, total * 1000, len(collector.queries),
+                           collector.total_time_ms, timings.get('serialize', 0) * 1000,
+                           timings.get('render', 0) * 1000, f', profile {path}' if path else '')
+        return flush
+
+    def process_template_response(self, request, response):
+        profile = _current_profile.get()
+        if profile is not None:
+            section = profile.section('render')
+            section.__enter__()
+
+            # Callback не должен ничего возвращать: возвращенное значение заменило бы ответ.
+            def finish_render(rendered):
+                section.__exit__(None, None, None)
+
+            response.add_post_render_callback(finish_render)
+        return response
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('store.query_budget')
+
+# Служебные запросы транзакций. В тестах atomic внутри TestCase превращается в SAVEPOINT,
+# в работе - в BEGIN/COMMIT, которые через execute не проходят. Не считаются, чтобы бюджет был одинаковым.
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+# Сколько запросов выводить в сообщении о превышении.
+REPORTED_QUERIES = 20
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# Сборщик SQL запросов через connection.execute_wrapper: работает и без DEBUG,
+# в отличие от connection.queries, поэтому подходит для middleware.
+class QueryCollector:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not sql.startswith(IGNORED_PREFIXES):
+                self.queries.append({'sql': sql, 'time_ms': (time.perf_counter() - start) * 1000,
+                                     'alias': context['connection'].alias})
+
+    @property
+    def total_time_ms(self):
+        return sum(query['time_ms'] for query in self.queries)
+
+
+# Собирает запросы ко всем БД из settings.DATABASES.
+@contextmanager
+def collect_queries():
+    collector = QueryCollector()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(collector))
+        yield collector
+
+
+# Бюджеты задаются в settings.QUERY_BUDGETS по ключу "<METHOD> <имя url>", например "GET book-list".
+# HEAD выполняется тем же view, что и GET.
+def get_budget(method, view_name):
+    if method == 'HEAD':
+        method = 'GET'
+    return settings.QUERY_BUDGETS.get(f'{method} {view_name}')
+
+
+# Список нарушений бюджета, пустой если запросов и времени не больше разрешенного.
+# check_time=False - только количество запросов: время SQL зависит от машины и нагрузки.
+def check_budget(budget, collector, check_time=True):
+    violations = []
+    if len(collector.queries) > budget['max_queries']:
+        violations.append(f'{len(collector.queries)} queries > {budget["max_queries"]}')
+    if check_time and collector.total_time_ms > budget['max_time_ms']:
+        violations.append(f'{collector.total_time_ms:.1f} ms SQL > {budget["max_time_ms"]} ms')
+    return violations
+
+
+# Описание нарушения: самые долгие запросы и повторяющиеся (признак N+1).
+def format_violation(key, violations, collector):
+    lines = [f'Query budget exceeded for {key}: {"; ".join(violations)}']
+    repeated = Counter(query['sql'] for query in collector.queries)
+    for sql, count in repeated.most_common():
+        if count < 2:
+            break
+        lines.append(f'  repeated {count} times: {sql}')
+    slowest = sorted(collector.queries, key=lambda query: query['time_ms'], reverse=True)[:REPORTED_QUERIES]
+    for query in slowest:
+        lines.append(f'  {query["time_ms"]:.2f} ms [{query["alias"]}]: {query["sql"]}')
+    return '\n'.join(lines)
+
+
+# Для тестов: with assert_query_budget('GET', 'book-list'): self.client.get(...)
+# Проверяется только max_queries: max_time_ms на общей CI машине давал бы случайные падения,
+# время проверяет QueryBudgetMiddleware в staging.
+@contextmanager
+def assert_query_budget(method, view_name, check_time=False):
+    budget = get_budget(method, view_name)
+    if budget is None:
+        raise QueryBudgetExceeded(f'No query budget declared for {method} {view_name}')
+    with collect_queries() as collector:
+        yield collector
+    violations = check_budget(budget, collector, check_time)
+    if violations:
+        raise QueryBudgetExceeded(format_violation(f'{method} {view_name}', violations, collector))
+
+
+# Middleware для staging: считает запросы каждого запроса и пишет в лог 'store.query_budget'
+# нарушения бюджета вместе с SQL. Ответ не меняется. Подключается в MIDDLEWARE как можно выше,
+# чтобы учитывались и запросы сессии и пользователя. Запросы потокового ответа (/book/export/)
+# выполняются уже после middleware, при отдаче тела, и здесь не учитываются.
+class QueryBudgetMiddleware:
+    # Как RequestProfilingMiddleware, работает и корутиной, чтобы async view не уходили в поток.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with collect_queries() as collector:
+            response = self.get_response(request)
+        self.check(request, collector)
+        return response
+
+    # execute_wrapper ставится в потоке sync_to_async, где выполняется SQL async view.
+    async def __acall__(self, request):
+        queries = collect_queries()
+        collector = await sync_to_async(queries.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.__exit__)(None, None, None)
+        self.check(request, collector)
+        return response
+
+    def check(self, request, collector):
+        match = request.resolver_match
+        budget = get_budget(request.method, match.view_name) if match else None
+        if budget is not None:
+            violations = check_budget(budget, collector)
+            if violations:
+                logger.warning(format_violation(f'{request.method} {match.view_name}', violations, collector))
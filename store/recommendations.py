@@ -0,0 +1,240 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Coalesce
+
+from store.importer import chunked
+from store.models import BookSimilarity, UserBookRelation
+from store.serializers import SimilarBookSerializer
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+# Похожие книги по читателям (item-item): книга - вектор весов ее читателей, сходство двух книг -
+# косинус между векторами. Вес отношения - RECOMMENDATIONS_WEIGHTS: лайк, закладка и каждый балл оценки выше 3.
+# Для каждой книги сохраняются RECOMMENDATIONS_TOP_K соседей в BookSimilarity, /book/{id}/similar/ читает
+# их одним запросом по индексу (book, rank), без расчетов.
+#
+# Построение (python manage.py build_recommendations, по расписанию) на NumPy/SciPy, если они установлены:
+# - отношения читаются пачками по RECOMMENDATIONS_READ_CHUNK (keyset по id) в массивы, выделенные один раз
+#   по количеству отношений. Матрица пользователи x книги и транспонированная к ней держатся в памяти целиком:
+#   CSR - 12 байт на отношение, пик построения - около 50 байт на отношение (массивы id, номера, CSR).
+#   Поэтому отношений не больше RECOMMENDATIONS_MAX_RELATIONS, иначе TooManyRelations до чтения;
+# - пользователи больше чем с RECOMMENDATIONS_MAX_USER_BOOKS книгами не учитываются: они дают
+#   квадратичное число пар и почти не несут сигнала;
+# - сходство считается блоками книг (блок x все книги, разреженное произведение). Размер блока
+#   ограничен оценкой числа пар RECOMMENDATIONS_MAX_BLOCK_PAIRS, поэтому память на блок не зависит
+#   от размера каталога;
+# - соседи блока записываются в своей транзакции, у каждой книги заменяются все сразу.
+# Без NumPy/SciPy - тот же расчет на словарях Python, для небольших каталогов.
+WEIGHTED = Q(like=True) | Q(in_bookmarks=True) | Q(rate__gt=3)
+# Знаков после точки у сходства: одинаковые значения одинаково упорядочены в обоих вариантах расчета.
+SCORE_DIGITS = 9
+
+
+class TooManyRelations(RuntimeError):
+    pass
+
+
+def has_numpy():
+    return np is not None and sparse is not None
+
+
+# Отношения с ненулевым весом пачками: [(id, user_id, book_id, like, in_bookmarks, rate или 0)].
+def iter_interactions(chunk_size):
+    queryset = UserBookRelation.objects.filter(WEIGHTED).order_by('id').values_list(
+        'id', 'user_id', 'book_id', 'like', 'in_bookmarks', Coalesce('rate', 0))
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def relation_weight(like, in_bookmarks, rate, weights):
+    return like * weights['like'] + in_bookmarks * weights['in_bookmarks'] + max(rate - 3, 0) * weights['rate']
+
+
+# Соседи всех книг с отношениями: (book_id, [(similar_id, score)]) по возрастанию book_id.
+# relations - количество отношений с весом: массивы выделяются один раз и заполняются пачками, отношения,
+# добавленные после подсчета, войдут в следующее построение.
+def iter_neighbours_numpy(top_k, chunk_size, max_user_books, max_block_pairs, weights, relations):
+    users = np.empty(relations, dtype=np.int64)
+    books = np.empty(relations, dtype=np.int64)
+    values = np.empty(relations, dtype=np.float64)
+    filled = 0
+    for rows in iter_interactions(chunk_size):
+        chunk = np.array(rows[:relations - filled], dtype=np.int64)
+        end = filled + len(chunk)
+        users[filled:end], books[filled:end] = chunk[:, 1], chunk[:, 2]
+        values[filled:end] = (chunk[:, 3] * weights['like'] + chunk[:, 4] * weights['in_bookmarks'] +
+                              np.maximum(chunk[:, 5] - 3, 0) * weights['rate'])
+        filled = end
+        if filled == relations:
+            break
+    if not filled:
+        return
+    book_ids, book_index = _index(books[:filled], chunk_size)
+    del books
+    user_ids, user_index = _index(users[:filled], chunk_size)
+    del users
+    values = values[:filled]
+    keep = np.bincount(user_index)[user_index] <= max_user_books
+    if not keep.all():
+        values, user_index, book_index = values[keep], user_index[keep], book_index[keep]
+    del keep
+    matrix = sparse.csr_matrix((values, (user_index, book_index)),
+                               shape=(len(user_ids), len(book_ids)), dtype=np.float64)
+    del user_index, book_index, values
+
+    # Столбцы нормируются на месте: произведение нормированных векторов - косинус.
+    norms = np.sqrt(np.bincount(matrix.indices, weights=matrix.data ** 2, minlength=len(book_ids)))
+    norms[norms == 0] = 1
+    matrix.data /= norms[matrix.indices]
+    items = matrix.T.tocsr()
+
+    # Оценка числа пар строки книги в произведении: сумма количества книг ее читателей.
+    user_books = np.diff(matrix.indptr)
+    pairs = np.bincount(np.repeat(np.arange(len(book_ids)), np.diff(items.indptr)),
+                        weights=user_books[items.indices], minlength=len(book_ids))
+    for start, end in _blocks(pairs, max_block_pairs):
+        product = (items[start:end] @ matrix).tocsr()
+        for row in range(end - start):
+            lo, hi = product.indptr[row], product.indptr[row + 1]
+            columns, scores = product.indices[lo:hi], np.round(product.data[lo:hi], SCORE_DIGITS)
+            mask = (columns != start + row) & (scores > 0)
+            columns, scores = columns[mask], scores[mask]
+            if len(scores) > top_k:
+                # Кандидаты - не ниже K-го значения, включая равные ему, затем точный порядок.
+                kth = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+                candidates = scores >= kth
+                columns, scores = columns[candidates], scores[candidates]
+            order = np.lexsort((book_ids[columns], -scores))[:top_k]
+            yield int(book_ids[start + row]), [(int(book_ids[column]), float(score))
+                                               for column, score in zip(columns[order], scores[order])]
+
+
+# Различные id и номер каждого id среди них (int32, как индексы CSR). Номера считаются searchsorted пачками:
+# np.unique(return_inverse=True) держал бы еще несколько временных массивов int64 размером с отношения.
+def _index(ids, chunk_size):
+    unique = np.unique(ids)
+    index = np.empty(len(ids), dtype=np.int32)
+    for start in range(0, len(ids), chunk_size):
+        index[start:start + chunk_size] = np.searchsorted(unique, ids[start:start + chunk_size])
+    return unique, index
+
+
+# Границы блоков книг: суммарная оценка пар блока не больше budget, но не меньше одной книги.
+def _blocks(pairs, budget):
+    cumulative = np.cumsum(pairs)
+    start = 0
+    while start < len(pairs):
+        base = cumulative[start - 1] if start else 0
+        end = max(int(np.searchsorted(cumulative, base + budget, side='right')), start + 1)
+        yield start, end
+        start = end
+
+
+# То же без NumPy/SciPy: все пары книг общих читателей в словаре, память растет с их количеством.
+def iter_neighbours_python(top_k, chunk_size, max_user_books, weights):
+    by_user = defaultdict(dict)
+    for rows in iter_interactions(chunk_size):
+        for _, user_id, book_id, like, in_bookmarks, rate in rows:
+            by_user[user_id][book_id] = relation_weight(like, in_bookmarks, rate, weights)
+    norms = defaultdict(float)
+    products = defaultdict(lambda: defaultdict(float))
+    for books in by_user.values():
+        if len(books) > max_user_books:
+            # Книга остается в результате (без соседей), как и столбец матрицы в iter_neighbours_numpy.
+            for book_id in books:
+                norms.setdefault(book_id, 0.0)
+            continue
+        for book_id, weight in books.items():
+            norms[book_id] += weight * weight
+        for book_id, weight in books.items():
+            for other_id, other_weight in books.items():
+                if other_id != book_id:
+                    products[book_id][other_id] += weight * other_weight
+    for book_id in sorted(norms):
+        scores = [(round(dot / math.sqrt(norms[book_id] * norms[other_id]), SCORE_DIGITS), other_id)
+                  for other_id, dot in products[book_id].items()]
+        top = sorted((item for item in scores if item[0] > 0), key=lambda item: (-item[0], item[1]))[:top_k]
+        yield book_id, [(other_id, score) for score, other_id in top]
+
+
+# Вставка соседей [(book_id, similar_id, rank, score)]. В PostgreSQL одним INSERT ... SELECT FROM unnest,
+# как insert_relations в store/importer.py: bulk_create дольше создает модели и собирает SQL, чем БД вставляет.
+def insert_neighbours(rows):
+    if not rows:
+        return
+    if connection.vendor != 'postgresql':
+        BookSimilarity.objects.bulk_create(
+            [BookSimilarity(book_id=book_id, similar_id=similar_id, rank=rank, score=score)
+             for book_id, similar_id, rank, score in rows], batch_size=5000)
+        return
+    columns = ', '.join(connection.ops.quote_name(BookSimilarity._meta.get_field(name).column)
+                        for name in ('book', 'similar', 'rank', 'score'))
+    sql = f'''
+        INSERT INTO {BookSimilarity._meta.db_table} ({columns})
+        SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::smallint[], %s::double precision[])
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(column) for column in zip(*rows)])
+
+
+# Записать соседей пачками книг: у каждой книги пачки старые соседи заменяются новыми в одной транзакции.
+def save_neighbours(neighbours, batch_books):
+    books = saved = 0
+    for batch in chunked(neighbours, batch_books):
+        rows = [(book_id, similar_id, rank, score)
+                for book_id, similar in batch for rank, (similar_id, score) in enumerate(similar, start=1)]
+        with transaction.atomic():
+            BookSimilarity.objects.filter(book_id__in=[book_id for book_id, _ in batch]).delete()
+            insert_neighbours(rows)
+        books += len(batch)
+        saved += len(rows)
+    return books, saved
+
+
+# Построить и сохранить соседей всех книг. engine - 'numpy', 'python' или None (numpy, если установлен).
+def build_recommendations(top_k=None, engine=None):
+    top_k = top_k or settings.RECOMMENDATIONS_TOP_K
+    engine = engine or ('numpy' if has_numpy() else 'python')
+    if engine == 'numpy' and not has_numpy():
+        raise RuntimeError('NumPy and SciPy are required for the numpy engine.')
+    relations = UserBookRelation.objects.filter(WEIGHTED).count()
+    if relations > settings.RECOMMENDATIONS_MAX_RELATIONS:
+        raise TooManyRelations(f'{relations} weighted relations, RECOMMENDATIONS_MAX_RELATIONS is '
+                               f'{settings.RECOMMENDATIONS_MAX_RELATIONS}.')
+    options = {'top_k': top_k, 'chunk_size': settings.RECOMMENDATIONS_READ_CHUNK,
+               'max_user_books': settings.RECOMMENDATIONS_MAX_USER_BOOKS,
+               'weights': settings.RECOMMENDATIONS_WEIGHTS}
+    if engine == 'numpy':
+        neighbours = iter_neighbours_numpy(max_block_pairs=settings.RECOMMENDATIONS_MAX_BLOCK_PAIRS,
+                                           relations=relations, **options)
+    else:
+        neighbours = iter_neighbours_python(**options)
+    books, saved = save_neighbours(neighbours, settings.RECOMMENDATIONS_BLOCK_BOOKS)
+    # Книги, у которых больше нет отношений с весом. NOT EXISTS, а не NOT IN: PostgreSQL выполняет его
+    # как anti join, NOT IN с подзапросом больше work_mem перебирал бы подзапрос для каждой строки.
+    stale = BookSimilarity.objects.exclude(Exists(UserBookRelation.objects.filter(
+        WEIGHTED, book_id=OuterRef('book_id')))).delete()[0]
+    return {'engine': engine, 'books': books, 'neighbours': saved, 'stale_deleted': stale}
+
+
+# Соседи книги для ответа: limit строк по индексу (book, rank), похожие книги тем же запросом.
+# Соседи удаленных книг отбрасывает INNER JOIN.
+def get_similar_books(book_id, limit):
+    fields = [f'similar__{name}' for name in SimilarBookSerializer.Meta.fields]
+    rows = BookSimilarity.objects.filter(book_id=book_id).select_related('similar').only(
+        'rank', 'score', 'similar_id', *fields).order_by('rank')[:limit]
+    serializer = SimilarBookSerializer()
+    return [{**serializer.to_representation(row.similar), 'score': round(row.score, 4)} for row in rows]
@@ -0,0 +1,50 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON renderer и parser на orjson, если он установлен, иначе обычные JSONRenderer и JSONParser.
+# Включаются в REST_FRAMEWORK (DEFAULT_RENDERER_CLASSES, DEFAULT_PARSER_CLASSES) или во viewset через
+# renderer_classes / parser_classes. Ответ совпадает с JSONRenderer байт в байт: DecimalField сериализаторов
+# уже строки, а типы, которые orjson пишет по-своему (datetime, Decimal и прочие не JSON типы),
+# передаются в default того же JSONEncoder, что у JSONRenderer. Отличие одно: float в экспоненциальной
+# записи orjson пишет без + и ведущего нуля степени (1e16 вместо 1e+16), это то же число.
+# Замеры: python manage.py benchmark renderers.
+
+
+class FastJSONRenderer(JSONRenderer):
+    # OPT_PASSTHROUGH_DATETIME - даты в формате JSONEncoder DRF (миллисекунды, Z), а не orjson.
+    orjson_options = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Отступы (?indent= в Accept) orjson не поддерживает в нужном виде.
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.orjson_options)
+        except TypeError:
+            # Целые больше 64 бит, ключи словарей не строки и т.п. - как у JSONRenderer.
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer экранирует U+2028 и U+2029, они ломают JavaScript при вставке JSON в <script>.
+        # Поиск одного первого байта UTF-8 (memchr) в разы быстрее поиска всей последовательности.
+        if b'\xe2' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8' or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
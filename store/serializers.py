@@ -1,36 +1,83 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, ListSerializer
 
+from .cache import invalidate_books
+from .logic_readers import attach_readers_preview
 from .models import Book, UserBookRelation
+from .profiling import ProfiledSerializerMixin
 
 
 # Сериализатор — переводит структуры данных в последовательность байтов.
-class BookReaderSerializer(ModelSerializer):
+class BookReaderSerializer(ProfiledSerializerMixin, ModelSerializer):
     class Meta:
         model = User
         fields = ('first_name', 'last_name')
 
 
-class BooksSerializer(ModelSerializer):
+# Сериализация списка книг: первые читатели загружаются одним запросом на всю страницу.
+class BooksListSerializer(ProfiledSerializerMixin, ListSerializer):
+    def to_representation(self, data):
+        books = list(data.all() if isinstance(data, models.Manager) else data)
+        attach_readers_preview(books)
+        return super().to_representation(books)
+
+    # Массовое создание: bulk_create пачками по BOOKS_BULK_BATCH_SIZE вместо save на каждую книгу.
+    def create(self, validated_data):
+        books = [Book(**attrs) for attrs in validated_data]
+        Book.objects.bulk_create(books, batch_size=settings.BOOKS_BULK_BATCH_SIZE)
+        for book in books:
+            # У новых книг читателей нет, запрашивать их для ответа не нужно.
+            book.readers_preview = []
+        invalidate_books([book.pk for book in books])
+        return books
+
+    # Массовое изменение: instance - книги в том же порядке, что и элементы validated_data.
+    # bulk_update не заполняет auto_now, поэтому updated_at выставляется явно.
+    def update(self, instance, validated_data):
+        fields = {'updated_at'}
+        now = timezone.now()
+        for book, attrs in zip(instance, validated_data):
+            for name, value in attrs.items():
+                setattr(book, name, value)
+                fields.add(name)
+            book.updated_at = now
+        Book.objects.bulk_update(instance, sorted(fields), batch_size=settings.BOOKS_BULK_BATCH_SIZE)
+        invalidate_books([book.pk for book in instance])
+        return instance
+
+
+class BooksSerializer(ProfiledSerializerMixin, ModelSerializer):
     # Переменная для подсчета вручную.
     # likes_count = serializers.SerializerMethodField()
 
-    # Подсчет через Annotate
-    annotated_likes = serializers.IntegerField(read_only=True)
+    # Подсчет через Annotate. Теперь значение берется из поддерживаемого поля Book.likes_count,
+    # имя поля в ответе прежнее.
+    annotated_likes = serializers.IntegerField(source='likes_count', read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
 
     # source - откуда берем имя владельца книги. Book.owner -> User -> AbstractUser.username
     # пример наследования. owner.username атрибут username ищется в дереве атрибутов и находится у AbstractUser
     owner_name = serializers.CharField(source='owner.username', default='',
                                        read_only=True)
-    # Чтобы вложить нашего reader внутрь словаря с книгой.
-    readers = BookReaderSerializer(many=True, read_only=True)
+    # Чтобы вложить наших readers внутрь словаря с книгой. Отдаются только первые
+    # READERS_PREVIEW_SIZE читателей, общее количество - в readers_count.
+    readers = serializers.SerializerMethodField()
+    readers_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Book
         fields = ('id', 'name', 'price', 'author_name',
-                  'annotated_likes', 'rating', 'owner_name', 'readers')
+                  'annotated_likes', 'rating', 'owner_name', 'readers', 'readers_count')
+        list_serializer_class = BooksListSerializer
+
+    # Для одной книги (не через BooksListSerializer) читатели загружаются отдельным запросом.
+    def get_readers(self, instance):
+        attach_readers_preview([instance])
+        return instance.readers_preview
 
     # Посчитать количество лайков вручную.
     # self - сам сериализатор, instance - то, что мы сериализуем.
@@ -39,9 +86,48 @@ class BooksSerializer(ModelSerializer):
 
 
 # Сериализатор для работы пользователя с книгами(лайки, оценки)
-class UserBookRelationSerializer(ModelSerializer):
+class UserBookRelationSerializer(ProfiledSerializerMixin, ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'in_bookmarks', 'rate')
 
 
+# Элемент массового изменения отношений: book - id книги, остальные поля необязательны.
+# Существование книги проверяется одним запросом на всю пачку, а не PrimaryKeyRelatedField на элемент.
+class BulkRelationItemSerializer(ModelSerializer):
+    book = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = UserBookRelation
+        fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+# Книга в библиотеке пользователя: отношение и нужные поля книги (book - id книги).
+# Книга загружается тем же запросом через select_related, только эти столбцы.
+class LibraryItemSerializer(ModelSerializer):
+    name = serializers.CharField(source='book.name', read_only=True)
+    author_name = serializers.CharField(source='book.author_name', read_only=True)
+    price = serializers.DecimalField(source='book.price', max_digits=7, decimal_places=2, read_only=True)
+    rating = serializers.DecimalField(source='book.rating', max_digits=3, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = UserBookRelation
+        fields = ('book', 'name', 'author_name', 'price', 'rating', 'like', 'in_bookmarks', 'rate')
+
+
+# Книга в лидерборде (store/leaderboards.py). Место и score добавляются при чтении лидерборда.
+class LeaderboardBookSerializer(ModelSerializer):
+    rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Book
+        fields = ('id', 'name', 'author_name', 'price', 'rating', 'rate_count', 'likes_count')
+
+
+# Похожая книга в /book/{id}/similar/ (store/recommendations.py), score добавляется отдельно.
+class SimilarBookSerializer(ModelSerializer):
+    rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Book
+        fields = ('id', 'name', 'author_name', 'price', 'rating')
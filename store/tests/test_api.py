@@ -1,4 +1,5 @@
 import json
+from unittest import mock
 
 from django.contrib.auth.models import User
 from django.db import connection
@@ -61,6 +62,17 @@ class BooksApiTestCase(APITestCase):
         self.assertEqual(status.HTTP_200_OK, response.status_code)
         self.assertEqual(serializer_data, response.data)
 
+    # Тестируем фильтр по диапазону цен, границы включаются.
+    def test_get_filter_price_range(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'price_min': 30, 'price_max': 55})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book_2.id, self.book_3.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'price_max': 25})
+        self.assertEqual([self.book_1.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'price_min': 'cheap'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
     # Тестируем поиск.
     def test_get_search(self):
         url = reverse('book-list')
@@ -124,6 +136,25 @@ class BooksApiTestCase(APITestCase):
         # Проверяем, что поле реально изменилось.
         self.assertEqual(575, self.book_1.price)
 
+    # Лайк и оценка, сохраненные между загрузкой книги и ее сохранением в PATCH, не затираются.
+    def test_update_keeps_counters(self):
+        other = User.objects.create(username='other_reader')
+
+        def validate(serializer, attrs):
+            UserBookRelation.objects.create(user=other, book=self.book_1, like=True, rate=1)
+            return attrs
+
+        self.client.force_login(self.user)
+        with mock.patch.object(BooksSerializer, 'validate', validate):
+            response = self.client.patch(reverse('book-detail', args=(self.book_1.id,)),
+                                         data=json.dumps({'price': 30}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.book_1.refresh_from_db()
+        self.assertEqual(30, self.book_1.price)
+        self.assertEqual((2, 2, 6, '3.00', 2), (self.book_1.likes_count, self.book_1.readers_count,
+                                                self.book_1.rate_sum, str(self.book_1.rating),
+                                                self.book_1.rate_count))
+
     # Тестируем обновление экземпляра.
     def test_update_not_owner(self):
         # Другой авторизованный пользователь, не владелец.
@@ -238,6 +269,7 @@ class BooksApiTestCase(APITestCase):
                         'first_name': '',
                         'last_name': ''
                     }],
+            'readers_count': 1,
         }
 
         self.assertEqual(expecting_data, response.data)
@@ -286,6 +318,11 @@ class BooksRelationTestCase(APITestCase):
         relation = UserBookRelation.objects.get(user=self.user,
                                                 book=self.book_1)
         self.assertTrue(relation.like)
+        # Счетчик лайков книги обновился, в ответе API он отдается как annotated_likes.
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        response = self.client.get(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEqual(1, response.data['annotated_likes'])
 
         # Проверка на присутствия в bookmarks.
         data = {
@@ -347,8 +384,15 @@ class BooksRelationTestCase(APITestCase):
         # Проверка статуса, установления рейтинга не должно быть.
         self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
 
-
-
-
-
-
+    # Снятие лайка через PATCH уменьшает счетчик лайков.
+    def test_unlike(self):
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        self.client.patch(url, data=json.dumps({"like": True}), content_type='application/json')
+        self.client.force_login(self.user2)
+        self.client.patch(url, data=json.dumps({"like": True}), content_type='application/json')
+        response = self.client.patch(url, data=json.dumps({"like": False}),
+                                     content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
@@ -0,0 +1,86 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import LiveServerTestCase, TestCase
+from django.urls import reverse
+
+from store.benchmarks.loadtest import run_load
+from store.models import Book, UserBookRelation
+from store.profiling import get_stats, reset_stats
+
+
+# Тестируем асинхронные list и detail: ответ должен совпадать с синхронными /book/ и /book/{id}/.
+class AsyncBookViewsTestCase(TestCase):
+    def setUp(self):
+        reset_stats()
+        self.user = User.objects.create(username='test_username', first_name='Ivan', last_name='Drago')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 5')
+        self.book_3 = Book.objects.create(name='Test book Author 1', price=55, author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, rate=3)
+
+    async def assertSameResponse(self, sync_url, async_url, params=None):
+        expected = await self.async_client.get(sync_url, params or {})
+        response = await self.async_client.get(async_url, params or {})
+        self.assertEqual((expected.status_code, expected['ETag']), (response.status_code, response['ETag']))
+        # Ссылки пагинации ведут на тот же endpoint, что и запрос.
+        self.assertEqual(expected.content, response.content.replace(async_url.encode(), sync_url.encode()))
+        return response
+
+    async def test_list(self):
+        for params in ({}, {'ordering': '-price'}, {'ordering': 'author_name'}, {'price': 55},
+                       {'search': 'Author 1'}, {'page_size': 2}, {'page_size': 1, 'ordering': '-price'}):
+            await self.assertSameResponse(reverse('book-list'), reverse('async-book-list'), params)
+
+    async def test_pagination(self):
+        url = reverse('async-book-list')
+        response = await self.assertSameResponse(reverse('book-list'), url, {'page_size': 2})
+        next_link = response.json()['next']
+        self.assertIn(url, next_link)
+        response = await self.async_client.get(next_link)
+        self.assertEqual([self.book_3.id], [book['id'] for book in response.json()['results']])
+
+    async def test_detail(self):
+        for book in (self.book_1, self.book_2):
+            await self.assertSameResponse(reverse('book-detail', args=(book.id,)),
+                                          reverse('async-book-detail', args=(book.id,)))
+
+    async def test_errors(self):
+        response = await self.async_client.get(reverse('async-book-detail', args=(0,)))
+        self.assertEqual((404, {'detail': 'Not found.'}), (response.status_code, response.json()))
+        response = await self.async_client.get(reverse('async-book-list'), {'cursor': 'invalid'})
+        self.assertEqual(404, response.status_code)
+        response = await self.async_client.get(reverse('async-book-list'), {'price': 'abc'})
+        self.assertEqual(400, response.status_code)
+        self.assertIn('price', response.json())
+        response = await self.async_client.post(reverse('async-book-list'))
+        self.assertEqual((405, 'GET, HEAD'), (response.status_code, response['Allow']))
+
+    async def test_not_modified(self):
+        url = reverse('async-book-list')
+        response = await self.async_client.get(url)
+        # AsyncClient в Django 4.1 передает extra как заголовки ASGI, а не как ключи META.
+        response = await self.async_client.get(url, **{'If-None-Match': response['ETag']})
+        self.assertEqual((304, b''), (response.status_code, response.content))
+
+    # Middleware профилирования работает в async режиме и видит SQL async view: книги и читатели.
+    async def test_profiled_queries(self):
+        await self.async_client.get(reverse('async-book-list'))
+        await self.async_client.get(reverse('async-book-detail', args=(self.book_1.id,)))
+        stats = {row['endpoint']: row for row in await sync_to_async(get_stats)()}
+        self.assertEqual(2, stats['GET async-book-list']['avg_queries'])
+        self.assertEqual(2, stats['GET async-book-detail']['avg_queries'])
+
+
+# Клиент нагрузочного теста на живом сервере (WSGI, async view выполняется через async_to_sync).
+class LoadTestCase(LiveServerTestCase):
+    def test_run_load(self):
+        Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        for path in (reverse('book-list'), reverse('async-book-list')):
+            result = run_load(f'{self.live_server_url}{path}?page_size=20', concurrency=2, duration=0.3)
+            self.assertGreater(result['requests'], 0)
+            self.assertEqual(0, result['errors'])
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        result = run_load(f'{self.live_server_url}/missing/', concurrency=1, duration=0.1)
+        self.assertEqual(0, result['requests'])
+        self.assertGreater(result['errors'], 0)
@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from store.benchmarks import api, facets, leaderboards, recommendations, relation_upsert, serializers
+from store.benchmarks.data import seed_catalog
+from store.benchmarks.utils import compare_results
+from store.logic_likes import find_like_mismatches
+from store.logic_rating import find_rating_mismatches
+from store.models import Book, UserBookRelation
+
+
+# Тестируем генератор данных и инфраструктуру бенчмарков на маленьком каталоге.
+class BenchmarksTestCase(TestCase):
+    def snapshot(self):
+        return (list(Book.objects.order_by('id').values_list('name', 'price', 'author_name', 'rating')),
+                UserBookRelation.objects.count())
+
+    def test_seed_is_deterministic(self):
+        stats = seed_catalog(books=50, users=20, relations_per_book=5, seed=7)
+        first = self.snapshot()
+        self.assertEqual((50, stats['relations']), (len(first[0]), first[1]))
+        self.assertFalse(find_rating_mismatches().exists() or find_like_mismatches().exists())
+
+        UserBookRelation.objects.all().delete()
+        Book.objects.all().delete()
+        User.objects.all().delete()
+        seed_catalog(books=50, users=20, relations_per_book=5, seed=7)
+        self.assertEqual(first, self.snapshot())
+
+    def test_api_smoke(self):
+        results = api.run({'books': 30, 'users': 10, 'repeat': 1})
+        self.assertEqual(30, results['data']['books'])
+        self.assertEqual(0, results['list_page_anonymous_cached']['queries'])
+        for name in ('list_page', 'detail', 'search', 'filter_price', 'relation_like', 'relation_rate'):
+            self.assertIn('p99_ms', results[name])
+            self.assertIn('peak_mb', results[name])
+
+    # Бенчмарк сам сверяет JSON быстрого пути с BooksSerializer на сгенерированных данных.
+    def test_serializers_smoke(self):
+        results = serializers.run({'books': 30, 'users': 10, 'repeat': 1})
+        self.assertEqual(30, results['rows'])
+        self.assertIn('speedup', results['serialize'])
+
+    def test_relation_upsert_smoke(self):
+        results = relation_upsert.run({'items': 5, 'repeat': 1})
+        self.assertTrue(results['consistent'])
+        for name in relation_upsert.PATHS:
+            self.assertIn('queries_per_op', results[name]['unchanged'])
+
+    def test_leaderboards_smoke(self):
+        results = leaderboards.run({'books': 60, 'repeat': 1})
+        for board in ('top-rated', 'most-liked'):
+            self.assertTrue(results[board]['consistent'])
+        # Без изменений: строки лидерборда и значения книги.
+        self.assertEqual(2, results['most-liked']['update']['queries'])
+        self.assertEqual(1, results['trending']['read']['queries'])
+        self.assertEqual(1, results['api']['queries'])
+
+    def test_recommendations_smoke(self):
+        results = recommendations.run({'books': 40, 'users': 15, 'relations_per_book': 5, 'repeat': 1})
+        self.assertGreater(results['python']['neighbours'], 0)
+        self.assertEqual(1, results['similar']['queries'])
+        if 'numpy' in results:
+            self.assertTrue(results['same_neighbours'])
+
+    def test_facets_smoke(self):
+        results = facets.run({'books': 60, 'repeat': 1})
+        for scenario in ('all', 'price_range'):
+            self.assertTrue(results[scenario]['consistent'])
+            self.assertEqual(1, results[scenario]['grouped']['queries'])
+        self.assertEqual(0, results['api_cached']['queries'])
+
+    def test_compare_results(self):
+        baseline = {'meta': {'commit': 'a'}, 'api': {'detail': {'median_ms': 10, 'queries': 2, 'other': 5}}}
+        current = {'meta': {'commit': 'b'}, 'api': {'detail': {'median_ms': 15, 'queries': 2, 'other': 50},
+                                                    'search': {'median_ms': 1}}}
+        self.assertEqual([('api.detail.median_ms', 10, 15, 1.5), ('api.detail.queries', 2, 2, 1.0)],
+                         compare_results(baseline, current))
@@ -0,0 +1,117 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+# Тестируем массовое создание, изменение и удаление книг.
+class BulkBooksApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2', owner=self.user)
+        self.book_3 = Book.objects.create(name='Test book 3', price=75, author_name='Author 3', owner=self.user2)
+        self.list_url = reverse('book-list')
+        self.bulk_url = reverse('book-bulk')
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url, data=json.dumps(data), content_type='application/json')
+
+    def test_create(self):
+        self.client.force_login(self.user)
+        data = [{'name': f'Bulk book {i}', 'price': '10.50', 'author_name': 'Bulk author'} for i in range(30)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send('post', self.list_url, data)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(30, len(response.data))
+        self.assertEqual('test_username', response.data[0]['owner_name'])
+        self.assertEqual([], response.data[0]['readers'])
+        self.assertEqual(30, Book.objects.filter(author_name='Bulk author', owner=self.user).count())
+        self.assertEqual(1, len([query for query in queries if query['sql'].startswith('INSERT INTO "store_book"')]))
+
+    def test_create_invalid(self):
+        self.client.force_login(self.user)
+        response = self.send('post', self.list_url, [{'name': 'Bulk book', 'price': '10.50', 'author_name': 'A'},
+                                                     {'name': 'Bulk book', 'price': 'wrong'}])
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('price', response.data[1])
+        self.assertEqual(3, Book.objects.count())
+
+    def test_create_not_authenticated(self):
+        response = self.send('post', self.list_url, [{'name': 'Bulk book', 'price': '10.50', 'author_name': 'A'}])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual(3, Book.objects.count())
+
+    @override_settings(BOOKS_BULK_MAX_ITEMS=1)
+    def test_create_too_many(self):
+        self.client.force_login(self.user)
+        response = self.send('post', self.list_url, [{'name': 'Bulk book', 'price': '10.50', 'author_name': 'A'}] * 2)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_update(self):
+        self.client.force_login(self.user)
+        updated_at = self.book_1.updated_at
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send('patch', self.bulk_url, [{'id': self.book_2.id, 'price': '60.00'},
+                                                          {'id': self.book_1.id, 'name': 'Renamed'}])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book_2.id, self.book_1.id], [book['id'] for book in response.data])
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEqual(('Renamed', 25), (self.book_1.name, self.book_1.price))
+        self.assertEqual(('Test book 2', 60), (self.book_2.name, self.book_2.price))
+        self.assertGreater(self.book_1.updated_at, updated_at)
+        # Одна выборка книг и один UPDATE, без запросов на каждую книгу.
+        self.assertEqual(1, len([query for query in queries if query['sql'].startswith('UPDATE "store_book"')]))
+        self.assertEqual(1, len([query for query in queries if 'FROM "store_book"' in query['sql']]))
+
+    def test_update_not_owner(self):
+        self.client.force_login(self.user)
+        response = self.send('patch', self.bulk_url, [{'id': self.book_1.id, 'price': '1.00'},
+                                                      {'id': self.book_3.id, 'price': '1.00'}])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.book_1.refresh_from_db()
+        self.assertEqual(25, self.book_1.price)
+
+    def test_update_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.send('patch', self.bulk_url, [{'id': self.book_3.id, 'price': '1.00'}])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_update_wrong_ids(self):
+        self.client.force_login(self.user)
+        response = self.send('patch', self.bulk_url, [{'id': 100500, 'price': '1.00'}])
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = self.send('patch', self.bulk_url, [{'id': self.book_1.id}, {'id': self.book_1.id}])
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.send('patch', self.bulk_url, [{'price': '1.00'}])
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_delete(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True)
+        self.client.force_login(self.user)
+        response = self.send('delete', self.bulk_url, [self.book_1.id, self.book_2.id])
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual([self.book_3.id], list(Book.objects.values_list('id', flat=True)))
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_delete_not_owner(self):
+        self.client.force_login(self.user)
+        response = self.send('delete', self.bulk_url, [self.book_1.id, self.book_3.id])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual(3, Book.objects.count())
+
+    def test_not_authenticated(self):
+        response = self.send('delete', self.bulk_url, [self.book_1.id])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
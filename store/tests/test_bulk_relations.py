@@ -0,0 +1,133 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.logic_relations import apply_relations, recount_books
+from store.models import Book, UserBookRelation
+
+
+# Тестируем массовое изменение отношений.
+class ApplyRelationsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, rate=3)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True, rate=5)
+
+    def test_apply(self):
+        results = apply_relations(self.user, [
+            {'book': self.book_1.id, 'like': True, 'rate': 5},
+            {'book': self.book_2.id, 'in_bookmarks': True, 'rate': 2},
+        ])
+        self.assertEqual([{'book': self.book_1.id, 'status': 'updated'},
+                          {'book': self.book_2.id, 'status': 'created'}], results)
+
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        self.assertEqual((True, False, 5), (relation.like, relation.in_bookmarks, relation.rate))
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_2)
+        self.assertEqual((False, True, 2), (relation.like, relation.in_bookmarks, relation.rate))
+
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEqual(('5.00', 2, 2), (str(self.book_1.rating), self.book_1.likes_count, self.book_1.readers_count))
+        self.assertEqual(('2.00', 0, 1), (str(self.book_2.rating), self.book_2.likes_count, self.book_2.readers_count))
+
+    def test_item_errors(self):
+        results = apply_relations(self.user, [
+            {'book': self.book_2.id, 'rate': 30},
+            {'like': True},
+            {'book': 100500, 'like': True},
+            'book',
+            {'book': self.book_1.id, 'rate': 3},
+        ])
+        self.assertEqual(['error', 'error', 'error', 'error', 'unchanged'], [result['status'] for result in results])
+        self.assertIn('rate', results[0]['errors'])
+        self.assertEqual({'book': ['Book not found.']}, results[2]['errors'])
+        self.assertFalse(UserBookRelation.objects.filter(book=self.book_2).exists())
+
+    # Повтор книги в пачке: поля применяются по порядку к одному отношению.
+    def test_duplicates(self):
+        apply_relations(self.user, [{'book': self.book_2.id, 'like': True},
+                                    {'book': self.book_2.id, 'rate': 4}])
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_2)
+        self.assertEqual((True, 4), (relation.like, relation.rate))
+
+    # Отношение создано одновременным запросом после SELECT ... FOR UPDATE: bulk_create падает
+    # с IntegrityError, пачка применяется заново к сохраненному отношению.
+    def test_concurrent_create(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, like=True)
+        select_for_update = UserBookRelation.objects.select_for_update
+        calls = []
+
+        def stale_select():
+            calls.append(1)
+            return select_for_update().none() if len(calls) == 1 else select_for_update()
+
+        with mock.patch.object(UserBookRelation.objects, 'select_for_update', stale_select):
+            results = apply_relations(self.user, [{'book': self.book_2.id, 'like': True, 'rate': 4}])
+        self.assertEqual(2, len(calls))
+        self.assertEqual([{'book': self.book_2.id, 'status': 'updated'}], results)
+        self.book_2.refresh_from_db()
+        self.assertEqual(('4.00', 1, 1), (str(self.book_2.rating), self.book_2.likes_count, self.book_2.readers_count))
+
+    # Запросы не зависят от количества элементов: пересчет книг и обновление лидербордов одни на пачку.
+    def test_queries(self):
+        books = Book.objects.bulk_create(
+            [Book(name=f'Book {i}', price=i, author_name='Author') for i in range(50)])
+        with CaptureQueriesContext(connection) as queries:
+            apply_relations(self.user, [{'book': book.id, 'like': True} for book in books])
+        book_updates = [query for query in queries if query['sql'].startswith('UPDATE "store_book"')]
+        self.assertEqual(1, len(book_updates))
+        self.assertLess(len(queries), 14)
+        self.assertEqual(50, Book.objects.filter(likes_count=1, readers_count=1).count())
+
+    def test_recount_books(self):
+        Book.objects.update(rate_sum=0, rate_count=0, rating=None, likes_count=0, readers_count=0)
+        recount_books([self.book_1.id])
+        self.book_1.refresh_from_db()
+        self.assertEqual((8, 2, '4.00', 1, 2), (self.book_1.rate_sum, self.book_1.rate_count,
+                                                str(self.book_1.rating), self.book_1.likes_count,
+                                                self.book_1.readers_count))
+
+
+class BulkRelationsApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.url = reverse('userbookrelation-bulk')
+
+    def test_bulk(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, data=json.dumps([{'book': self.book.id, 'like': True}]),
+                                    content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'results': [{'book': self.book.id, 'status': 'created'}]}, response.data)
+        self.assertEqual(1, self.client.get(reverse('book-detail', args=(self.book.id,))).data['annotated_likes'])
+
+    def test_not_authenticated(self):
+        response = self.client.post(self.url, data=json.dumps([{'book': self.book.id, 'like': True}]),
+                                    content_type='application/json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_not_list(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, data=json.dumps({'book': self.book.id}),
+                                    content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    @override_settings(RELATIONS_BULK_MAX_ITEMS=1)
+    def test_too_many(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, data=json.dumps([{'book': self.book.id}] * 2),
+                                    content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
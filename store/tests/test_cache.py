@@ -0,0 +1,117 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache, get_cache_stats
+from store.models import Book, UserBookRelation
+
+
+# Тестируем кеш ответов для анонимных пользователей.
+class BookCacheTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        self.list_url = reverse('book-list')
+        self.detail_url = reverse('book-detail', args=(self.book_1.id,))
+
+    def test_list_hit(self):
+        first = self.client.get(self.list_url, data={'price': 25, 'search': 'Test'})
+        self.assertEqual('MISS', first['X-Cache'])
+        with CaptureQueriesContext(connection) as queries:
+            # Порядок параметров не важен.
+            second = self.client.get(self.list_url, data={'search': 'Test', 'price': 25})
+        self.assertEqual('HIT', second['X-Cache'])
+        self.assertEqual(0, len(queries))
+        self.assertEqual(first.data, second.data)
+
+    def test_different_params(self):
+        self.client.get(self.list_url, data={'price': 25})
+        response = self.client.get(self.list_url, data={'price': 55})
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual([self.book_2.id], [book['id'] for book in response.data])
+
+    def test_detail_hit(self):
+        self.client.get(self.detail_url)
+        response = self.client.get(self.detail_url)
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertEqual(self.book_1.id, response.data['id'])
+
+    def test_not_found_not_cached(self):
+        url = reverse('book-detail', args=(0,))
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertEqual({'hits': 0, 'misses': 2, 'hit_rate': 0.0}, get_cache_stats())
+
+    def test_authenticated_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(self.list_url)
+        response = self.client.get(self.list_url)
+        self.assertFalse(response.has_header('X-Cache'))
+
+    # Изменение книги сбрасывает список и ее карточку, но не карточки других книг.
+    def test_update_invalidates(self):
+        other_url = reverse('book-detail', args=(self.book_2.id,))
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        self.client.get(other_url)
+
+        self.client.force_login(self.user)
+        self.client.patch(self.detail_url, data=json.dumps({'price': 30}), content_type='application/json')
+        self.client.logout()
+
+        response = self.client.get(self.list_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('30.00', response.data[0]['price'])
+        response = self.client.get(self.detail_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('30.00', response.data['price'])
+        self.assertEqual('HIT', self.client.get(other_url)['X-Cache'])
+
+    def test_create_and_delete_invalidate(self):
+        self.client.get(self.list_url)
+        book = Book.objects.create(name='Test book 3', price=10, author_name='Author 3')
+        self.assertEqual(3, len(self.client.get(self.list_url).data))
+        book.delete()
+        self.assertEqual(2, len(self.client.get(self.list_url).data))
+
+    # Лайк и оценка меняют annotated_likes и rating - кеш сбрасывается.
+    def test_relation_invalidates(self):
+        self.client.get(self.detail_url)
+        self.client.force_login(self.user)
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                          data=json.dumps({'like': True, 'rate': 4}), content_type='application/json')
+        self.client.logout()
+        response = self.client.get(self.detail_url)
+        self.assertEqual(1, response.data['annotated_likes'])
+        self.assertEqual('4.00', response.data['rating'])
+
+    # Закладка не меняет ответ API книги, кеш остается.
+    def test_bookmark_keeps_cache(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_1)
+        self.client.get(self.detail_url)
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        relation.in_bookmarks = True
+        relation.save()
+        self.assertEqual('HIT', self.client.get(self.detail_url)['X-Cache'])
+
+    def test_stats(self):
+        self.client.get(self.list_url)
+        self.client.get(self.list_url)
+        self.client.get(self.list_url)
+        self.assertEqual({'hits': 2, 'misses': 1, 'hit_rate': 0.6667}, get_cache_stats())
+
+        url = reverse('book-cache-stats')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, response.data['hits'])
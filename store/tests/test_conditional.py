@@ -0,0 +1,149 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache
+from store.models import Book, UserBookRelation
+
+
+# Тестируем ETag, Last-Modified и ответы 304.
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        self.list_url = reverse('book-list')
+        self.detail_url = reverse('book-detail', args=(self.book_1.id,))
+        # Авторизованные запросы не кешируются, так проверяется путь через БД.
+        self.client.force_login(self.user)
+
+    def test_headers(self):
+        response = self.client.get(self.detail_url)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('GMT', response['Last-Modified'])
+
+    def test_detail_not_modified(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        # Сессия, пользователь и один запрос id/updated_at книги.
+        book_queries = [query for query in queries if 'store_book' in query['sql']]
+        self.assertEqual(1, len(book_queries))
+        self.assertNotIn('auth_user', book_queries[0]['sql'])
+
+    def test_detail_if_modified_since(self):
+        last_modified = self.client.get(self.detail_url)['Last-Modified']
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    # Условный запрос с некорректным id - 404, как и без заголовков.
+    def test_detail_invalid_id(self):
+        url = reverse('book-detail', args=('abc',))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(url).status_code)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(url, HTTP_IF_NONE_MATCH='"x"').status_code)
+        self.assertEqual(status.HTTP_404_NOT_FOUND,
+                         self.client.get(url, HTTP_IF_MODIFIED_SINCE='Wed, 21 Oct 2015 07:28:00 GMT').status_code)
+
+    # Лайк меняет updated_at книги, ETag становится другим.
+    def test_relation_changes_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                          data=json.dumps({'like': True}), content_type='application/json')
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        self.assertEqual(1, response.data['annotated_likes'])
+
+    # owner_name и имена читателей в ответе: переименование и удаление пользователя меняют ETag книг.
+    def test_user_changes_etag(self):
+        owner = User.objects.create(username='owner')
+        reader = User.objects.create(username='reader', first_name='Old')
+        Book.objects.filter(pk=self.book_2.pk).update(owner=owner)
+        UserBookRelation.objects.create(user=reader, book=self.book_1, like=True)
+        url = reverse('book-detail', args=(self.book_2.id,))
+
+        def changed(url, change):
+            etag = self.client.get(url)['ETag']
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            return response.data
+
+        owner.username = 'renamed'
+        self.assertEqual('renamed', changed(url, owner.save)['owner_name'])
+        reader.first_name = 'New'
+        self.assertEqual('New', changed(self.detail_url, reader.save)['readers'][0]['first_name'])
+        self.assertEqual('', changed(url, owner.delete)['owner_name'])
+
+    # Сохранение без полей из ответа (вход пользователя) книги не трогает.
+    def test_user_login_keeps_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.user.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_list_not_modified(self):
+        etag = self.client.get(self.list_url, data={'price': 25})['ETag']
+        response = self.client.get(self.list_url, data={'price': 25}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        # Другие параметры - другой ETag.
+        response = self.client.get(self.list_url, data={'price': 55}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_list_create_and_delete(self):
+        etag = self.client.get(self.list_url)['ETag']
+        book = Book.objects.create(name='Test book 3', price=10, author_name='Author 3')
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        etag = response['ETag']
+        book.delete()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, len(response.data))
+
+    # У списка нет Last-Modified: после удаления книги If-Modified-Since не дает 304 со старым списком.
+    def test_list_if_modified_since_after_delete(self):
+        response = self.client.get(self.list_url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        since = self.client.get(self.detail_url)['Last-Modified']
+        self.book_2.delete()
+        for authenticated in (True, False):
+            if not authenticated:
+                self.client.logout()
+            response = self.client.get(self.list_url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual([self.book_1.id], [book['id'] for book in response.data])
+
+    def test_paginated_page(self):
+        first = self.client.get(self.list_url, data={'page_size': 1, 'ordering': 'price'})
+        second_url = first.data['next']
+        etag = self.client.get(second_url)['ETag']
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED,
+                         self.client.get(second_url, HTTP_IF_NONE_MATCH=etag).status_code)
+        # Изменение книги на первой странице не меняет ETag второй.
+        self.book_1.name = 'Test book 1 updated'
+        self.book_1.save()
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED,
+                         self.client.get(second_url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    # Анонимный запрос из кеша отдает 304 без обращений к БД.
+    def test_cached_not_modified(self):
+        self.client.logout()
+        etag = self.client.get(self.detail_url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertEqual(0, len(queries))
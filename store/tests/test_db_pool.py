@@ -0,0 +1,163 @@
+import threading
+import time
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.db.pool import ConnectionPool, PoolTimeout, close_pools, get_pools
+
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'psycopg2 connection pool')
+
+
+# Тестируем пул соединений на настоящих соединениях к тестовой БД.
+@postgresql_only
+class ConnectionPoolTestCase(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        self.conn_params = connection.get_connection_params()
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close_all()
+
+    def make_pool(self, **options):
+        import psycopg2
+
+        pool = ConnectionPool(lambda: psycopg2.connect(**self.conn_params), **options)
+        self.pools.append(pool)
+        return pool
+
+    def test_reuse(self):
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(first, pool.getconn())
+        stats = pool.get_stats()
+        self.assertEqual((1, 2, 1, 0), (stats['created'], stats['checkouts'], stats['in_use'], stats['idle']))
+
+    # Незавершенная транзакция откатывается, закрытое соединение выбрасывается.
+    def test_putconn_state(self):
+        pool = self.make_pool()
+        connection_1 = pool.getconn()
+        with connection_1.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        pool.putconn(connection_1)
+        self.assertIs(connection_1, pool.getconn())
+        self.assertEqual(0, connection_1.info.transaction_status)
+        connection_1.close()
+        pool.putconn(connection_1)
+        stats = pool.get_stats()
+        self.assertEqual((1, 0, 0), (stats['closed'], stats['size'], stats['idle']))
+
+    # Соединение, которое сервер закрыл, пока оно было свободно, не выдается.
+    def test_health_check(self):
+        pool = self.make_pool(check_after=0)
+        connection_1 = pool.getconn()
+        pid = connection_1.get_backend_pid()
+        pool.putconn(connection_1)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        time.sleep(0.05)
+        connection_2 = pool.getconn()
+        self.assertIsNot(connection_1, connection_2)
+        self.assertEqual(2, pool.get_stats()['created'])
+
+    def test_max_lifetime(self):
+        pool = self.make_pool(max_lifetime=0)
+        connection_1 = pool.getconn()
+        pool.putconn(connection_1)
+        self.assertTrue(connection_1.closed)
+
+    def test_timeout(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(1, pool.get_stats()['timeouts'])
+
+    # Потоков больше, чем соединений: ждут свободное, соединений не больше max_size.
+    def test_threads(self):
+        pool = self.make_pool(max_size=2, timeout=5)
+        errors = []
+
+        def worker():
+            try:
+                conn = pool.getconn()
+                time.sleep(0.02)
+                pool.putconn(conn)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.get_stats()
+        self.assertEqual([], errors)
+        self.assertLessEqual(stats['created'], 2)
+        self.assertEqual(6, stats['checkouts'])
+        self.assertGreater(stats['waits'], 0)
+        self.assertGreater(stats['max_wait_ms'], 0)
+
+
+# DatabaseWrapper бэкенда с пулом: закрытое Django соединение возвращается в пул.
+@postgresql_only
+class PoolBackendTestCase(SimpleTestCase):
+    databases = {'default'}
+    alias = 'pool_test'
+
+    # Алиас добавляется в connections: обработчик connection_created из django.contrib.postgres ищет его там.
+    def setUp(self):
+        connections.settings[self.alias] = {**connection.settings_dict, 'CONN_MAX_AGE': 0,
+                                            'ENGINE': 'store.db.backends.postgresql_pool',
+                                            'OPTIONS': {'pool': {'max_size': 2}}}
+        self.wrapper = connections[self.alias]
+
+    def tearDown(self):
+        self.wrapper.close()
+        close_pools(self.alias)
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+    def query(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0]
+
+    def test_reuse(self):
+        for _ in range(3):
+            self.assertEqual(1, self.query())
+            self.wrapper.close()
+        [(_, pool)] = get_pools(self.alias)
+        stats = pool.get_stats()
+        self.assertEqual((1, 3, 1), (stats['created'], stats['checkouts'], stats['idle']))
+
+    def test_discard_after_error(self):
+        from django.db import DatabaseError
+
+        with self.assertRaises(DatabaseError):
+            with self.wrapper.cursor() as cursor:
+                cursor.execute('SELECT * FROM missing_table')
+        self.wrapper.close()
+        [(_, pool)] = get_pools(self.alias)
+        self.assertEqual((1, 0), (pool.get_stats()['closed'], pool.get_stats()['size']))
+
+
+class ConnectionStatsTestCase(APITestCase):
+    def test_get(self):
+        url = reverse('db-stats')
+        self.client.force_login(User.objects.create(username='test_username'))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
+        self.client.force_login(User.objects.create(username='test_staff', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], response.data['default']['conn_max_age'])
+        self.assertIn('opened', response.data['default'])
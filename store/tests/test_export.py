@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+# Тестируем потоковую выгрузку каталога.
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test, "book" 2', price=55, author_name='Author 5')
+        self.book_3 = Book.objects.create(name='Test book Author 1', price=55, author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+        self.url = reverse('book-export')
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([self.book_1.id, self.book_2.id, self.book_3.id], [row['id'] for row in rows])
+        self.assertEqual({'id': self.book_1.id, 'name': 'Test book 1', 'price': '25.00', 'author_name': 'Author 1',
+                          'annotated_likes': 1, 'rating': '5.00', 'owner_name': 'test_username',
+                          'readers_count': 1}, rows[0])
+        self.assertEqual((None, ''), (rows[1]['rating'], rows[1]['owner_name']))
+
+    # Поля совпадают с ответом API, кроме вложенного списка readers.
+    def test_same_as_api(self):
+        api = self.client.get(reverse('book-list')).data
+        rows = [json.loads(line) for line in self.read(self.client.get(self.url)).splitlines()]
+        for book in api:
+            book.pop('readers')
+        self.assertEqual(json.loads(json.dumps(api)), rows)
+
+    def test_csv(self):
+        response = self.client.get(self.url, data={'export_format': 'csv'})
+        self.assertEqual('text/csv; charset=utf-8', response['Content-Type'])
+        rows = list(csv.reader(io.StringIO(self.read(response))))
+        self.assertEqual(['id', 'name', 'price', 'author_name', 'annotated_likes', 'rating', 'owner_name',
+                          'readers_count'], rows[0])
+        self.assertEqual([str(self.book_2.id), 'Test, "book" 2', '55.00', 'Author 5', '0', '', '', '0'], rows[2])
+
+    def test_filters(self):
+        response = self.client.get(self.url, data={'price': 55, 'ordering': '-author_name'})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([self.book_2.id, self.book_3.id], [row['id'] for row in rows])
+        response = self.client.get(self.url, data={'search': 'Author 1'})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual({self.book_1.id, self.book_3.id}, {row['id'] for row in rows})
+
+    def test_wrong_format(self):
+        response = self.client.get(self.url, data={'export_format': 'xml'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('export_catalog', '--price', '55', '--chunk-size', '1', stdout=output)
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([self.book_2.id, self.book_3.id], [row['id'] for row in rows])
+
+    def test_command_csv_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.csv')
+            call_command('export_catalog', '--export-format', 'csv', '--output', path)
+            with open(path, encoding='utf-8', newline='') as file:
+                self.assertEqual(4, len(list(csv.reader(file))))
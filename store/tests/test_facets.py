@@ -0,0 +1,98 @@
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache
+from store.facets import get_facets
+from store.models import Book
+from store.views import BookViewSet
+
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+
+
+# Тестируем фасеты списка книг /book/facets/.
+@override_settings(BOOKS_PRICE_FACET_BUCKETS=[50, 100, 500], BOOKS_AUTHOR_FACET_SIZE=2)
+class FacetsApiTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        for name, price, author_name in (('Python basics', 25, 'Author B'), ('Python advanced', 50, 'Author A'),
+                                         ('Django', 75, 'Author B'), ('Go', 600, 'Author C'),
+                                         ('Rust', 90, 'Author A')):
+            Book.objects.create(name=name, price=price, author_name=author_name)
+        self.url = reverse('book-facets')
+
+    def get(self, **params):
+        response = self.client.get(self.url, data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response.data
+
+    def test_facets(self):
+        self.assertEqual({
+            'count': 5,
+            # Диапазон включает нижнюю границу и не включает верхнюю.
+            'price': [{'min': None, 'max': '50.00', 'count': 1}, {'min': '50.00', 'max': '100.00', 'count': 3},
+                      {'min': '100.00', 'max': '500.00', 'count': 0}, {'min': '500.00', 'max': None, 'count': 1}],
+            # Первые BOOKS_AUTHOR_FACET_SIZE авторов, при равенстве - по имени.
+            'authors': [{'author_name': 'Author A', 'count': 2}, {'author_name': 'Author B', 'count': 2}],
+        }, self.get())
+
+    def test_filters_and_search(self):
+        data = self.get(price_min=50, price_max=100)
+        self.assertEqual(3, data['count'])
+        self.assertEqual([0, 3, 0, 0], [bucket['count'] for bucket in data['price']])
+        data = self.get(search='python')
+        self.assertEqual([1, 1, 0, 0], [bucket['count'] for bucket in data['price']])
+        self.assertEqual([('Author A', 1), ('Author B', 1)],
+                         [(author['author_name'], author['count']) for author in data['authors']])
+
+    def test_empty(self):
+        data = self.get(price_min=1000)
+        self.assertEqual(0, data['count'])
+        self.assertEqual([0, 0, 0, 0], [bucket['count'] for bucket in data['price']])
+        self.assertEqual([], data['authors'])
+
+    # Все фасеты - один запрос, список книг не загружается.
+    def test_single_query(self):
+        self.client.force_authenticate(User.objects.create(username='reader'))
+        with CaptureQueriesContext(connection) as queries:
+            self.get(price_min=50)
+        self.assertEqual(1, len(queries))
+
+    # Анонимным пользователям - из кеша ответов, изменение книги сбрасывает его.
+    def test_cache(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(first, self.get())
+        # Те же параметры у списка - отдельный ключ кеша.
+        self.assertIsInstance(self.client.get(reverse('book-list')).data, list)
+        book = Book.objects.get(name='Go')
+        book.price = 10
+        book.save()
+        self.assertEqual(2, self.get()['price'][0]['count'])
+
+
+# Тестируем, что фасеты без фильтров читаются только из индекса (price, id) INCLUDE (author_name).
+@postgresql_only
+class FacetsIndexTestCase(TestCase):
+    def setUp(self):
+        Book.objects.bulk_create([Book(name=f'Book {i}', price=i % 700, author_name=f'Author {i % 13}')
+                                  for i in range(200)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Book._meta.db_table}')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def test_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            facets = get_facets(BookViewSet.queryset)
+        self.assertEqual(200, facets['count'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {queries[0]["sql"]}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Index Only Scan using store_book_price_id_author_idx', plan)
@@ -0,0 +1,161 @@
+import io
+import json
+import math
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from store.importer import BookImporter, RelationImporter, find_relations, insert_relations
+from store.models import Book, BookLikeActivity, UserBookRelation
+
+
+# Тестируем импорт книг и отношений.
+class ImportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def call(self, *args):
+        output, errors = io.StringIO(), io.StringIO()
+        call_command('import_catalog', *args, stdout=output, stderr=errors)
+        return json.loads(output.getvalue()), errors.getvalue()
+
+    def test_books_csv(self):
+        path = self.write('books.csv', 'name,price,author_name,owner\n'
+                                       'Book A,10.5,Author A,test_username\n'
+                                       'Book B,wrong,Author B,\n'
+                                       'Book C,7,Author C,\n'
+                                       'Book D,7,Author D,nobody\n')
+        stats, errors = self.call(path, '--chunk-size', '2')
+        self.assertEqual({'rows': 4, 'created': 2, 'updated': 0, 'skipped': 2}, stats)
+        self.assertIn('row 2: price must be a decimal', errors)
+        self.assertIn('row 4: unknown owner nobody', errors)
+        book = Book.objects.get(name='Book A')
+        self.assertEqual((self.user, '10.50'), (book.owner, str(book.price)))
+        if connection.vendor == 'postgresql':
+            self.assertEqual(1, Book.objects.filter(search_vector__isnull=False, name='Book C').count())
+
+    # Строки с id обновляют существующие книги, новые книги после них получают свободные id.
+    def test_books_with_ids(self):
+        path = self.write('books.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'id': self.book.id, 'name': 'Renamed', 'price': 30, 'author_name': 'Author 1'},
+            {'id': self.book.id + 100, 'name': 'Book X', 'price': 1, 'author_name': 'Author X'},
+        ]))
+        stats, _ = self.call(path)
+        self.assertEqual((1, 1), (stats['created'], stats['updated']))
+        self.book.refresh_from_db()
+        self.assertEqual('Renamed', self.book.name)
+        new_book = Book.objects.create(name='After import', price=1, author_name='Author')
+        self.assertGreater(new_book.id, self.book.id + 100)
+        # Повторный импорт ничего не дублирует.
+        self.call(path)
+        self.assertEqual(3, Book.objects.count())
+
+    def test_relations(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book, rate=1)
+        rows = [
+            {'user': 'test_username', 'book': self.book.id, 'like': True, 'rate': 5},
+            {'user': 'reader', 'book': self.book.id, 'like': 'yes', 'in_bookmarks': '1', 'rate': 3},
+            {'user': 'reader', 'book': 100500},
+            {'user': 'ghost', 'book': self.book.id},
+            {'user': 'reader2', 'book': self.book.id, 'rate': 30},
+        ]
+        path = self.write('relations.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        User.objects.create(username='reader')
+        stats, errors = self.call(path, '--kind', 'relations')
+        self.assertEqual({'rows': 5, 'created': 1, 'updated': 1, 'skipped': 3, 'recounted_books': 1}, stats)
+        self.assertIn('unknown book 100500', errors)
+        self.assertIn('rate must be between 1 and 5', errors)
+
+        self.book.refresh_from_db()
+        self.assertEqual(('4.00', 2, 2), (str(self.book.rating), self.book.likes_count, self.book.readers_count))
+        relation = UserBookRelation.objects.get(user__username='reader')
+        self.assertEqual((True, True, 3), (relation.like, relation.in_bookmarks, relation.rate))
+
+    def test_relations_create_users(self):
+        path = self.write('relations.csv', f'user,book,like\nnew_reader,{self.book.id},1\n'
+                                           f'new_reader,{self.book.id},0\n')
+        stats, _ = self.call(path, '--kind', 'relations')
+        self.assertEqual((0, 1), (stats['created'], stats['skipped']))
+        stats, _ = self.call(path, '--kind', 'relations', '--create-users')
+        self.assertEqual(1, stats['created'])
+        # Из повторяющихся строк остается последняя.
+        self.assertFalse(UserBookRelation.objects.get(user__username='new_reader').like)
+
+    # Строка задает отношение целиком: не указанные поля сбрасываются в значения по умолчанию.
+    def test_relations_replace(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True, rate=4)
+        RelationImporter().run([{'user': 'test_username', 'book': self.book.id, 'in_bookmarks': 'true'}])
+        relation = UserBookRelation.objects.get(user=self.user)
+        self.assertEqual((False, True, None), (relation.like, relation.in_bookmarks, relation.rate))
+        self.book.refresh_from_db()
+        self.assertEqual((None, 0), (self.book.rating, self.book.likes_count))
+
+    # Существующие отношения ищутся по парам: отношения других пар тех же пользователей и книг не читаются.
+    def test_find_relations(self):
+        other_user = User.objects.create(username='other')
+        other_book = Book.objects.create(name='Test book 2', price=25, author_name='Author 2')
+        first = UserBookRelation.objects.create(user=self.user, book=self.book, like=True)
+        UserBookRelation.objects.create(user=self.user, book=other_book)
+        UserBookRelation.objects.create(user=other_user, book=self.book)
+        last = UserBookRelation.objects.create(user=other_user, book=other_book)
+        found = find_relations([(self.user.id, self.book.id), (other_user.id, other_book.id),
+                                (other_user.id, 100500)])
+        self.assertEqual({(self.user.id, self.book.id): (first.id, True),
+                          (other_user.id, other_book.id): (last.id, False)}, found)
+
+    # Импортированные лайки учитываются в лайках по часам для trending: новые +1, снятые -1.
+    def test_relations_like_activity(self):
+        reader = User.objects.create(username='reader')
+        other_book = Book.objects.create(name='Test book 2', price=25, author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True)
+        UserBookRelation.objects.create(user=reader, book=other_book, like=True)
+        BookLikeActivity.objects.all().delete()
+        RelationImporter().run([{'user': 'test_username', 'book': self.book.id, 'like': False},
+                                {'user': 'reader', 'book': self.book.id, 'in_bookmarks': True},
+                                {'user': 'reader', 'book': other_book.id, 'like': True},
+                                {'user': 'test_username', 'book': other_book.id, 'like': True}])
+        self.assertEqual({self.book.id: -1, other_book.id: 1},
+                         dict(BookLikeActivity.objects.values_list('book', 'likes')))
+
+    # Неразобранная строка NDJSON и строка не объект пропускаются с ошибкой, остальные импортируются.
+    def test_invalid_ndjson_lines(self):
+        path = self.write('books.ndjson', '{"name": "Book A", "price": 1, "author_name": "Author A"}\n'
+                                          '{"name": "Broken",\n'
+                                          '[1]\n'
+                                          '{"name": "Book B", "price": 2, "author_name": "Author B"}\n')
+        stats, errors = self.call(path)
+        self.assertEqual({'rows': 4, 'created': 2, 'updated': 0, 'skipped': 2}, stats)
+        self.assertIn('row 2: invalid JSON', errors)
+        self.assertIn('row 3: row must be an object', errors)
+
+    # Отношение, созданное после чтения существующих отношений пачки, перезаписывается, а не отменяет пачку.
+    def test_insert_relations_conflict(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book, rate=1)
+        insert_relations([(self.user.id, self.book.id, True, False, 5)])
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        self.assertEqual((True, False, 5), (relation.like, relation.in_bookmarks, relation.rate))
+
+    # Пачка - savepoint, один запрос пользователей и вставка. Вставка одним запросом, если БД позволяет
+    # столько параметров (в SQLite bulk_create делит ее на пачки по bulk_batch_size).
+    def test_queries_per_chunk(self):
+        rows = [{'name': f'Book {i}', 'price': i, 'author_name': 'Author', 'owner': 'test_username'}
+                for i in range(100)]
+        fields = [field for field in Book._meta.concrete_fields if not field.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, rows)
+        with self.assertNumQueries(3 + math.ceil(len(rows) / batch_size)):
+            BookImporter(chunk_size=100).run(rows)
@@ -0,0 +1,76 @@
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.logic_likes import find_like_mismatches
+from store.models import Book, UserBookRelation
+
+# Планы запросов проверяются только в PostgreSQL.
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+
+
+# Тестируем уникальность отношения пользователя к книге.
+class RelationUniqueTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(name='Book', price=10, author_name='Author')
+
+    def test_duplicate(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                UserBookRelation.objects.create(user=self.user, book=self.book, like=True)
+        self.book.refresh_from_db()
+        self.assertEqual((1, 0), (self.book.readers_count, self.book.likes_count))
+
+    def test_patch_twice(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('userbookrelation-detail', args=(self.book.id,))
+        for data in ({'like': True}, {'rate': 4}):
+            response = self.client.patch(url, data, format='json')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([(True, 4)], list(UserBookRelation.objects.values_list('like', 'rate')))
+
+
+# Тестируем, что горячие запросы к отношениям используют свои индексы (EXPLAIN).
+# На маленькой тестовой таблице планировщик выбрал бы полный просмотр, поэтому он выключен.
+@postgresql_only
+class RelationIndexesTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}') for i in range(5)]
+        self.book = Book.objects.create(name='Book', price=10, author_name='Author')
+        for i, user in enumerate(self.users):
+            UserBookRelation.objects.create(user=user, book=self.book, like=i % 2 == 0, rate=i or None)
+        # Статистика по данным теста, а не по тому, что осталось в таблице от других тестов.
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {UserBookRelation._meta.db_table}')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    # get_or_create в UserBooksRelationView.
+    def test_user_book_lookup(self):
+        plan = UserBookRelation.objects.filter(user=self.users[0], book_id=self.book.id).explain()
+        self.assertIn('store_rel_user_book_uniq', plan)
+
+    # Пересчет likes_count: частичный индекс только по отношениям с лайком.
+    def test_likes_count(self):
+        # Bitmap-просмотр маленькой таблицы одинаково дешев по любому частичному индексу лайков.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+        plan = UserBookRelation.objects.filter(book=self.book, like=True).values('book').annotate(
+            total=Count('id')).explain()
+        self.assertIn('store_rel_book_liked_idx', plan)
+        self.assertFalse(find_like_mismatches().exists())
+
+    # Сумма и количество оценок (set_rating) читаются только из индекса.
+    def test_rating_aggregate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+        plan = UserBookRelation.objects.filter(book=self.book).values('book').annotate(
+            rate_sum=Sum('rate'), rate_count=Count('rate')).explain()
+        self.assertIn('Index Only Scan using store_rel_book_rate_idx', plan)
@@ -0,0 +1,197 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.leaderboards import (LEADERBOARDS, current_hour, most_liked, record_like_activity, refresh_leaderboards,
+                                top_rated)
+from store.logic_relations import apply_relation, apply_relations, upsert_relation
+from store.models import Book, BookLikeActivity, Leaderboard, LeaderboardEntry, UserBookRelation
+
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+
+
+def leaderboard_url(board):
+    return reverse('book-leaderboard', args=(board,))
+
+
+# Тестируем лидерборды /book/leaderboards/{board}/. Их строит запись отношений, без refresh_leaderboards.
+@override_settings(LEADERBOARD_MIN_VOTES=2)
+class LeaderboardApiTestCase(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+        self.books = [Book.objects.create(name=f'Book {i}', price=10, author_name='Author') for i in range(4)]
+        # Book 0: 5 и 5 - две оценки, Book 1: 4, 4, 5, Book 2: одна оценка 5 (меньше порога), Book 3: без оценок.
+        for book, rates in zip(self.books, ((5, 5), (4, 4, 5), (5,))):
+            for user, rate in zip(self.users, rates):
+                UserBookRelation.objects.create(user=user, book=book, rate=rate, like=book != self.books[0])
+
+    def get(self, board, **params):
+        response = self.client.get(leaderboard_url(board), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response.data
+
+    def ids(self, board):
+        return [item['id'] for item in self.get(board)['results']]
+
+    def test_top_rated(self):
+        data = self.get('top-rated')
+        self.assertEqual('top-rated', data['board'])
+        self.assertEqual([(1, self.books[0].id, '5.00'), (2, self.books[1].id, '4.33')],
+                         [(item['rank'], item['id'], item['score']) for item in data['results']])
+        self.assertEqual({'rank': 1, 'id': self.books[0].id, 'name': 'Book 0', 'author_name': 'Author',
+                          'price': '10.00', 'rating': '5.00', 'rate_count': 2, 'likes_count': 0, 'score': '5.00'},
+                         data['results'][0])
+
+    def test_most_liked(self):
+        data = self.get('most-liked')
+        self.assertEqual([(self.books[1].id, 3), (self.books[2].id, 1)],
+                         [(item['id'], item['score']) for item in data['results']])
+
+    # Лайки вне окна не учитываются, снятый лайк вычитается.
+    def test_trending(self):
+        BookLikeActivity.objects.create(book=self.books[2], hour=current_hour() - timedelta(days=2), likes=50)
+        UserBookRelation.objects.create(user=self.users[0], book=self.books[3], like=True)
+        relation = UserBookRelation.objects.get(user=self.users[2], book=self.books[1])
+        relation.like = False
+        relation.save()
+        data = self.get('trending')
+        self.assertEqual([(self.books[1].id, 2), (self.books[2].id, 1), (self.books[3].id, 1)],
+                         [(item['id'], item['score']) for item in data['results']])
+
+    def test_limit(self):
+        self.assertEqual(1, len(self.get('most-liked', limit=1)['results']))
+        response = self.client.get(leaderboard_url('most-liked'), data={'limit': 0})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_unknown(self):
+        response = self.client.get(leaderboard_url('newest'))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    # Изменения отношений видны сразу, ответ - один запрос к БД.
+    def test_updated_by_relations(self):
+        relation = UserBookRelation.objects.create(user=self.users[0], book=self.books[3], like=True)
+        with self.assertNumQueries(1):
+            self.assertEqual([self.books[1].id, self.books[2].id, self.books[3].id], self.ids('most-liked'))
+        relation.delete()
+        self.assertEqual([self.books[1].id, self.books[2].id], self.ids('most-liked'))
+        # Книга 1 опускается ниже книги 0, книга 0 без оценки выбывает: меньше порога голосов.
+        for relation in UserBookRelation.objects.filter(book=self.books[1]):
+            relation.rate = 1
+            relation.save()
+        self.assertEqual([self.books[0].id, self.books[1].id], self.ids('top-rated'))
+        UserBookRelation.objects.filter(book=self.books[0], user=self.users[0]).delete()
+        self.assertEqual([self.books[1].id], self.ids('top-rated'))
+
+    # Полный лидерборд: книга, опустившаяся ниже последнего места, уступает его книге не из лидерборда.
+    @override_settings(LEADERBOARD_SIZE=2)
+    def test_full_board(self):
+        refresh_leaderboards()
+        UserBookRelation.objects.create(user=self.users[1], book=self.books[3], like=True)
+        # Книги 2 и 3 - по лайку, место у книги с меньшим id.
+        self.assertEqual([self.books[1].id, self.books[2].id], self.ids('most-liked'))
+        self.assertEqual(2, LeaderboardEntry.objects.filter(board='most-liked').count())
+        relation = UserBookRelation.objects.get(user=self.users[0], book=self.books[2])
+        relation.like = False
+        relation.save()
+        self.assertEqual([self.books[1].id, self.books[3].id], self.ids('most-liked'))
+
+    # Все пути записи отношений оставляют лидерборды такими же, как их перестроение.
+    def test_same_as_refresh(self):
+        upsert_relation(self.users[0], self.books[3].id, {'like': True, 'rate': 4})
+        apply_relation(self.users[1], self.books[3].id, {'rate': 5})
+        apply_relations(self.users[2], [{'book': self.books[2].id, 'rate': 2, 'like': True},
+                                        {'book': self.books[3].id, 'like': True}])
+        UserBookRelation.objects.filter(book=self.books[1], user=self.users[2]).delete()
+        self.users[0].delete()
+        boards = {board: self.get(board)['results'] for board in LEADERBOARDS}
+        refresh_leaderboards()
+        self.assertEqual(boards, {board: self.get(board)['results'] for board in LEADERBOARDS})
+        # По одному лайку: лайки удаленного пользователя и удаленное отношение вычтены.
+        self.assertEqual([self.books[1].id, self.books[2].id, self.books[3].id], self.ids('most-liked'))
+
+    # Лидерборд, которого нет в таблице: пустой, computed_at = null.
+    def test_not_built(self):
+        Leaderboard.objects.all().delete()
+        LeaderboardEntry.objects.all().delete()
+        with self.assertNumQueries(2):
+            data = self.get('top-rated')
+        self.assertEqual({'board': 'top-rated', 'computed_at': None, 'results': []}, data)
+
+    def test_refresh_command(self):
+        LeaderboardEntry.objects.all().delete()
+        BookLikeActivity.objects.create(book=self.books[2], hour=current_hour() - timedelta(days=2), likes=50)
+        out = StringIO()
+        call_command('refresh_leaderboards', stdout=out)
+        self.assertIn('Pruned like activity rows: 1', out.getvalue())
+        self.assertIn('Rebuilt trending: 2 books.', out.getvalue())
+        data = self.get('trending')
+        self.assertEqual(2, len(data['results']))
+        self.assertIsNotNone(data['computed_at'])
+
+
+# Тестируем учет лайков по часам всеми путями изменения отношений.
+class LikeActivityTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(name='Book', price=10, author_name='Author')
+
+    def activity(self):
+        return list(BookLikeActivity.objects.values_list('book', 'hour', 'likes'))
+
+    def test_record(self):
+        other = Book.objects.create(name='Other', price=10, author_name='Author')
+        record_like_activity({self.book.id: 2, other.id: 0})
+        record_like_activity({self.book.id: -1})
+        self.assertEqual([(self.book.id, current_hour(), 1)], self.activity())
+
+    def test_relation_paths(self):
+        upsert_relation(self.user, self.book.id, {'like': True})
+        apply_relation(self.user, self.book.id, {'rate': 4})
+        apply_relations(self.user, [{'book': self.book.id, 'like': False}, {'book': self.book.id, 'like': True}])
+        UserBookRelation.objects.get(user=self.user, book=self.book).delete()
+        # +1 (upsert), 0 (оценка), -1 +1 (bulk), -1 (удаление отношения с лайком).
+        self.assertEqual([(self.book.id, current_hour(), 0)], self.activity())
+
+    def test_upsert_unchanged(self):
+        upsert_relation(self.user, self.book.id, {'like': True})
+        upsert_relation(self.user, self.book.id, {'like': True, 'in_bookmarks': True})
+        self.assertEqual([(self.book.id, current_hour(), 1)], self.activity())
+
+
+# Тестируем, что перестроение лидербордов читает первые книги по индексам, без сортировки каталога.
+@postgresql_only
+class LeaderboardIndexesTestCase(TestCase):
+    def setUp(self):
+        Book.objects.bulk_create([Book(name=f'Book {i}', price=10, author_name='Author', likes_count=i % 4,
+                                       rate_sum=i % 9, rate_count=i % 3, rating=(i % 9) / 3 if i % 3 else None)
+                                  for i in range(100)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Book._meta.db_table}')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def explain(self, build):
+        with CaptureQueriesContext(connection) as queries:
+            build(10)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {queries[0]["sql"]}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_top_rated(self):
+        plan = self.explain(top_rated)
+        self.assertIn('store_book_top_rated_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_most_liked(self):
+        plan = self.explain(most_liked)
+        self.assertIn('store_book_most_liked_idx', plan)
+        self.assertNotIn('Sort', plan)
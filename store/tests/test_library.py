@@ -0,0 +1,105 @@
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+
+
+# Тестируем библиотеку пользователя /book_relation/library/.
+class LibraryApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        other = User.objects.create(username='other')
+        self.books = [Book.objects.create(name=f'Book {i}', price=10 + i, author_name=f'Author {i}')
+                      for i in range(6)]
+        # 0 - лайк, 1 - закладка, 2 - оценка, 3 - лайк и оценка, 4 - отношение без отметок, 5 - чужое.
+        for book, values in zip(self.books[:5], ({'like': True}, {'in_bookmarks': True}, {'rate': 4},
+                                                 {'like': True, 'rate': 2}, {})):
+            UserBookRelation.objects.create(user=self.user, book=book, **values)
+        UserBookRelation.objects.create(user=other, book=self.books[5], like=True)
+        self.url = reverse('userbookrelation-library')
+        self.client.force_authenticate(self.user)
+
+    def book_ids(self, params=None):
+        response = self.client.get(self.url, data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [item['book'] for item in response.data['results']]
+
+    def test_library(self):
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # Новые отношения первыми, без отношения без отметок и чужого.
+        self.assertEqual([book.id for book in reversed(self.books[:4])],
+                         [item['book'] for item in response.data['results']])
+        self.assertEqual({'book': self.books[3].id, 'name': 'Book 3', 'author_name': 'Author 3', 'price': '13.00',
+                          'rating': '2.00', 'like': True, 'in_bookmarks': False, 'rate': 2},
+                         response.data['results'][0])
+
+    def test_filters(self):
+        ids = [book.id for book in self.books]
+        self.assertEqual([ids[3], ids[0]], self.book_ids({'like': 'true'}))
+        self.assertEqual([ids[1]], self.book_ids({'in_bookmarks': 'true'}))
+        self.assertEqual([ids[3], ids[2]], self.book_ids({'rated': 'true'}))
+        self.assertEqual([ids[1], ids[0]], self.book_ids({'rated': 'false'}))
+        self.assertEqual([ids[3]], self.book_ids({'like': 'true', 'rated': 'true'}))
+
+    # Нераспознанное значение фильтра не применяется, как у BooleanFilter в остальных фильтрах.
+    def test_unknown_filter_value(self):
+        self.assertEqual(4, len(self.book_ids({'like': 'maybe'})))
+
+    def test_pages(self):
+        response = self.client.get(self.url, data={'page_size': 3})
+        ids = [item['book'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids.extend(item['book'] for item in response.data['results'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([book.id for book in reversed(self.books[:4])], ids)
+
+    # Один запрос на страницу (пользователь задан force_authenticate), книга только с нужными столбцами.
+    def test_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(1, len(queries))
+        self.assertNotIn('search_vector', queries[0]['sql'])
+        self.assertNotIn('readers_count', queries[0]['sql'])
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+# Тестируем, что страница библиотеки с фильтром читается по частичным индексам лайков и закладок.
+@postgresql_only
+class LibraryIndexesTestCase(TestCase):
+    def setUp(self):
+        # Отношения многих пользователей, чтобы условие по user_id было избирательным.
+        users = User.objects.bulk_create([User(username=f'reader{i}') for i in range(50)])
+        self.user = users[0]
+        books = Book.objects.bulk_create([Book(name=f'Book {i}', price=10, author_name='Author') for i in range(10)])
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=user, book=book, like=i % 2 == 0, in_bookmarks=i % 2 == 1)
+            for user in users for i, book in enumerate(books)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {UserBookRelation._meta.db_table}')
+            # На маленькой таблице планировщик выбрал бы полный просмотр или bitmap с сортировкой.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def test_liked(self):
+        plan = UserBookRelation.objects.filter(user=self.user, like=True).order_by('-id')[:21].explain()
+        self.assertIn('store_rel_user_liked_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_bookmarked(self):
+        plan = UserBookRelation.objects.filter(user=self.user, in_bookmarks=True).order_by('-id')[:21].explain()
+        self.assertIn('store_rel_user_bookmarked_idx', plan)
+        self.assertNotIn('Sort', plan)
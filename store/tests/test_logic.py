@@ -1,6 +1,16 @@
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
+from django.contrib import admin
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
-from store.logic_rating import set_rating
+from django.test.utils import CaptureQueriesContext
+from store.logic_likes import find_like_mismatches, rebuild_likes
+from store.logic_rating import set_rating, find_rating_mismatches, rebuild_ratings
+from store.logic_readers import find_reader_mismatches
 from store.models import Book, UserBookRelation
 
 
@@ -12,6 +22,7 @@ class LogicTestCase(TestCase):
                                     first_name='Apollo', last_name='Creed')
         user3 = User.objects.create(username='user3',
                                     first_name='Vin', last_name='Diesel')
+        self.user4 = User.objects.create(username='user4')
 
         self.book_1 = Book.objects.create(name='Test book 1', price=25,
                                           author_name='Author 1', owner=user1)
@@ -27,5 +38,171 @@ class LogicTestCase(TestCase):
         self.book_1.refresh_from_db()
         self.assertEqual('4.67', str(self.book_1.rating))
 
+    # Счетчики обновляются при создании отношений.
+    def test_counters_on_create(self):
+        self.book_1.refresh_from_db()
+        self.assertEqual(14, self.book_1.rate_sum)
+        self.assertEqual(3, self.book_1.rate_count)
+        self.assertEqual('4.67', str(self.book_1.rating))
+
+    # Изменение оценки: разница старой и новой оценки, без агрегации по всем отношениям.
+    def test_change_rate(self):
+        relation = UserBookRelation.objects.get(user__username='user3', book=self.book_1)
+        relation.rate = 1
+        with CaptureQueriesContext(connection) as queries:
+            relation.save()
+        self.assertFalse([query for query in queries if 'AVG' in query['sql'] or 'SUM' in query['sql']])
+        self.book_1.refresh_from_db()
+        self.assertEqual(11, self.book_1.rate_sum)
+        self.assertEqual(3, self.book_1.rate_count)
+        self.assertEqual('3.67', str(self.book_1.rating))
 
+    # Отношение без оценки и снятие оценки не учитываются в количестве.
+    def test_rate_removed(self):
+        relation = UserBookRelation.objects.create(user=self.user4, book=self.book_1, like=True)
+        self.book_1.refresh_from_db()
+        self.assertEqual(3, self.book_1.rate_count)
+
+        relation.rate = 2
+        relation.save()
+        relation.rate = None
+        relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(14, self.book_1.rate_sum)
+        self.assertEqual(3, self.book_1.rate_count)
+
+    # Сохранение без изменения оценки не трогает книгу.
+    def test_save_without_rate_change(self):
+        relation = UserBookRelation.objects.get(user__username='user1', book=self.book_1)
+        relation.in_bookmarks = True
+        with CaptureQueriesContext(connection) as queries:
+            relation.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "store_book"')])
+
+    def test_delete(self):
+        UserBookRelation.objects.get(user__username='user3', book=self.book_1).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(10, self.book_1.rate_sum)
+        self.assertEqual(2, self.book_1.rate_count)
+        self.assertEqual('5.00', str(self.book_1.rating))
 
+    def test_delete_last_rate(self):
+        for relation in UserBookRelation.objects.filter(book=self.book_1):
+            relation.delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(0, self.book_1.rate_count)
+        self.assertIsNone(self.book_1.rating)
+
+    # Отношение загружено без rate или like: сохраненное значение неизвестно, счетчики пересчитываются,
+    # а не меняются на разницу (иначе существующая оценка учлась бы второй раз).
+    def test_deferred_fields(self):
+        relation = UserBookRelation.objects.defer('rate').get(user__username='user3', book=self.book_1)
+        relation.in_bookmarks = True
+        relation.save()
+        relation = UserBookRelation.objects.only('id', 'book_id', 'user_id', 'rate').get(pk=relation.pk)
+        relation.rate = 1
+        relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual((11, 3, '3.67', 3), (self.book_1.rate_sum, self.book_1.rate_count,
+                                              str(self.book_1.rating), self.book_1.likes_count))
+        UserBookRelation.objects.only('id', 'book_id').get(pk=relation.pk).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual((10, 2, 2, 2), (self.book_1.rate_sum, self.book_1.rate_count, self.book_1.likes_count,
+                                         self.book_1.readers_count))
+
+    # Удаление пользователя (каскад) и массовое удаление отношений обходят UserBookRelation.delete.
+    def test_delete_user_and_queryset(self):
+        User.objects.get(username='user3').delete()
+        UserBookRelation.objects.filter(user__username='user2').delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual((5, 1, '5.00', 1, 1), (self.book_1.rate_sum, self.book_1.rate_count, str(self.book_1.rating),
+                                                self.book_1.likes_count, self.book_1.readers_count))
+        self.assertFalse(find_rating_mismatches().exists())
+        self.assertFalse(find_like_mismatches().exists())
+        self.assertFalse(find_reader_mismatches().exists())
+
+    # "delete selected" в админке удаляет отношения через queryset.delete().
+    def test_admin_delete_selected(self):
+        model_admin = admin.site._registry[UserBookRelation]
+        model_admin.delete_queryset(None, UserBookRelation.objects.filter(user__username__in=['user1', 'user2']))
+        self.book_1.refresh_from_db()
+        self.assertEqual((4, 1, 1, 1), (self.book_1.rate_sum, self.book_1.rate_count, self.book_1.likes_count,
+                                        self.book_1.readers_count))
+
+    # Полный пересчет исправляет рассинхронизированные счетчики.
+    def test_rebuild(self):
+        Book.objects.filter(pk=self.book_1.pk).update(rate_sum=0, rate_count=0, rating=None)
+        self.assertEqual([self.book_1.id], [book.id for book in find_rating_mismatches()])
+        rebuild_ratings()
+        self.book_1.refresh_from_db()
+        self.assertEqual(14, self.book_1.rate_sum)
+        self.assertEqual(3, self.book_1.rate_count)
+        self.assertEqual('4.67', str(self.book_1.rating))
+        self.assertFalse(find_rating_mismatches().exists())
+
+    # Рейтинг, не совпадающий со счетчиками, - тоже расхождение.
+    def test_rating_mismatch(self):
+        self.assertFalse(find_rating_mismatches().exists())
+        Book.objects.filter(pk=self.book_1.pk).update(rating=5)
+        self.assertEqual([self.book_1.id], [book.id for book in find_rating_mismatches()])
+        Book.objects.filter(pk=self.book_1.pk).update(rating=None)
+        self.assertEqual([self.book_1.id], [book.id for book in find_rating_mismatches()])
+        rebuild_ratings()
+        self.assertFalse(find_rating_mismatches().exists())
+
+    # Миграция 0009 заполняет счетчики и пересчитывает по ним рейтинг, записанный при создании книги.
+    def test_fill_rate_counters_migration(self):
+        Book.objects.filter(pk=self.book_1.pk).update(rate_sum=0, rate_count=0, rating=1)
+        import_module('store.migrations.0009_book_rate_counters').fill_rate_counters(apps, None)
+        self.book_1.refresh_from_db()
+        self.assertEqual('4.67', str(self.book_1.rating))
+        self.assertFalse(find_rating_mismatches().exists())
+
+    def test_rebuild_command(self):
+        Book.objects.filter(pk=self.book_1.pk).update(rate_sum=1, rate_count=1, rating=1)
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.rate_count)
+
+        call_command('rebuild_counters', stdout=StringIO())
+        self.book_1.refresh_from_db()
+        self.assertEqual(3, self.book_1.rate_count)
+        self.assertEqual('4.67', str(self.book_1.rating))
+
+    # Лайк и его снятие меняют likes_count на единицу.
+    def test_like_counter(self):
+        self.book_1.refresh_from_db()
+        self.assertEqual(3, self.book_1.likes_count)
+
+        relation = UserBookRelation.objects.create(user=self.user4, book=self.book_1)
+        relation.like = True
+        relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(4, self.book_1.likes_count)
+
+        relation.like = False
+        relation.save()
+        relation.delete()
+        UserBookRelation.objects.get(user__username='user1', book=self.book_1).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(2, self.book_1.likes_count)
+
+    # Одновременное изменение оценки и лайка - один UPDATE книги.
+    def test_like_and_rate_one_update(self):
+        relation = UserBookRelation.objects.create(user=self.user4, book=self.book_1)
+        relation.like = True
+        relation.rate = 1
+        with CaptureQueriesContext(connection) as queries:
+            relation.save()
+        self.assertEqual(1, len([query for query in queries if query['sql'].startswith('UPDATE "store_book"')]))
+        self.book_1.refresh_from_db()
+        self.assertEqual(4, self.book_1.likes_count)
+        self.assertEqual(4, self.book_1.rate_count)
+
+    def test_rebuild_likes(self):
+        Book.objects.filter(pk=self.book_1.pk).update(likes_count=10)
+        self.assertEqual([self.book_1.id], [book.id for book in find_like_mismatches()])
+        rebuild_likes()
+        self.book_1.refresh_from_db()
+        self.assertEqual(3, self.book_1.likes_count)
+        self.assertFalse(find_like_mismatches().exists())
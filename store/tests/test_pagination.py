@@ -0,0 +1,103 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+
+
+# Тестируем keyset пагинацию списка книг.
+class BookPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        # Цены повторяются, чтобы проверить добор сортировки по id.
+        self.books = [Book.objects.create(name=f'Test book {i}', price=10 + i % 3,
+                                          author_name=f'Author {i % 4}', owner=self.user)
+                      for i in range(10)]
+        self.url = reverse('book-list')
+
+    # Проходим все страницы по ссылкам next и собираем id книг.
+    def walk(self, params):
+        ids = []
+        response = self.client.get(self.url, data=params)
+        while True:
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_without_params_not_paginated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(10, len(response.data))
+
+    def test_first_page(self):
+        response = self.client.get(self.url, data={'page_size': 4})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([book.id for book in self.books[:4]],
+                         [book['id'] for book in response.data['results']])
+        self.assertIsNotNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_walk_by_id(self):
+        self.assertEqual([book.id for book in self.books], self.walk({'page_size': 3}))
+
+    def test_walk_by_price_with_ties(self):
+        expected = [book.id for book in sorted(self.books, key=lambda book: (book.price, book.id))]
+        self.assertEqual(expected, self.walk({'page_size': 3, 'ordering': 'price'}))
+
+    def test_walk_by_author_desc(self):
+        expected = [book.id for book in sorted(self.books, key=lambda book: (book.author_name, book.id),
+                                               reverse=True)]
+        self.assertEqual(expected, self.walk({'page_size': 4, 'ordering': '-author_name'}))
+
+    # Без пагинации книги с равными значениями в том же порядке, что и постранично: по id в направлении сортировки.
+    def test_ordering_tie_breaker_without_pagination(self):
+        for ordering, page_size in (('price', 3), ('-price', 4), ('-author_name', 3)):
+            response = self.client.get(self.url, data={'ordering': ordering})
+            self.assertEqual(self.walk({'page_size': page_size, 'ordering': ordering}),
+                             [book['id'] for book in response.data])
+        response = self.client.get(self.url, data={'ordering': '-price'})
+        expected = [book.id for book in sorted(self.books, key=lambda book: (book.price, book.id), reverse=True)]
+        self.assertEqual(expected, [book['id'] for book in response.data])
+
+    def test_previous(self):
+        first = self.client.get(self.url, data={'page_size': 4, 'ordering': 'price'})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(status.HTTP_200_OK, back.status_code)
+        self.assertEqual(first.data['results'], back.data['results'])
+        self.assertIsNotNone(back.data['next'])
+
+    def test_filter_and_paginate(self):
+        ids = self.walk({'page_size': 2, 'price': 11})
+        self.assertEqual([book.id for book in self.books if book.price == 11], ids)
+
+    def test_deep_page_query_count(self):
+        response = self.client.get(self.url, data={'page_size': 2})
+        for _ in range(3):
+            response = self.client.get(response.data['next'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        # Книги вместе с owner и prefetch readers, без COUNT и OFFSET.
+        self.assertEqual(2, len(queries))
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, data={'cursor': 'not-a-cursor'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_cursor_from_other_ordering(self):
+        response = self.client.get(self.url, data={'page_size': 2, 'ordering': 'author_name'})
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+        response = self.client.get(self.url, data={'page_size': 2, 'ordering': 'price', 'cursor': cursor})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        # Позиция цены подошла бы и для author_name и для -price: курсор проверяется по сортировке.
+        response = self.client.get(self.url, data={'page_size': 2, 'ordering': 'price'})
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+        for ordering in ('author_name', '-price'):
+            response = self.client.get(self.url, data={'page_size': 2, 'ordering': ordering, 'cursor': cursor})
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
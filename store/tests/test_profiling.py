@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, EndpointProfile, UserBookRelation
+from store.profiling import RequestProfile, get_stats, reset_stats
+
+
+class RequestProfileTestCase(TestCase):
+    # Вложенный участок с тем же именем не считается второй раз.
+    def test_nested_sections(self):
+        profile = RequestProfile()
+        with profile.section('serialize'):
+            with profile.section('serialize'):
+                time.sleep(0.01)
+        self.assertLess(profile.sections['serialize'], 0.02)
+        self.assertGreaterEqual(profile.sections['serialize'], 0.01)
+
+
+# Тестируем middleware профилирования и чтение сумм по endpoint-ам.
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        reset_stats()
+        self.user = User.objects.create(username='test_username')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True, rate=5)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def stats(self):
+        return {row['endpoint']: row for row in get_stats()}
+
+    def test_aggregates(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.client.get(reverse('book-list'))
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)),
+                          data=json.dumps({'rate': 3}), content_type='application/json')
+        stats = self.stats()
+        row = stats['GET book-list']
+        self.assertEqual((3, 0), (row['count'], row['slow']))
+        # Сессия, пользователь, книги и читатели.
+        self.assertEqual(4, row['avg_queries'])
+        self.assertGreater(row['avg_serialize_ms'], 0)
+        self.assertGreater(row['avg_render_ms'], 0)
+        self.assertGreater(row['avg_db_ms'], 0)
+        self.assertGreaterEqual(row['avg_total_ms'], row['avg_db_ms'])
+        self.assertEqual(1, stats['PATCH userbookrelation-detail']['count'])
+
+    # Суммы пишутся в БД не на каждый запрос, а пачкой; get_stats сначала сбрасывает суммы процесса.
+    def test_batched_flush(self):
+        with override_settings(PROFILING_FLUSH_REQUESTS=3, PROFILING_FLUSH_SECONDS=3600):
+            self.client.get(reverse('book-list'))
+            self.client.get(reverse('book-list'))
+            self.assertFalse(EndpointProfile.objects.exists())
+            self.client.get(reverse('book-list'))
+            self.assertEqual(3, EndpointProfile.objects.get(endpoint='GET book-list').count)
+            self.client.get(reverse('book-list'))
+            self.assertEqual(4, self.stats()['GET book-list']['count'])
+        profile = EndpointProfile.objects.get(endpoint='GET book-list')
+        self.assertEqual(4, profile.count)
+        self.assertGreaterEqual(profile.total_us, profile.max_us)
+
+    def test_slow_request_profile(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=0, PROFILING_DIR=self.directory.name,
+                               PROFILING_MAX_FILES=1), self.assertLogs('store.profiling') as logs:
+            self.client.get(reverse('book-detail', args=(self.book.id,)))
+            self.client.get(reverse('book-list'))
+        files = os.listdir(self.directory.name)
+        self.assertEqual(1, len(files))
+        self.assertIn('GET_book-list', files[0])
+        self.assertIn('Slow request GET book-detail', logs.output[0])
+        self.assertEqual(1, self.stats()['GET book-detail']['slow'])
+
+    # Без выборки профиль не пишется, но запрос учитывается как медленный.
+    def test_slow_without_sample(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_MS=0, PROFILING_DIR=self.directory.name), \
+                self.assertLogs('store.profiling'):
+            self.client.get(reverse('book-list'))
+        self.assertEqual([], os.listdir(self.directory.name))
+
+    def test_endpoint(self):
+        self.client.get(reverse('book-list'))
+        url = reverse('profiling-stats')
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn('GET book-list', [row['endpoint'] for row in response.data])
+        self.assertEqual(status.HTTP_204_NO_CONTENT, self.client.delete(url).status_code)
+        self.assertNotIn('GET book-list', self.stats())
+
+    def test_command(self):
+        self.client.get(reverse('book-list'))
+        output = io.StringIO()
+        call_command('profiling_stats', '--json', '--reset', stdout=output)
+        self.assertEqual(['GET book-list'], [row['endpoint'] for row in json.loads(output.getvalue())])
+        self.assertEqual([], get_stats())
+        output = io.StringIO()
+        call_command('profiling_stats', stdout=output)
+        self.assertIn('avg_serialize_ms', output.getvalue())
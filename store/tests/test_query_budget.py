@@ -0,0 +1,162 @@
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from books.urls import router
+from store.cache import get_cache
+from store.leaderboards import refresh_leaderboards
+from store.models import Book, UserBookRelation
+from store.query_budget import QueryBudgetExceeded, assert_query_budget
+from store.recommendations import build_recommendations
+
+
+# Бюджет запросов для каждого endpoint из settings.QUERY_BUDGETS. Данных достаточно много
+# (книги с владельцами и читателями), чтобы N+1 в сериализаторе вышел за бюджет.
+class QueryBudgetTestCase(APITestCase):
+    books_count = 30
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username', is_staff=True)
+        readers = User.objects.bulk_create([User(username=f'reader_{i}') for i in range(15)])
+        self.books = Book.objects.bulk_create([
+            Book(name=f'Test book {i}', price=i % 5, author_name=f'Author {i}', owner=self.user)
+            for i in range(self.books_count)])
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=reader, book=book, like=True, rate=3)
+            for book in self.books for reader in readers])
+        self.book = self.books[0]
+
+    # data - JSON тело для изменяющих запросов или параметры строки запроса для GET.
+    def request(self, method, name, args=(), data=None, authenticated=True):
+        if authenticated:
+            self.client.force_login(self.user)
+        url = reverse(name, args=args)
+        if method == 'GET':
+            params = {'data': data}
+        else:
+            params = {'data': json.dumps(data), 'content_type': 'application/json'}
+        with assert_query_budget(method, name):
+            response = getattr(self.client, method.lower())(url, **params)
+            # Выгрузка выполняет запросы при чтении ответа.
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, response.data if hasattr(response, 'data') else response)
+        return response
+
+    def test_book_list(self):
+        self.request('GET', 'book-list', authenticated=False)
+        self.request('GET', 'book-list')
+        self.request('GET', 'book-list', data={'page_size': 10, 'ordering': '-price'})
+        self.request('GET', 'book-list', data={'search': 'Test book', 'price': 3})
+
+    def test_book_detail(self):
+        self.request('GET', 'book-detail', args=(self.book.id,), authenticated=False)
+        self.request('GET', 'book-detail', args=(self.book.id,))
+        self.request('PUT', 'book-detail', args=(self.book.id,),
+                     data={'name': 'Renamed', 'price': '10.00', 'author_name': 'Author'})
+        self.request('PATCH', 'book-detail', args=(self.book.id,), data={'price': '11.00'})
+        self.request('DELETE', 'book-detail', args=(self.book.id,))
+
+    def test_book_create(self):
+        self.request('POST', 'book-list', data={'name': 'New', 'price': '10.00', 'author_name': 'Author'})
+        self.request('POST', 'book-list', data=[{'name': f'New {i}', 'price': '10.00', 'author_name': 'Author'}
+                                                for i in range(50)])
+
+    def test_book_bulk(self):
+        self.request('PATCH', 'book-bulk', data=[{'id': book.id, 'price': '1.00'} for book in self.books])
+        self.request('DELETE', 'book-bulk', data=[book.id for book in self.books])
+
+    def test_book_actions(self):
+        self.request('GET', 'book-readers', args=(self.book.id,))
+        self.request('GET', 'book-export')
+        self.request('GET', 'book-cache-stats')
+
+    def test_book_facets(self):
+        self.request('GET', 'book-facets', authenticated=False)
+        self.request('GET', 'book-facets', data={'price_min': 10, 'search': 'book'})
+
+    def test_book_similar(self):
+        build_recommendations()
+        self.request('GET', 'book-similar', args=(self.book.id,), authenticated=False)
+        self.request('GET', 'book-similar', args=(self.book.id,))
+        self.request('GET', 'book-similar', args=(Book.objects.create(name='New', price=1, author_name='A').id,))
+
+    # Пустые лидерборды и после refresh_leaderboards.
+    def test_book_leaderboards(self):
+        for board in ('top-rated', 'most-liked', 'trending'):
+            self.request('GET', 'book-leaderboard', args=(board,), authenticated=False)
+        refresh_leaderboards()
+        for board in ('top-rated', 'most-liked', 'trending'):
+            self.request('GET', 'book-leaderboard', args=(board,), authenticated=False)
+            self.request('GET', 'book-leaderboard', args=(board,))
+
+    def test_relation(self):
+        # Новое отношение, изменение оценки и лайка существующего.
+        book = Book.objects.create(name='No readers', price=1, author_name='Author')
+        self.request('PATCH', 'userbookrelation-detail', args=(book.id,), data={'rate': 4})
+        self.request('PATCH', 'userbookrelation-detail', args=(book.id,), data={'rate': 5, 'like': True})
+        self.request('PUT', 'userbookrelation-detail', args=(book.id,),
+                     data={'book': book.id, 'rate': 2, 'like': False, 'in_bookmarks': True})
+
+    def test_relation_library(self):
+        UserBookRelation.objects.bulk_create([UserBookRelation(user=self.user, book=book, like=True, rate=4)
+                                              for book in self.books])
+        self.request('GET', 'userbookrelation-library')
+        self.request('GET', 'userbookrelation-library', data={'like': 'true', 'page_size': 10})
+
+    def test_relation_bulk(self):
+        self.request('POST', 'userbookrelation-bulk', data=[{'book': book.id, 'like': True, 'rate': 5}
+                                                            for book in self.books])
+
+    # Каждый endpoint роутера должен иметь объявленный бюджет.
+    def test_all_endpoints_have_budget(self):
+        missing = []
+        for pattern in router.urls:
+            # HEAD DRF добавляет к GET сам, бюджет у них общий.
+            for method in set(pattern.callback.actions) - {'head'}:
+                key = f'{method.upper()} {pattern.name}'
+                if key not in settings.QUERY_BUDGETS:
+                    missing.append(key)
+        self.assertEqual([], missing)
+
+    @override_settings(QUERY_BUDGETS={'GET book-list': {'max_queries': 1, 'max_time_ms': 1000}})
+    def test_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            self.request('GET', 'book-list', authenticated=False)
+        self.assertIn('2 queries > 1', str(context.exception))
+        self.assertIn('store_book', str(context.exception))
+
+    # Время SQL assert_query_budget проверяет только с check_time=True.
+    @override_settings(QUERY_BUDGETS={'GET book-list': {'max_queries': 10, 'max_time_ms': 0}})
+    def test_time_not_asserted(self):
+        self.request('GET', 'book-list', authenticated=False)
+        # Без кеша ответов: из кеша список отдается без запросов.
+        get_cache().clear()
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'ms SQL > 0 ms'):
+            with assert_query_budget('GET', 'book-list', check_time=True):
+                self.client.get(reverse('book-list'))
+
+    # Middleware проверяет и время.
+    @override_settings(QUERY_BUDGETS={'GET book-list': {'max_queries': 10, 'max_time_ms': 0}})
+    def test_middleware_time(self):
+        middleware = ['store.query_budget.QueryBudgetMiddleware', *settings.MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware), self.assertLogs('store.query_budget', logging.WARNING) as logs:
+            self.client.get(reverse('book-list'))
+        self.assertIn('ms SQL > 0 ms', logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={'GET book-detail': {'max_queries': 1, 'max_time_ms': 1000}})
+    def test_middleware(self):
+        middleware = ['store.query_budget.QueryBudgetMiddleware', *settings.MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware), self.assertLogs('store.query_budget', logging.WARNING) as logs:
+            self.client.get(reverse('book-detail', args=(self.book.id,)))
+            # Endpoint без бюджета не проверяется.
+            self.client.get(reverse('book-list'))
+        self.assertEqual(1, len(logs.output))
+        self.assertIn('GET book-detail: 2 queries > 1', logs.output[0])
+        self.assertIn('FROM "store_book"', logs.output[0])
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.logic_readers import get_readers_preview, find_reader_mismatches, rebuild_readers
+from store.models import Book, UserBookRelation
+
+
+# Тестируем ограниченный список первых читателей.
+class ReadersPreviewTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}', first_name=f'Name {i}') for i in range(5)]
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        self.book_3 = Book.objects.create(name='Test book 3', price=55, author_name='Author 3')
+        for user in self.users:
+            UserBookRelation.objects.create(user=user, book=self.book_1)
+        UserBookRelation.objects.create(user=self.users[4], book=self.book_2)
+
+    def check_preview(self):
+        preview = get_readers_preview([self.book_1.id, self.book_2.id, self.book_3.id], limit=3)
+        self.assertEqual(['Name 0', 'Name 1', 'Name 2'],
+                         [reader['first_name'] for reader in preview[self.book_1.id]])
+        self.assertEqual([{'first_name': 'Name 4', 'last_name': ''}], preview[self.book_2.id])
+        self.assertEqual([], preview[self.book_3.id])
+
+    def test_preview(self):
+        self.check_preview()
+
+    # Запрос с оконной функцией для БД без LATERAL.
+    def test_preview_window_fallback(self):
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.check_preview()
+
+    def test_readers_count(self):
+        self.book_1.refresh_from_db()
+        self.assertEqual(5, self.book_1.readers_count)
+        UserBookRelation.objects.get(user=self.users[0], book=self.book_1).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(4, self.book_1.readers_count)
+
+    def test_rebuild(self):
+        Book.objects.update(readers_count=0)
+        self.assertEqual(2, find_reader_mismatches().count())
+        rebuild_readers()
+        self.assertFalse(find_reader_mismatches().exists())
+
+
+# Тестируем readers в API: ограничение списка и отдельный endpoint.
+@override_settings(READERS_PREVIEW_SIZE=2)
+class ReadersApiTestCase(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}', first_name=f'Name {i}') for i in range(5)]
+        self.books = [Book.objects.create(name=f'Test book {i}', price=25, author_name='Author 1')
+                      for i in range(3)]
+        for book in self.books:
+            for user in self.users:
+                UserBookRelation.objects.create(user=user, book=book)
+
+    def test_list_preview(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-list'))
+        # Книги и первые читатели всех книг - два запроса независимо от количества читателей.
+        self.assertEqual(2, len(queries))
+        for book in response.data:
+            self.assertEqual(['Name 0', 'Name 1'], [reader['first_name'] for reader in book['readers']])
+            self.assertEqual(5, book['readers_count'])
+
+    def test_detail_preview(self):
+        response = self.client.get(reverse('book-detail', args=(self.books[0].id,)))
+        self.assertEqual(2, len(response.data['readers']))
+        self.assertEqual(5, response.data['readers_count'])
+
+    def test_readers_endpoint(self):
+        url = reverse('book-readers', args=(self.books[0].id,))
+        response = self.client.get(url, data={'page_size': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        names = [reader['first_name'] for reader in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            names.extend(reader['first_name'] for reader in response.data['results'])
+        self.assertEqual([f'Name {i}' for i in range(5)], names)
+
+    def test_readers_endpoint_not_found(self):
+        response = self.client.get(reverse('book-readers', args=(0,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = self.client.get(reverse('book-readers', args=('abc',)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
@@ -0,0 +1,145 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, BookSimilarity, UserBookRelation
+from store.recommendations import TooManyRelations, build_recommendations, has_numpy
+
+numpy_only = skipUnless(has_numpy(), 'NumPy and SciPy are not installed')
+
+
+# Три читателя с общими книгами 0, 1, 2; книгу 3 отметил один читатель, у книги 4 только оценка 2 (без веса).
+# Веса: лайк 1, закладка 0.5, оценка 5 - 1. Косинусы: (0, 1) = 2 / (√3·√2), (0, 2) = 1.5 / (√3·√1.25),
+# (1, 2) = 0.5 / (√2·√1.25).
+def create_relations(test):
+    test.users = [User.objects.create(username=f'user{i}') for i in range(4)]
+    test.books = [Book.objects.create(name=f'Book {i}', price=10 + i, author_name='Author') for i in range(5)]
+    for user, book, values in ((0, 0, {'like': True}), (0, 1, {'like': True}), (0, 4, {'rate': 2}),
+                               (1, 0, {'like': True}), (1, 1, {'like': True}), (1, 2, {'in_bookmarks': True}),
+                               (2, 0, {'like': True}), (2, 2, {'rate': 5}), (3, 3, {'like': True})):
+        UserBookRelation.objects.create(user=test.users[user], book=test.books[book], **values)
+
+
+# Тестируем построение похожих книг.
+class BuildRecommendationsTestCase(TestCase):
+    def setUp(self):
+        create_relations(self)
+
+    def neighbours(self):
+        result = {}
+        for book_id, similar_id, score in BookSimilarity.objects.order_by('book', 'rank').values_list(
+                'book', 'similar', 'score'):
+            result.setdefault(book_id, []).append((similar_id, round(score, 6)))
+        return result
+
+    def expected(self):
+        b = [book.id for book in self.books]
+        return {b[0]: [(b[1], 0.816497), (b[2], 0.774597)],
+                b[1]: [(b[0], 0.816497), (b[2], 0.316228)],
+                b[2]: [(b[0], 0.774597), (b[1], 0.316228)]}
+
+    def test_python(self):
+        stats = build_recommendations(engine='python')
+        self.assertEqual({'engine': 'python', 'books': 4, 'neighbours': 6, 'stale_deleted': 0}, stats)
+        self.assertEqual(self.expected(), self.neighbours())
+
+    @numpy_only
+    def test_numpy(self):
+        build_recommendations(engine='numpy')
+        self.assertEqual(self.expected(), self.neighbours())
+
+    # Блоки по одной книге и чтение по две строки дают тот же результат.
+    @numpy_only
+    @override_settings(RECOMMENDATIONS_MAX_BLOCK_PAIRS=1, RECOMMENDATIONS_READ_CHUNK=2, RECOMMENDATIONS_BLOCK_BOOKS=1)
+    def test_numpy_small_blocks(self):
+        build_recommendations(engine='numpy')
+        self.assertEqual(self.expected(), self.neighbours())
+
+    def test_top_k(self):
+        build_recommendations(top_k=1, engine='python')
+        b = [book.id for book in self.books]
+        self.assertEqual({b[0]: [(b[1], 0.816497)], b[1]: [(b[0], 0.816497)], b[2]: [(b[0], 0.774597)]},
+                         self.neighbours())
+
+    # Читатели с большим числом книг не учитываются.
+    @override_settings(RECOMMENDATIONS_MAX_USER_BOOKS=2)
+    def test_max_user_books(self):
+        build_recommendations(engine='python')
+        b = [book.id for book in self.books]
+        self.assertEqual({b[0]: [(b[1], 0.707107), (b[2], 0.707107)], b[1]: [(b[0], 0.707107)],
+                          b[2]: [(b[0], 0.707107)]}, self.neighbours())
+
+    @numpy_only
+    @override_settings(RECOMMENDATIONS_MAX_USER_BOOKS=2)
+    def test_numpy_max_user_books(self):
+        build_recommendations(engine='python')
+        expected = self.neighbours()
+        build_recommendations(engine='numpy')
+        self.assertEqual(expected, self.neighbours())
+
+    # Отношений с весом больше RECOMMENDATIONS_MAX_RELATIONS: построение не начинается.
+    @override_settings(RECOMMENDATIONS_MAX_RELATIONS=7)
+    def test_max_relations(self):
+        with self.assertRaisesMessage(TooManyRelations, '8 weighted relations'):
+            build_recommendations(engine='python')
+        with self.assertRaises(CommandError):
+            call_command('build_recommendations', stdout=StringIO())
+        self.assertFalse(BookSimilarity.objects.exists())
+
+    # Повторное построение заменяет соседей, у книг без отношений с весом они удаляются.
+    def test_rebuild(self):
+        build_recommendations(engine='python')
+        UserBookRelation.objects.filter(book=self.books[2]).delete()
+        stats = build_recommendations(engine='python')
+        self.assertEqual(2, stats['stale_deleted'])
+        b = [book.id for book in self.books]
+        self.assertEqual({b[0]: [(b[1], 0.816497)], b[1]: [(b[0], 0.816497)]}, self.neighbours())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_recommendations', '--engine', 'python', stdout=out)
+        self.assertIn('Built 6 neighbours for 4 books (python)', out.getvalue())
+
+
+# Тестируем /book/{id}/similar/.
+class SimilarBooksApiTestCase(APITestCase):
+    def setUp(self):
+        create_relations(self)
+        build_recommendations(engine='python')
+
+    def test_similar(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-similar', args=(self.books[0].id,)))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, len(queries))
+        self.assertEqual(self.books[0].id, response.data['book'])
+        self.assertEqual({'id': self.books[1].id, 'name': 'Book 1', 'author_name': 'Author', 'price': '11.00',
+                          'rating': None, 'score': 0.8165}, response.data['results'][0])
+        self.assertEqual([self.books[1].id, self.books[2].id], [item['id'] for item in response.data['results']])
+
+    def test_limit(self):
+        response = self.client.get(reverse('book-similar', args=(self.books[0].id,)), data={'limit': 1})
+        self.assertEqual(1, len(response.data['results']))
+
+    def test_without_neighbours(self):
+        response = self.client.get(reverse('book-similar', args=(self.books[3].id,)))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([], response.data['results'])
+
+    # Соседи удаленной книги не отдаются.
+    def test_deleted_neighbour(self):
+        self.books[1].delete()
+        response = self.client.get(reverse('book-similar', args=(self.books[0].id,)))
+        self.assertEqual([self.books[2].id], [item['id'] for item in response.data['results']])
+
+    def test_not_found(self):
+        response = self.client.get(reverse('book-similar', args=(self.books[4].id + 100,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
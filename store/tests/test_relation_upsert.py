@@ -0,0 +1,153 @@
+import threading
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.logic_likes import find_like_mismatches
+from store.logic_rating import find_rating_mismatches
+from store.logic_readers import find_reader_mismatches
+from store.logic_relations import apply_relation, upsert_relation
+from store.models import Book, UserBookRelation
+from store.serializers import UserBookRelationSerializer
+
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'INSERT ... ON CONFLICT upsert')
+
+
+def counters_consistent():
+    return not any(find_mismatches().exists() for find_mismatches in
+                   (find_rating_mismatches, find_like_mismatches, find_reader_mismatches))
+
+
+# Тестируем PATCH /book_relation/{book}/ через upsert_relation.
+class RelationUpsertApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(name='Book', price=10, author_name='Author')
+        self.url = reverse('userbookrelation-detail', args=(self.book.id,))
+        self.client.force_authenticate(self.user)
+
+    def patch(self, data, url=None):
+        return self.client.patch(url or self.url, data, format='json')
+
+    def test_create(self):
+        response = self.patch({'like': True, 'rate': 4})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        self.assertEqual(UserBookRelationSerializer(relation).data, response.data)
+        self.assertEqual({'book': self.book.id, 'like': True, 'in_bookmarks': False, 'rate': 4}, response.data)
+        self.book.refresh_from_db()
+        self.assertEqual((1, 1, 4, 1, Decimal('4.00')), (self.book.readers_count, self.book.likes_count,
+                                                         self.book.rate_sum, self.book.rate_count, self.book.rating))
+
+    def test_update(self):
+        other = User.objects.create(username='other')
+        UserBookRelation.objects.create(user=other, book=self.book, rate=5)
+        self.patch({'like': True, 'rate': 2})
+        self.patch({'rate': 3, 'in_bookmarks': True})
+        response = self.patch({'like': False, 'rate': None})
+        self.assertEqual({'book': self.book.id, 'like': False, 'in_bookmarks': True, 'rate': None}, response.data)
+        self.book.refresh_from_db()
+        self.assertEqual((2, 0, 5, 1, Decimal('5.00')), (self.book.readers_count, self.book.likes_count,
+                                                         self.book.rate_sum, self.book.rate_count, self.book.rating))
+        self.assertTrue(counters_consistent())
+
+    # Те же значения: отношение и книга не меняются, updated_at книги (ETag) остается прежним.
+    def test_unchanged(self):
+        self.patch({'like': True, 'rate': 4})
+        self.book.refresh_from_db()
+        updated_at = self.book.updated_at
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch({'like': True, 'rate': 4})
+        self.assertEqual({'book': self.book.id, 'like': True, 'in_bookmarks': False, 'rate': 4}, response.data)
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))])
+        self.book.refresh_from_db()
+        self.assertEqual(updated_at, self.book.updated_at)
+
+    # book из тела запроса не переносит отношение на другую книгу.
+    def test_book_from_url(self):
+        other_book = Book.objects.create(name='Other', price=5, author_name='Author')
+        response = self.patch({'book': other_book.id, 'like': True})
+        self.assertEqual(self.book.id, response.data['book'])
+        self.assertFalse(UserBookRelation.objects.filter(book=other_book).exists())
+
+    def test_not_found(self):
+        response = self.patch({'like': True}, reverse('userbookrelation-detail', args=(self.book.id + 100,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_invalid(self):
+        response = self.patch({'rate': 7})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('rate', response.data)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    # В PostgreSQL изменение - один запрос upsert (без сессии: force_authenticate) и обновление лидербордов,
+    # на которые оно влияет: лайк - most-liked и trending, оценка - top-rated. Без изменений - только upsert.
+    @postgresql_only
+    def test_round_trips(self):
+        # Лайк: строки лидербордов, книга, лайки за окно, upsert строк. Оценка: строки и книга - ниже порога голосов.
+        for data, queries in (({'like': True}, 5), ({'like': True, 'rate': 5}, 3), ({'rate': 5}, 1)):
+            with self.assertNumQueries(queries):
+                response = self.patch(data)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(counters_consistent())
+
+
+# Тестируем путь через ORM для БД без upsert: тот же результат, что и у upsert_relation.
+class ApplyRelationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(name='Book', price=10, author_name='Author')
+
+    def test_same_result(self):
+        for data in ({'like': True}, {'rate': 3}, {'in_bookmarks': True, 'rate': None}, {}):
+            self.assertEqual(upsert_relation(self.user, self.book.id, data),
+                             apply_relation(self.user, self.book.id, data))
+        self.assertEqual(1, UserBookRelation.objects.count())
+        self.assertTrue(counters_consistent())
+
+    def test_unchanged(self):
+        apply_relation(self.user, self.book.id, {'like': True})
+        with CaptureQueriesContext(connection) as queries:
+            apply_relation(self.user, self.book.id, {'like': True})
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))])
+
+    def test_not_found(self):
+        with self.assertRaises(Book.DoesNotExist):
+            apply_relation(self.user, self.book.id + 100, {'like': True})
+
+
+# Тестируем одновременные upsert одного и того же отношения и одной книги из нескольких потоков:
+# счетчики книги должны совпасть с отношениями.
+@postgresql_only
+class RelationUpsertConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent(self):
+        users = [User.objects.create(username=f'user{i}') for i in range(4)]
+        book = Book.objects.create(name='Book', price=10, author_name='Author')
+        errors = []
+
+        def worker(number):
+            try:
+                for step in range(25):
+                    user = users[(number + step) % len(users)]
+                    upsert_relation(user, book.id, {'like': (number + step) % 2 == 0, 'rate': step % 5 + 1})
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(len(users), UserBookRelation.objects.count())
+        self.assertTrue(counters_consistent())
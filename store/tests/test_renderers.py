@@ -0,0 +1,75 @@
+import datetime
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.renderers import FastJSONRenderer, FastJSONParser
+
+
+# FastJSONRenderer должен отдавать те же байты, что и JSONRenderer, с orjson и без него.
+class FastJSONRendererTestCase(APITestCase):
+    data = [
+        OrderedDict([('id', 1), ('name', 'Книга "1"\n'), ('price', '25.00'), ('rating', None),
+                     ('readers', [{'first_name': 'Ivan', 'last_name': ''}]), ('readers_count', 1)]),
+        {'decimal': Decimal('1.50'), 'float': 0.1, 'bool': True, 'empty': {}, 'list': []},
+        {'datetime': datetime.datetime(2023, 2, 1, 10, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+         'naive': datetime.datetime(2023, 2, 1, 10, 30), 'date': datetime.date(2023, 2, 1),
+         'time': datetime.time(10, 30, 15, 500), 'uuid': uuid.UUID(int=1)},
+        {'separators': 'line paragraph ', 1: 'int key', 'big': 2 ** 70},
+    ]
+
+    def assertSameRender(self, data, accepted_media_type=None):
+        self.assertEqual(JSONRenderer().render(data, accepted_media_type),
+                         FastJSONRenderer().render(data, accepted_media_type))
+
+    def test_same_bytes(self):
+        for item in self.data:
+            self.assertSameRender(item)
+        self.assertSameRender(self.data[:3])
+        self.assertEqual(b'', FastJSONRenderer().render(None))
+
+    def test_indent(self):
+        self.assertSameRender(self.data[0], 'application/json; indent=4')
+
+    def test_without_orjson(self):
+        with mock.patch('store.renderers.orjson', None):
+            for item in self.data:
+                self.assertSameRender(item)
+
+    # Ответ API рендерится FastJSONRenderer (settings.REST_FRAMEWORK).
+    def test_api_response(self):
+        Book.objects.create(name='Test book', price='10.50', author_name='Автор')
+        response = self.client.get(reverse('book-list'))
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(JSONRenderer().render(response.data), response.content)
+
+
+class FastJSONParserTestCase(APITestCase):
+    def parse(self, content, parser=None):
+        return (parser or FastJSONParser()).parse(BytesIO(content))
+
+    def test_same_data(self):
+        content = '{"book": 1, "rate": 5, "name": "Книга", "price": 25.5, "items": [null, true]}'.encode('utf-8')
+        self.assertEqual(self.parse(content, JSONParser()), self.parse(content))
+        with mock.patch('store.renderers.orjson', None):
+            self.assertEqual(self.parse(content, JSONParser()), self.parse(content))
+
+    def test_errors(self):
+        for content in (b'{"book": ', b'{"rate": NaN}', b'\xff'):
+            with self.assertRaises(ParseError):
+                self.parse(content)
+
+    def test_api_request(self):
+        self.client.force_login(User.objects.create(username='user1'))
+        response = self.client.post(reverse('book-list'), data=b'{"name": ', content_type='application/json')
+        self.assertEqual(400, response.status_code)
@@ -0,0 +1,163 @@
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.db.routers import (ReplicaRouter, ReplicaRoutingMiddleware, _current_reads, pin_to_primary,
+                              reset_replica_lag, use_primary)
+from store.cache import get_cache, invalidate_books
+from store.models import Book, UserBookRelation
+
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'separate connection to the test database')
+
+
+# Тестируем выбор БД роутером без настоящей реплики: отставание подменяется.
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_MAX_LAG=5, REPLICA_LAG_CHECK_INTERVAL=60)
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_replica_lag()
+        self.router = ReplicaRouter()
+        self.lag = mock.patch('store.db.routers.measure_replica_lag', return_value=0.5)
+        self.measure = self.lag.start()
+        self.addCleanup(self.lag.stop)
+
+    def read_alias(self, method='get', user=None, model=Book, cookies=None):
+        request = getattr(RequestFactory(), method)('/book/')
+        request.user = user or AnonymousUser()
+        request.COOKIES.update(cookies or {})
+        token = _current_reads.set(ReplicaRoutingMiddleware(lambda request: None).get_read_alias(request))
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            _current_reads.reset(token)
+
+    def test_safe_methods(self):
+        self.assertEqual('replica', self.read_alias('get'))
+        self.assertEqual('replica', self.read_alias('head', model=UserBookRelation))
+        self.assertIsNone(self.read_alias('post'))
+        self.assertEqual('default', self.router.db_for_write(Book))
+
+    # Вне запроса и для моделей других приложений роутер не выбирает БД.
+    def test_not_routed(self):
+        self.assertIsNone(self.router.db_for_read(Book))
+        self.assertIsNone(self.read_alias('get', model=User))
+        token = _current_reads.set('replica')
+        try:
+            with use_primary():
+                self.assertIsNone(self.router.db_for_read(Book))
+        finally:
+            _current_reads.reset(token)
+
+    # Закрепление - подписанная cookie с id пользователя, действует REPLICA_STICKY_SECONDS.
+    def test_pinned_user(self):
+        user = User(pk=1, username='writer')
+        response = HttpResponse()
+        pin_to_primary(response, user)
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(settings.REPLICA_STICKY_SECONDS, cookie['max-age'])
+        cookies = {cookie.key: cookie.value}
+        self.assertEqual('replica', self.read_alias('get', user=user))
+        self.assertEqual('default', self.read_alias('get', user=user, cookies=cookies))
+        # Cookie другого пользователя, подделанная и просроченная не действуют.
+        self.assertEqual('replica', self.read_alias('get', user=User(pk=2, username='reader'), cookies=cookies))
+        forged = {cookie.key: cookie.value.replace('1:', '2:', 1)}
+        self.assertEqual('replica', self.read_alias('get', user=User(pk=2, username='reader'), cookies=forged))
+        later = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertEqual('replica', self.read_alias('get', user=user, cookies=cookies))
+
+    def test_lag(self):
+        self.measure.return_value = 30
+        self.assertEqual('default', self.read_alias('get'))
+        # Результат проверки хранится REPLICA_LAG_CHECK_INTERVAL секунд.
+        self.measure.return_value = 0
+        self.assertEqual('default', self.read_alias('get'))
+        self.assertEqual(1, self.measure.call_count)
+        reset_replica_lag()
+        self.assertEqual('replica', self.read_alias('get'))
+
+    def test_unavailable_replica(self):
+        self.measure.side_effect = OperationalError('connection refused')
+        with self.assertLogs('store.db.routers', 'WARNING'):
+            self.assertEqual('default', self.read_alias('get'))
+
+    def test_allow_migrate(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'store'))
+        self.assertIsNone(self.router.allow_migrate('default', 'store'))
+
+
+# Тестируем API с репликой - вторым соединением к тестовой БД. Тест идет в транзакции основного
+# соединения, поэтому созданные в нем данные реплика не видит, как реплика с отставанием.
+@postgresql_only
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_MAX_LAG=5)
+class ReplicaRoutingApiTestCase(APITestCase):
+    alias = 'replica'
+
+    # Алиас добавляется в connections после настройки TestCase, поэтому запросы к нему не запрещены.
+    def setUp(self):
+        connections.settings[self.alias] = {**connection.settings_dict}
+        self.addCleanup(self.remove_replica)
+        reset_replica_lag()
+        get_cache().clear()
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(name='Fresh book', price=10, author_name='Author')
+
+    def remove_replica(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+    def get_names(self, **params):
+        response = self.client.get(reverse('book-list'), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['name'] for book in response.data]
+
+    def test_read_from_replica(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual([], self.get_names())
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    # Анонимный ответ сохраняется в кеш: сразу после изменения книг промах читается с основной БД,
+    # когда отставание реплики меньше времени с последнего изменения - с реплики.
+    def test_anonymous_cache_miss(self):
+        self.assertEqual(['Fresh book'], self.get_names())
+        later = time.time() + settings.REPLICA_LAG_CHECK_INTERVAL + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual([], self.get_names(ordering='name'))
+            invalidate_books([self.book.id])
+            self.assertEqual(['Fresh book'], self.get_names(ordering='-name'))
+
+    # После PATCH своего отношения пользователь сразу видит свой лайк.
+    def test_read_your_writes(self):
+        self.client.force_login(self.user)
+        self.assertEqual([], self.get_names())
+        url = reverse('userbookrelation-detail', args=(self.book.id,))
+        response = self.client.patch(url, {'like': True}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(UserBookRelation.objects.get(user=self.user, book=self.book).like)
+        # Закрепление в cookie клиента, а не в кеше процесса: пустой кеш его не отменяет.
+        caches['default'].clear()
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual([('Fresh book', 1)], [(book['name'], book['annotated_likes']) for book in response.data])
+        # Другой пользователь по-прежнему читает с реплики.
+        self.client.force_login(User.objects.create(username='other'))
+        self.assertEqual([], self.get_names())
+
+    def test_lagging_replica(self):
+        self.client.force_authenticate(self.user)
+        with mock.patch('store.db.routers.measure_replica_lag', return_value=60):
+            self.assertEqual(['Fresh book'], self.get_names())
+
+    def test_async_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('async-book-list'))
+        self.assertEqual([], response.json())
@@ -0,0 +1,81 @@
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+
+# Проверки, которые имеют смысл только для полнотекстового поиска PostgreSQL.
+postgresql_only = skipUnless(connection.vendor == 'postgresql', 'PostgreSQL full text search')
+
+
+# Тестируем полнотекстовый поиск книг.
+class BookSearchTestCase(APITestCase):
+    def setUp(self):
+        self.book_1 = Book.objects.create(name='War and Peace', price=25, author_name='Leo Tolstoy')
+        self.book_2 = Book.objects.create(name='Anna Karenina', price=55, author_name='Leo Tolstoy')
+        self.book_3 = Book.objects.create(name='Tolstoy biography', price=55, author_name='Henri Troyat')
+        self.book_4 = Book.objects.create(name='Crime and Punishment', price=30,
+                                          author_name='Fyodor Dostoevsky')
+        self.url = reverse('book-list')
+
+    def search(self, params):
+        response = self.client.get(self.url, data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['id'] for book in response.data]
+
+    def test_search_words(self):
+        self.assertEqual([self.book_1.id, self.book_2.id, self.book_3.id], self.search({'search': 'tolstoy'}))
+        self.assertEqual([self.book_2.id], self.search({'search': 'Leo Anna'}))
+        self.assertEqual([], self.search({'search': 'Anna Troyat'}))
+
+    # Слово ищется как префикс, как и подстрока в SearchFilter.
+    def test_search_prefix(self):
+        self.assertEqual([self.book_4.id], self.search({'search': 'Dostoev'}))
+
+    @postgresql_only
+    def test_search_special_characters(self):
+        self.assertEqual([self.book_1.id], self.search({'search': "war & (peace):* !"}))
+        self.assertEqual([], self.search({'search': '&|!'}))
+
+    # Название весит больше автора: книга с Tolstoy в названии первая.
+    @postgresql_only
+    def test_order_by_rank(self):
+        ids = self.search({'search': 'tolstoy', 'ordering': '-rank'})
+        self.assertEqual(self.book_3.id, ids[0])
+        self.assertEqual({self.book_1.id, self.book_2.id}, set(ids[1:]))
+
+    # Без поиска сортировка по rank игнорируется.
+    def test_rank_without_search(self):
+        self.assertEqual([self.book_1.id, self.book_2.id, self.book_3.id, self.book_4.id],
+                         self.search({'ordering': '-rank'}))
+
+    def test_rank_with_pagination(self):
+        response = self.client.get(self.url, data={'search': 'tolstoy', 'ordering': '-rank', 'page_size': 1})
+        ids = [book['id'] for book in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids.extend(book['id'] for book in response.data['results'])
+        self.assertEqual(self.search({'search': 'tolstoy', 'ordering': '-rank'}), ids)
+
+    # Вектор обновляется триггером при изменении книги.
+    def test_vector_updated(self):
+        self.book_4.name = 'Notes from Underground'
+        self.book_4.save()
+        self.assertEqual([self.book_4.id], self.search({'search': 'underground'}))
+        self.assertEqual([], self.search({'search': 'crime'}))
+
+    @postgresql_only
+    def test_uses_gin_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Book.objects.filter(search_vector='tolstoy').explain()
+        self.assertIn('store_book_search_vector_idx', plan)
+
+    # Для БД без полнотекстового поиска остается обычный SearchFilter.
+    def test_fallback(self):
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.assertEqual([self.book_1.id, self.book_2.id, self.book_3.id], self.search({'search': 'tolstoy'}))
+            self.assertEqual([self.book_4.id], self.search({'search': 'Dostoev'}))
@@ -1,7 +1,11 @@
 from django.contrib.auth.models import User
 from django.db.models import Count, Case, When, Avg
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
 
+from store.fast_serializers import book_values, serialize_book_rows
 from store.models import Book, UserBookRelation
 from store.serializers import BooksSerializer
 
@@ -79,7 +83,8 @@ class BookSerializerTestCase(TestCase):
                         'first_name': 'Vin',
                         'last_name': 'Diesel'
                     }
-                ]
+                ],
+                'readers_count': 3,
             },
             {
                 'id': book_2.id,
@@ -103,9 +108,57 @@ class BookSerializerTestCase(TestCase):
                         'first_name': 'Vin',
                         'last_name': 'Diesel'
                     }
-                ]
+                ],
+                'readers_count': 3,
             },
         ]
 
         self.assertEqual(expected_data, data)
 
+
+# Быстрый путь списка книг должен давать тот же JSON, что и BooksSerializer, байт в байт.
+class FastBooksSerializerTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1', first_name='Ivan', last_name='Drago')
+        self.user2 = User.objects.create(username='user2', first_name='Аполлон', last_name='')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user1)
+        # Без владельца, оценок и читателей: owner_name '' и rating null.
+        self.book_2 = Book.objects.create(name='Книга "2"', price='0.99', author_name='Author 2')
+        self.book_3 = Book.objects.create(name='Test book 3', price='99999.99', author_name='', owner=self.user2)
+        UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user1, book=self.book_3, rate=3)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_3, in_bookmarks=True)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_same_json(self):
+        books = Book.objects.all().select_related('owner').order_by('id')
+        expected = self.render(BooksSerializer(books, many=True).data)
+        self.assertEqual(expected, self.render(serialize_book_rows(list(book_values(books)))))
+
+    def test_rating_rounding(self):
+        Book.objects.filter(pk=self.book_1.pk).update(rating='4.67')
+        books = Book.objects.all().select_related('owner').order_by('id')
+        data = serialize_book_rows(list(book_values(books)))
+        self.assertEqual(['4.67', None, '3.00'], [book['rating'] for book in data])
+        self.assertEqual(self.render(BooksSerializer(books, many=True).data), self.render(data))
+
+    def test_empty(self):
+        self.assertEqual([], serialize_book_rows(list(book_values(Book.objects.none()))))
+
+    # Ответ /book/ (с пагинацией и без) совпадает с сериализацией тех же книг BooksSerializer.
+    def test_list_response(self):
+        self.client.force_login(self.user1)
+        books = Book.objects.all().select_related('owner')
+        for params, queryset in (({}, books.order_by('id')),
+                                 ({'ordering': '-price'}, books.order_by('-price', '-id')),
+                                 ({'page_size': 2}, books.order_by('id')[:2])):
+            response = self.client.get(reverse('book-list'), params)
+            content = response.content
+            expected = self.render(BooksSerializer(queryset, many=True).data)
+            if 'page_size' in params:
+                self.assertIn(b'"results":' + expected, content)
+            else:
+                self.assertEqual(expected, content)
@@ -1,36 +1,66 @@
 import django_filters
-from django.db.models import Count, Case, When, Avg
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from .cache import LIST_GENERATION_KEYS, CachedReadMixin, facets_cache_key, get_cache_stats, invalidate_books
+from .conditional import ConditionalGetMixin
+from .db.pool import get_connection_stats
+from .export import EXPORT_FORMATS, iter_export
+from .facets import get_facets
+from .fast_serializers import FastBookListMixin
+from .filters import BookFilter, BookSearchFilter, BookOrderingFilter, LibraryFilter
+from .leaderboards import LEADERBOARDS, get_leaderboard
+from .logic_relations import RELATION_FIELDS, apply_relations, upsert_relation
 from .models import Book, UserBookRelation
+from .pagination import BookPagination, LibraryPagination, ReadersPagination
 from .permissions import IsOwnerOrStaffOrReadOnly
-from .serializers import BooksSerializer, UserBookRelationSerializer
+from .profiling import get_stats, reset_stats
+from .recommendations import get_similar_books
+from .serializers import (BooksSerializer, BulkRelationItemSerializer, UserBookRelationSerializer, BookReaderSerializer,
+                          LibraryItemSerializer)
 
 
-class BookViewSet(ModelViewSet):
+# CachedReadMixin - кеш ответов list и retrieve для анонимных пользователей.
+# ConditionalGetMixin - ETag, Last-Modified и 304 на условные запросы.
+# FastBookListMixin - список книг без BooksSerializer на каждую строку, ответ тот же.
+class BookViewSet(CachedReadMixin, ConditionalGetMixin, FastBookListMixin, ModelViewSet):
 
     # Добавление в queryset .select_related('owner') ведет к сокращению количества и времени
     # запросов SQL, применяется LEFT OUTER JOIN. select - одного, prefetch - многих.
-    queryset = Book.objects.all().annotate(
-        annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))
-    ).select_related('owner').prefetch_related('readers').order_by('id')
+    # Лайки берутся из поля likes_count, а не из аннотации Count(Case(When(...))):
+    # аннотация требовала JOIN и GROUP BY по всей таблице отношений.
+    # Читатели не prefetch-ятся целиком: сериализатор берет ограниченный список первых читателей.
+    queryset = Book.objects.all().select_related('owner').order_by('id')
     # Убрать отсюда rating, чтобы можно было создать поле rating в models.Book
     # rating=Avg('userbookrelation__rate')).select_related('owner').prefetch_related('readers').order_by('id')
     #     serializer_class = BooksSerializer
 
     serializer_class = BooksSerializer
+    # Keyset пагинация, включается параметрами ?cursor= или ?page_size=.
+    pagination_class = BookPagination
     # Настраиваем filter, search, ordering.
-    filter_backends = [django_filters.rest_framework.DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend, BookSearchFilter, BookOrderingFilter]
     permission_classes = [IsOwnerOrStaffOrReadOnly]
-    # Указываем поле, по которому хотим отфильтровать.
-    filterset_fields = ['price']
+    # Фильтры: ?price= - точная цена, ?price_min= и ?price_max= - диапазон (store/filters.py).
+    filterset_class = BookFilter
     # Поля для поиска. Поиск использовать, для поиска по двум и более полям, иначе это просто фильтр.
+    # В PostgreSQL поиск идет по полнотекстовому индексу search_vector, собранному из этих полей.
     search_fields = ['name', 'author_name']
-    ordering_fields = ['price', 'author_name']
+    # rank - релевантность, доступна только вместе с ?search=.
+    ordering_fields = ['price', 'author_name', 'rank']
+    # Для ETag нужны id и updated_at, остальные поля - для позиции keyset пагинации.
+    conditional_fields = ('id', 'updated_at', 'price', 'author_name')
 
     # Переопределяем метод из CreateModelMixin, для присваивания owner во время создания книги.
     def perform_create(self, serializer):
@@ -39,6 +69,153 @@ class BookViewSet(ModelViewSet):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    # POST /book/ со списком книг - массовое создание, иначе обычное создание одной книги.
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        if not request.user.is_authenticated:
+            self.permission_denied(request)
+        self.check_bulk_size(request.data)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(owner=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    # Массовое изменение и удаление: /book/bulk/.
+    # PATCH - список [{"id": ..., поля книги}], DELETE - список id.
+    # Права IsOwnerOrStaffOrReadOnly проверяются для каждой книги, книги загружаются одним запросом.
+    # Если хотя бы одна книга не найдена или чужая, не меняется ничего.
+    @action(detail=False, methods=['patch', 'delete'],
+            permission_classes=[IsAuthenticated, IsOwnerOrStaffOrReadOnly])
+    def bulk(self, request):
+        if request.method == 'DELETE':
+            return self.bulk_destroy(request)
+        return self.bulk_update(request)
+
+    def bulk_update(self, request):
+        self.check_bulk_size(request.data)
+        ids = self.get_bulk_ids([item.get('id') if isinstance(item, dict) else None for item in request.data])
+        books = self.get_bulk_objects(ids, self.get_queryset())
+        serializer = self.get_serializer([books[pk] for pk in ids], data=request.data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response(serializer.data)
+
+    def bulk_destroy(self, request):
+        self.check_bulk_size(request.data)
+        ids = self.get_bulk_ids(request.data)
+        self.get_bulk_objects(ids, Book.objects.only('id', 'owner_id'))
+        with transaction.atomic():
+            Book.objects.filter(pk__in=ids).delete()
+        invalidate_books(ids)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def check_bulk_size(self, data):
+        if not isinstance(data, list) or not data:
+            raise ValidationError('Expected a non-empty list.')
+        if len(data) > settings.BOOKS_BULK_MAX_ITEMS:
+            raise ValidationError(f'Ensure there are no more than {settings.BOOKS_BULK_MAX_ITEMS} items.')
+
+    def get_bulk_ids(self, ids):
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise ValidationError({'id': ['Every item must have an integer id.']})
+        if len(set(ids)) != len(ids):
+            raise ValidationError({'id': ['Duplicate ids.']})
+        return ids
+
+    # Книги одним запросом, права проверяются в памяти для каждой.
+    def get_bulk_objects(self, ids, queryset):
+        books = queryset.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in books]
+        if missing:
+            raise NotFound(f'Books not found: {missing}')
+        for book in books.values():
+            self.check_object_permissions(self.request, book)
+        return books
+
+    # Потоковая выгрузка каталога: /book/export/?export_format=ndjson|csv с теми же фильтрами,
+    # поиском и сортировкой, что и список. Пагинация не применяется, память не растет с размером таблицы.
+    # Параметр не format, потому что ?format= DRF использует для выбора renderer.
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': [f'Expected one of: {", ".join(EXPORT_FORMATS)}.']})
+        content_type, filename = EXPORT_FORMATS[export_format]
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(iter_export(queryset, export_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    # Фасеты: /book/facets/ с фильтрами и поиском списка - количество книг по диапазонам цен и первые авторы,
+    # все одним запросом (store/facets.py). Анонимным пользователям - из кеша ответов, как список.
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def facets(self, request):
+        if request.user.is_authenticated:
+            return self.facets_response(request)
+        return self.cached_response(facets_cache_key(request), LIST_GENERATION_KEYS, self.facets_response, request)
+
+    def facets_response(self, request):
+        return Response(get_facets(self.filter_queryset(self.get_queryset())))
+
+    # Статистика попаданий в кеш ответов, только для персонала.
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(get_cache_stats())
+
+    # Лидерборды: /book/leaderboards/top-rated/, most-liked/, trending/. Ответ из таблицы первых книг, которую
+    # поддерживает запись отношений (store/leaderboards.py), ?limit= - первые N мест, не больше LEADERBOARD_SIZE.
+    @action(detail=False, methods=['get'], url_path=r'leaderboards/(?P<board>[\w-]+)',
+            pagination_class=None, filter_backends=[])
+    def leaderboard(self, request, board=None):
+        if board not in LEADERBOARDS:
+            raise NotFound(f'Unknown leaderboard. Expected one of: {", ".join(LEADERBOARDS)}.')
+        limit = self.get_limit(request, settings.LEADERBOARD_SIZE)
+        return Response({'board': board, **get_leaderboard(board, limit)})
+
+    # Похожие книги: /book/{id}/similar/?limit=N - соседи, сохраненные build_recommendations
+    # (store/recommendations.py), не больше RECOMMENDATIONS_TOP_K. Одна выборка K строк по индексу.
+    @action(detail=True, methods=['get'], pagination_class=None, filter_backends=[])
+    def similar(self, request, pk=None):
+        book_id = self.get_book_id(pk)
+        results = get_similar_books(book_id, self.get_limit(request, settings.RECOMMENDATIONS_TOP_K))
+        if not results and not Book.objects.filter(pk=book_id).exists():
+            raise NotFound()
+        return Response({'book': book_id, 'results': results})
+
+    # id книги из url для действий, которые не загружают книгу через get_object: не число - 404.
+    def get_book_id(self, pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise NotFound()
+
+    # ?limit= для лидербордов и похожих книг: от 1, по умолчанию и не больше maximum.
+    def get_limit(self, request, maximum):
+        limit = request.query_params.get('limit')
+        try:
+            limit = int(limit) if limit is not None else maximum
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        if limit < 1:
+            raise ValidationError({'limit': ['Ensure this value is greater than or equal to 1.']})
+        return min(limit, maximum)
+
+    # Полный список читателей книги постранично: /book/{id}/readers/?cursor=...
+    # Keyset по id отношения, индекс (book_id, id).
+    @action(detail=True, methods=['get'], pagination_class=ReadersPagination, filter_backends=[])
+    def readers(self, request, pk=None):
+        book_id = self.get_book_id(pk)
+        if not Book.objects.filter(pk=book_id).exists():
+            raise NotFound()
+        relations = UserBookRelation.objects.filter(book_id=book_id).select_related('user').only(
+            'id', 'user__first_name', 'user__last_name').order_by('id')
+        page = self.paginate_queryset(relations)
+        serializer = BookReaderSerializer([relation.user for relation in page], many=True)
+        return self.get_paginated_response(serializer.data)
+
 
 # Создаем представление для работы пользователя с лайками и рейтингами.
 class UserBooksRelationView(UpdateModelMixin, GenericViewSet):
@@ -57,6 +234,67 @@ class UserBooksRelationView(UpdateModelMixin, GenericViewSet):
         # 'book' пришел через lookup_field, а до этого пришел в url вместо book id
         return obj
 
+    # PATCH одним запросом к БД (upsert_relation): без отдельных SELECT, INSERT и UPDATE отношения и книги,
+    # без записи, если значения не изменились. Ответ тот же, что у UserBookRelationSerializer.
+    # Книга берется только из url, book в теле запроса не меняет отношение.
+    def partial_update(self, request, *args, **kwargs):
+        serializer = BulkRelationItemSerializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        data = {field: value for field, value in serializer.validated_data.items() if field in RELATION_FIELDS}
+        try:
+            values = upsert_relation(request.user, int(self.kwargs['book']), data)
+        except (Book.DoesNotExist, ValueError):
+            raise NotFound()
+        return Response(values)
+
+    # Массовое изменение отношений: POST /book_relation/bulk/ со списком
+    # [{"book": id, "like": ..., "in_bookmarks": ..., "rate": ...}].
+    # Ответ - результат по каждому элементу: created, updated, unchanged или error.
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        results = apply_relations(request.user, request.data)
+        return Response({'results': results})
+
+    # Библиотека пользователя: GET /book_relation/library/ - книги с лайком, в закладках или с оценкой,
+    # новые отношения первыми, keyset пагинация по id отношения. Фильтры - LibraryFilter.
+    # Книга присоединяется тем же запросом, выбираются только поля LibraryItemSerializer.
+    # Отношения читаются по user_id (индекс (user, book) или частичные индексы лайков и закладок),
+    # поэтому стоимость страницы не зависит от размера каталога.
+    @action(detail=False, methods=['get'], pagination_class=LibraryPagination)
+    def library(self, request):
+        relations = UserBookRelation.objects.filter(
+            Q(like=True) | Q(in_bookmarks=True) | Q(rate__isnull=False), user=request.user)
+        library_filter = LibraryFilter(request.query_params, queryset=relations, request=request)
+        if not library_filter.is_valid():
+            raise ValidationError(library_filter.errors)
+        relations = library_filter.qs.select_related('book').only(
+            'id', 'book_id', 'like', 'in_bookmarks', 'rate',
+            'book__name', 'book__author_name', 'book__price', 'book__rating').order_by('-id')
+        page = self.paginate_queryset(relations)
+        serializer = LibraryItemSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+# Суммы профилирования запросов по endpoint-ам, только для персонала. DELETE - сбросить.
+class ProfilingStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+    def delete(self, request):
+        reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# Метрики соединений с БД процесса: настройки, количество открытых соединений и статистика пула.
+# Только для персонала. Значения по процессу, который обработал запрос.
+class ConnectionStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_connection_stats())
+
 
 def auth(request):
     return render(request, 'oauth.html')